@@ -7,19 +7,48 @@
 Main program
 """
 
-from storeman_classes import GUI
+import argparse
+import gobject
 
-import os
+from storeman_classes import GUI
+from storeman_db import default_database_path
+from storeman_http import APIServer
+from storeman_instrumentation import Instrumentation
+from storeman_stores import StoreError
 
 def main():
-	# Store the database in ~/.pyStoreMan/storeman.db
-	db_file = os.path.join(os.path.expanduser("~"), ".pyStoreMan/storeman.db")
-	dirname = os.path.dirname(db_file)
-	if not os.path.exists(dirname):
-		os.makedirs(dirname)
+	parser = argparse.ArgumentParser(description = "Manage little stores")
+	parser.add_argument('-d', '--database', default = None, help = "Database file (default: ~/.pyStoreMan/storeman.db)")
+	parser.add_argument('-a', '--attach', action = 'append', default = [], metavar = 'DATABASE', help = "Also show the places and items of another store, read-only; can be given more than once")
+	parser.add_argument('--instrument', action = 'store_true', help = "Time callbacks and SQL statements, writing slow ones to ~/.pyStoreMan/slow.log and a summary to ~/.pyStoreMan/instrumentation.json on exit")
+	parser.add_argument('--snapshot', action = 'store_true', help = "Keep a snapshot of the inventory next to the database, for faster starts")
+	parser.add_argument('--backup-dir', default = None, help = "Make backups of the database in this directory while the program runs")
+	parser.add_argument('--backup-interval', type = float, default = None, help = "Minutes between two backups (default: %i)" % GUI.BACKUP_INTERVAL)
+	parser.add_argument('--http-port', type = int, default = None, help = "Also answer questions about the places and items with JSON on this port of 127.0.0.1, read-only")
+	args = parser.parse_args()
+	
+	db_file = args.database or default_database_path()
+	
+	# The database is written from a background thread
+	gobject.threads_init()
+	
+	try:
+		gui = GUI(database = db_file, instrumentation = Instrumentation.from_environment(args.instrument), progressive = True, snapshot = args.snapshot,
+			backup_dir = args.backup_dir, backup_interval = args.backup_interval, stores = args.attach)
+	except StoreError as error:
+		parser.error(str(error))
+	
+	# The GUI has migrated the database, so the server can read it now
+	server = None
+	if args.http_port is not None:
+		server = APIServer(db_file, port = args.http_port)
+		server.start()
 	
-	gui = GUI(database = db_file)
-	gui.run()
+	try:
+		gui.run()
+	finally:
+		if server is not None:
+			server.stop()
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Backups of the live database, copied a few rows at a time so they never stall the program
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from storeman_db import get_schema_version, get_last_change, get_changes, open_database, rebuild_place_totals, rebuild_place_tree
+
+# Tables covered by the change log, in the order their changes are restored
+LOGGED_TABLES = ('places', 'items')
+
+# Tables whose rows are never changed or removed; incremental backups copy the rows added since the previous generation
+APPEND_ONLY_TABLES = ('movements', 'checkpoints', 'checkpoint_amounts')
+
+# Tables that aren't copied at all
+SKIPPED_TABLES = ('change_log', )
+
+# Most SQLite builds allow 999 parameters per statement
+MAX_PARAMETERS = 500
+
+class BackupCancelled(Exception):
+	"""
+	Raised inside a backup that has been cancelled
+	"""
+
+def read_backup_info(filename):
+	# Get the kind, change log position, schema version and base generation of a backup file
+	db = sqlite3.connect(filename)
+	try:
+		return dict(db.execute("SELECT key, value FROM `backup_info`").fetchall())
+	finally:
+		db.close()
+
+def backup_chain(filename):
+	# Get the backup files needed to restore a generation: the full one it's based on first, the generation itself last
+	chain = [filename]
+	info = read_backup_info(filename)
+	while info['kind'] != 'full':
+		base = os.path.join(os.path.dirname(filename), info['base'])
+		if not os.path.exists(base):
+			raise RuntimeError("Backup %s is based on %s, which doesn't exist anymore" % (chain[0], base))
+		chain.insert(0, base)
+		info = read_backup_info(base)
+	
+	return chain
+
+def _table_columns(cur, table, schema = "main"):
+	return [str(row[1]) for row in cur.execute("PRAGMA `%s`.table_info(`%s`)" % (schema, table)).fetchall()]
+
+def _restore_changes(cur, columns, tables):
+	# Apply the changed, added and removed rows of an attached incremental backup
+	for table in APPEND_ONLY_TABLES:
+		if table in tables:
+			cur.execute("INSERT INTO `main`.`%s` SELECT * FROM `backup`.`%s`" % (table, table))
+	
+	for table in LOGGED_TABLES:
+		rows = cur.execute("SELECT %s FROM `backup`.`%s`" % (", ".join("`%s`" % column for column in columns[table]), table)).fetchall()
+		others = [column for column in columns[table] if column != 'id']
+		cur.executemany("UPDATE `main`.`%s` SET %s WHERE `id` = ?" % (table, ", ".join("`%s` = ?" % column for column in others)),
+			[[row[column] for column in others] + [row['id']] for row in rows])
+		cur.executemany("INSERT OR IGNORE INTO `main`.`%s` (%s) VALUES (%s)" % (table, ", ".join("`%s`" % column for column in columns[table]), ", ".join("?" * len(columns[table]))),
+			[[row[column] for column in columns[table]] for row in rows])
+	
+	for table in reversed(LOGGED_TABLES):
+		cur.execute("DELETE FROM `main`.`%s` WHERE `id` IN (SELECT row_id FROM `backup`.`backup_deleted` WHERE table_name = ?)" % table, (table, ))
+
+def restore_backup(filename, target):
+	# Rebuild a database from a backup generation (and the ones it's based on) in a new file
+	if os.path.exists(target):
+		raise RuntimeError("%s already exists, backups can only be restored into a new file" % target)
+	
+	chain = backup_chain(filename)
+	infos = [read_backup_info(generation) for generation in chain]
+	db = sqlite3.connect(target)
+	db.row_factory = sqlite3.Row
+	
+	# Statements are run in explicit transactions, ATTACH can't be used inside of one
+	db.isolation_level = None
+	try:
+		cur = db.cursor()
+		cur.execute("ATTACH DATABASE ? AS `backup`", (chain[0], ))
+		schema = cur.execute("SELECT type, name, sql FROM `backup`.`backup_schema`").fetchall()
+		tables = set(row[0] for row in cur.execute("SELECT name FROM `backup`.sqlite_master WHERE type = 'table'").fetchall())
+		
+		# Copy the tables of the full backup and apply the incremental ones, all before there are any triggers:
+		# the rows have been written by the triggers before, they mustn't be written again (like the movements of new items)
+		cur.execute("BEGIN")
+		for type, name, sql in schema:
+			if type == 'table':
+				cur.execute(sql)
+				if name in tables:
+					cur.execute("INSERT INTO `main`.`%s` SELECT * FROM `backup`.`%s`" % (name, name))
+		cur.execute("PRAGMA user_version = %i" % infos[0]['schema_version'])
+		cur.execute("COMMIT")
+		cur.execute("DETACH DATABASE `backup`")
+		
+		columns = dict((table, _table_columns(cur, table)) for table in LOGGED_TABLES)
+		for generation in chain[1:]:
+			cur.execute("ATTACH DATABASE ? AS `backup`", (generation, ))
+			delta_tables = set(row[0] for row in cur.execute("SELECT name FROM `backup`.sqlite_master WHERE type = 'table'").fetchall())
+			cur.execute("BEGIN")
+			try:
+				_restore_changes(cur, columns, delta_tables)
+				cur.execute("COMMIT")
+			except:
+				cur.execute("ROLLBACK")
+				raise
+			cur.execute("DETACH DATABASE `backup`")
+		
+		# The totals and the place tree are all the triggers would have changed on top
+		cur.execute("BEGIN")
+		for type, name, sql in schema:
+			if type != 'table':
+				cur.execute(sql)
+		if len(chain) > 1 and 'place_totals' in tables:
+			rebuild_place_totals(cur)
+		if len(chain) > 1 and 'place_tree' in tables:
+			rebuild_place_tree(cur)
+		cur.execute("COMMIT")
+		
+		# Continue the change log where the backup left off, so later incremental backups don't miss anything
+		if infos[-1]['seq']:
+			cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (infos[-1]['seq'], ))
+		cur.close()
+	except:
+		db.close()
+		os.remove(target)
+		raise
+	
+	db.close()
+	
+	# Bring the restored database up to the current schema
+	open_database(target).close()
+
+class BackupManager(object):
+	"""
+	Makes backups of a database into a directory of rotated generations
+	
+	A backup reads the database in a single read transaction, so it sees one consistent state without keeping
+	anyone from writing. It copies step_rows rows at a time and sleeps for step_delay seconds in between, which
+	leaves the GUI thread room to run. A full generation copies every table; an incremental one only the places
+	and items changed since the previous generation, which are looked up in the change log, and the rows added to
+	the append-only tables since then. Every full_every-th
+	generation is a full one, and so is the next one after the schema has changed or the log has been pruned.
+	"""
+	
+	def __init__(self, database, directory, generations = 10, incremental = True, full_every = 10, step_rows = 1000, step_delay = 0.005, on_done = None, on_error = None):
+		self.database = database
+		self.directory = directory
+		self.generations = generations # Number of generations to keep at least
+		self.incremental = incremental
+		self.full_every = full_every
+		self.step_rows = step_rows
+		self.step_delay = step_delay
+		self.on_done = on_done # Called with the file name of every new generation, in the backup thread
+		self.on_error = on_error # Called with the error of a failed backup, in the backup thread
+		self.thread = None
+		self.cancelled = threading.Event()
+	
+	def list_generations(self):
+		# Get the file names of all generations, oldest first
+		if not os.path.isdir(self.directory):
+			return []
+		
+		names = sorted(name for name in os.listdir(self.directory) if name.startswith("storeman-") and name.endswith(".db"))
+		return [os.path.join(self.directory, name) for name in names]
+	
+	def is_running(self):
+		return self.thread is not None and self.thread.is_alive()
+	
+	def start(self):
+		# Start a backup in a thread of its own, unless one is running already
+		if self.is_running():
+			return False
+		
+		self.cancelled.clear()
+		self.thread = threading.Thread(target = self._run, name = "storeman-backup")
+		self.thread.daemon = True
+		self.thread.start()
+		return True
+	
+	def cancel(self):
+		# Stop a running backup and wait for its thread; the unfinished generation is thrown away
+		if self.is_running():
+			self.cancelled.set()
+			self.thread.join()
+	
+	def _run(self):
+		try:
+			filename = self.backup()
+		except BackupCancelled:
+			return
+		except (sqlite3.Error, EnvironmentError, RuntimeError) as error:
+			if self.on_error is not None:
+				self.on_error(error)
+			return
+		
+		if self.on_done is not None:
+			self.on_done(filename)
+	
+	def _step(self):
+		# Give the other threads some time between two steps
+		if self.cancelled.is_set():
+			raise BackupCancelled()
+		
+		time.sleep(self.step_delay)
+	
+	def backup(self, full = False):
+		# Make a new generation in the calling thread, returning its file name
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		
+		generations = self.list_generations()
+		previous = read_backup_info(generations[-1]) if generations else None
+		
+		source = sqlite3.connect(self.database)
+		source.row_factory = None
+		
+		# One read transaction for the whole backup; it only takes its snapshot of the database with the first read
+		source.isolation_level = None
+		source.execute("BEGIN")
+		try:
+			version = get_schema_version(source)
+			changes = None
+			if not full and self._can_be_incremental(source, previous, version):
+				changes = get_changes(source, previous['seq'])
+			
+			if changes is None:
+				info = {'kind': 'full', 'seq': self._last_change(source), 'chain_length': 1}
+			else:
+				changes, seq = changes
+				info = {'kind': 'delta', 'seq': seq, 'chain_length': previous['chain_length'] + 1, 'base': os.path.basename(generations[-1])}
+			info['schema_version'] = version
+			info['created'] = time.strftime("%Y-%m-%d %H:%M:%S")
+			
+			# The last rowid of every append-only table, so the next incremental generation knows where to go on from
+			after = {}
+			for table in self._append_only_tables(source):
+				after[table] = previous.get('rows_' + table, 0) if changes is not None else 0
+				info['rows_' + table] = source.execute("SELECT IFNULL(MAX(rowid), 0) FROM `%s`" % table).fetchone()[0]
+			
+			filename = os.path.join(self.directory, "storeman-%s-%s.db" % (datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f"), info['kind']))
+			temp_filename = filename + ".tmp"
+			if os.path.exists(temp_filename):
+				os.remove(temp_filename)
+			
+			target = sqlite3.connect(temp_filename)
+			try:
+				self._write(source, target, info, changes, after)
+			except:
+				target.close()
+				os.remove(temp_filename)
+				raise
+			target.close()
+		finally:
+			source.execute("ROLLBACK")
+			source.close()
+		
+		# Only complete generations get their final name
+		os.rename(temp_filename, filename)
+		self._rotate()
+		return filename
+	
+	def _append_only_tables(self, source):
+		rows = source.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+		return [table for table in APPEND_ONLY_TABLES if (table, ) in rows]
+	
+	def _last_change(self, source):
+		if not source.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'").fetchone():
+			return 0
+		
+		return get_last_change(source)
+	
+	def _can_be_incremental(self, source, previous, version):
+		# Check whether the changes since the previous generation can be told from the change log
+		if not self.incremental or previous is None or previous['schema_version'] != version:
+			return False
+		
+		if previous['chain_length'] >= self.full_every:
+			return False
+		
+		# A smaller position in the log means the database has been replaced since
+		return previous['seq'] <= self._last_change(source)
+	
+	def _write(self, source, target, info, changes, after):
+		# Fill a new backup file; after maps the append-only tables to the last rowid the previous generation has
+		target.execute("PRAGMA journal_mode = OFF")
+		target.execute("PRAGMA synchronous = OFF")
+		target.execute("CREATE TABLE `backup_info` (`key` TEXT PRIMARY KEY, `value`)")
+		target.executemany("INSERT INTO `backup_info` (key, value) VALUES (?, ?)", info.items())
+		
+		# The schema is kept with every backup, so it can be restored without knowing the version it was made with
+		target.execute("CREATE TABLE `backup_schema` (`type` TEXT, `name` TEXT, `sql` TEXT)")
+		schema = source.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%' ORDER BY rowid").fetchall()
+		target.executemany("INSERT INTO `backup_schema` (type, name, sql) VALUES (?, ?, ?)", schema)
+		
+		tables = [(name, sql) for type, name, sql in schema if type == 'table' and name not in SKIPPED_TABLES]
+		if changes is None:
+			for name, sql in tables:
+				target.execute(sql)
+				self._copy_table(source, target, name)
+		else:
+			target.execute("CREATE TABLE `backup_deleted` (`table_name` TEXT, `row_id` INTEGER)")
+			for name, sql in tables:
+				if name in LOGGED_TABLES:
+					target.execute(sql)
+					self._copy_rows(source, target, name, [id for table, id in changes if table == name])
+				elif name in after:
+					target.execute(sql)
+					self._copy_table(source, target, name, after[name], info['rows_' + name])
+		
+		target.commit()
+	
+	def _copy_table(self, source, target, table, after = None, last = None):
+		# Copy the rows of a table in order of their rowid, all of them or only the ones after one rowid up to another
+		names = _table_columns(source, table)
+		columns = ", ".join("`%s`" % column for column in names)
+		insert = "INSERT INTO `%s` (%s) VALUES (%s)" % (table, columns, ", ".join("?" * len(names)))
+		query = "SELECT rowid, %s FROM `%s` WHERE rowid > ?%s ORDER BY rowid LIMIT ?" % (columns, table, " AND rowid <= ?" if last is not None else "")
+		bounds = (last, self.step_rows) if last is not None else (self.step_rows, )
+		if after is None:
+			rows = source.execute("SELECT rowid, %s FROM `%s` ORDER BY rowid LIMIT ?" % (columns, table), (self.step_rows, )).fetchall()
+		else:
+			rows = source.execute(query, (after, ) + bounds).fetchall()
+		
+		while rows:
+			target.executemany(insert, [row[1:] for row in rows])
+			self._step()
+			rows = source.execute(query, (rows[-1][0], ) + bounds).fetchall()
+	
+	def _copy_rows(self, source, target, table, ids):
+		# Copy the rows of a table with the given IDs, noting the ones that don't exist anymore as removed
+		columns = _table_columns(source, table)
+		insert = "INSERT INTO `%s` (%s) VALUES (%s)" % (table, ", ".join("`%s`" % column for column in columns), ", ".join("?" * len(columns)))
+		id_index = columns.index('id')
+		step = min(self.step_rows, MAX_PARAMETERS)
+		for start in xrange(0, len(ids), step):
+			chunk = ids[start:start + step]
+			rows = source.execute("SELECT %s FROM `%s` WHERE `id` IN (%s)" % (", ".join("`%s`" % column for column in columns), table, ", ".join("?" * len(chunk))), chunk).fetchall()
+			target.executemany(insert, rows)
+			found = set(row[id_index] for row in rows)
+			target.executemany("INSERT INTO `backup_deleted` (table_name, row_id) VALUES (?, ?)", [(table, id) for id in chunk if id not in found])
+			self._step()
+	
+	def _rotate(self):
+		# Remove the oldest generations as long as enough remain; a full one is only removed together with the incremental ones based on it
+		generations = self.list_generations()
+		chains = []
+		for filename in generations:
+			if read_backup_info(filename)['kind'] == 'full' or not chains:
+				chains.append([filename])
+			else:
+				chains[-1].append(filename)
+		
+		count = len(generations)
+		while len(chains) > 1 and count - len(chains[0]) >= self.generations:
+			for filename in chains.pop(0):
+				os.remove(filename)
+				count -= 1
\ No newline at end of file
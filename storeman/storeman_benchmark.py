@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Benchmarks of the GUI operations on generated inventories
+
+Runs headless: if gtk can't be imported (or --stub-gtk is given), the stand-ins in stubs/ are used instead.
+Results are written as JSON, so runs of different versions can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Words the generated names and details are made of
+WORDS = (
+	"resistor", "capacitor", "diode", "transistor", "led", "relay", "fuse", "switch", "button", "cable",
+	"connector", "header", "socket", "crystal", "inductor", "sensor", "motor", "servo", "battery", "screw",
+	"nut", "washer", "spacer", "heatsink", "display", "module", "board", "regulator", "amplifier", "buzzer",
+)
+VALUES = ("10", "22", "47", "100", "220", "470", "1k", "4k7", "10k", "100k", "1M", "5V", "12V", "3V3")
+PLACE_TYPES = ("Box", "Drawer", "Shelf", "Bag", "Tray")
+
+PLACES_INSERT = "INSERT INTO `places` (id, name, location, type, name_key, name_folded, location_folded, type_folded) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+ITEMS_INSERT = "INSERT INTO `items` (id, name, place_id, details, amount, name_key, details_key, name_folded, details_folded) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+def use_stubs(force = False):
+	# Make the stand-in gtk and gobject modules importable if the real ones are missing; returns whether they're used
+	if not force:
+		try:
+			import gtk
+			return False
+		except (ImportError, RuntimeError):
+			pass
+	
+	sys.path.insert(0, STUBS_DIR)
+	return True
+
+def generate_database(filename, items, places, seed = 0, batch_size = 10000):
+	# Create a database with the given numbers of items and places; the same arguments always give the same database
+	from storeman_collation import fold, sort_key
+	from storeman_db import open_database
+	
+	rng = random.Random(seed)
+	db = open_database(filename)
+	cur = db.cursor()
+	
+	place_rows = [(id, "%s %i" % (rng.choice(PLACE_TYPES), id), "Room %i" % rng.randint(1, 5), rng.choice(PLACE_TYPES)) for id in xrange(1, places + 1)]
+	cur.executemany(PLACES_INSERT, (row + (sort_key(row[1]), fold(row[1]), fold(row[2]), fold(row[3])) for row in place_rows))
+	
+	batch = []
+	for id in xrange(places + 1, places + items + 1):
+		# About one item in ten has no place
+		place_id = rng.randint(1, places) if places and rng.random() >= 0.1 else None
+		name = "%s %s" % (rng.choice(VALUES), rng.choice(WORDS))
+		details = " ".join(rng.choice(WORDS) for i in xrange(rng.randint(0, 4)))
+		batch.append((id, name, place_id, details, rng.randint(0, 500), sort_key(name), sort_key(details), fold(name), fold(details)))
+		if len(batch) >= batch_size:
+			cur.executemany(ITEMS_INSERT, batch)
+			batch = []
+	
+	if batch:
+		cur.executemany(ITEMS_INSERT, batch)
+	
+	db.commit()
+	
+	# Fold the WAL into the database file, so a plain copy of the file is a complete database
+	cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+	cur.close()
+	db.close()
+
+def get_database(cache_dir, items, places, seed):
+	# Get the file name of a generated database, generating it if it doesn't exist yet; a new schema version generates it anew
+	from storeman_db import MIGRATIONS
+	
+	filename = os.path.join(cache_dir, "inventory-v%i-%i-%i-%i.db" % (len(MIGRATIONS), items, places, seed))
+	if not os.path.exists(filename):
+		generate_database(filename + ".tmp", items, places, seed)
+		os.rename(filename + ".tmp", filename)
+	
+	return filename
+
+class Benchmark(object):
+	"""
+	Timed scenarios on one GUI instance, each one running a number of operations
+	"""
+	
+	def __init__(self, gui, operations, seed = 0):
+		self.gui = gui
+		self.operations = operations
+		self.rng = random.Random(seed)
+	
+	def _count(self, view):
+		model = view.get_model()
+		return len(model) if model is not None else 0
+	
+	def _drain(self):
+		# Run the idle callbacks the operations have scheduled (but not the delayed commit)
+		import gobject
+		while gobject.pending() and gobject.iteration(False):
+			pass
+	
+	def scenario_load_data(self):
+		self.gui.load_data()
+		return 1
+	
+	def scenario_select_place(self):
+		selection = self.gui.treeview_overview_places_selection
+		count = self._count(self.gui.treeview_overview_places)
+		for i in xrange(self.operations):
+			selection.select_path((self.rng.randrange(count), ))
+			self._drain()
+		selection.unselect_all()
+		return self.operations
+	
+	def _search(self, term):
+		# Search right away instead of waiting for the delayed search
+		import gobject
+		self.gui.entry_search_term.set_text(term)
+		if self.gui.search_timeout is not None:
+			gobject.source_remove(self.gui.search_timeout)
+		self.gui._run_search()
+	
+	def scenario_search(self):
+		for i in xrange(self.operations):
+			self._search("%s %s" % (self.rng.choice(VALUES), self.rng.choice(WORDS)[:self.rng.randint(2, 6)]))
+		self._search("")
+		return self.operations + 1
+	
+	def scenario_query(self):
+		# Structured queries, which are answered by the database
+		places = self._count(self.gui.treeview_overview_places)
+		for i in xrange(self.operations):
+			self._search(self.rng.choice((
+				"amount<%i" % self.rng.randint(1, 50),
+				"place:\"%s %i\" amount>%i" % (self.rng.choice(PLACE_TYPES), self.rng.randint(1, max(places, 1)), self.rng.randint(0, 500)),
+				"details:%s -name:%s" % (self.rng.choice(WORDS), self.rng.choice(VALUES)),
+				"name=\"%s %s\" OR amount=%i" % (self.rng.choice(VALUES), self.rng.choice(WORDS), self.rng.randint(0, 500)),
+			)))
+		self._search("")
+		return self.operations + 1
+	
+	def scenario_cell_edit(self):
+		gui = self.gui
+		view = gui.treeview_search_items
+		count = self._count(view)
+		for i in xrange(self.operations):
+			path = (self.rng.randrange(count), )
+			if i % 2:
+				gui.callback_treeview_cell_edited(None, path, str(self.rng.randint(0, 500)), (view, gui.liststore_items, gui.COL_NAMES_ITEM["AMOUNT"]))
+			else:
+				gui.callback_treeview_cell_edited(None, path, "%s %s" % (self.rng.choice(VALUES), self.rng.choice(WORDS)), (view, gui.liststore_items, gui.COL_NAMES_ITEM["NAME"]))
+		return self.operations
+	
+	def scenario_commit(self):
+		self.gui.commit_changes()
+		return 1
+	
+	def scenario_place_rename(self):
+		gui = self.gui
+		view = gui.treeview_overview_places
+		count = self._count(view)
+		for i in xrange(self.operations):
+			gui.callback_treeview_cell_edited(None, (self.rng.randrange(count), ), "Renamed %i" % i, (view, gui.treestore_places, gui.COL_NAMES_PLACE["NAME"]))
+			self._drain()
+		gui.commit_changes()
+		return self.operations
+	
+	def scenario_delete_item(self):
+		gui = self.gui
+		for i in xrange(self.operations):
+			gui.treeview_search_items_selection.unselect_all()
+			gui.treeview_search_items_selection.select_path((self.rng.randrange(self._count(gui.treeview_search_items)), ))
+			gui.callback_button_clicked(gui.button_search_remove_item)
+			self._drain()
+		gui.commit_changes()
+		return self.operations
+	
+	def scenario_delete_place(self):
+		gui = self.gui
+		operations = min(self.operations, self._count(gui.treeview_overview_places))
+		
+		# Answer the question what to do with the items the way the dialog does by default
+		gui._ask_place_removal = lambda count: (None, False)
+		for i in xrange(operations):
+			gui.treeview_overview_places_selection.unselect_all()
+			gui.treeview_overview_places_selection.select_path((self.rng.randrange(self._count(gui.treeview_overview_places)), ))
+			gui.callback_button_clicked(gui.button_overview_remove_place)
+			self._drain()
+		gui.commit_changes()
+		return operations
+	
+	# Scenarios in the order they are run; later ones change the inventory
+	SCENARIOS = ('load_data', 'select_place', 'search', 'query', 'cell_edit', 'commit', 'place_rename', 'delete_item', 'delete_place')
+	
+	def run(self, scenarios = SCENARIOS):
+		# Run the scenarios, returning name -> (total seconds, number of operations)
+		results = {}
+		for name in scenarios:
+			method = getattr(self, "scenario_%s" % name)
+			start = time.time()
+			operations = method()
+			results[name] = (time.time() - start, operations)
+		return results
+
+def run_size(source, items, places, args, instrumentation = None):
+	# Run all scenarios on copies of a generated database, keeping the best time of every scenario
+	from storeman_classes import GUI
+	
+	best = {}
+	workdir = tempfile.mkdtemp(prefix = "storeman-benchmark-")
+	try:
+		for repeat in xrange(args.repeat):
+			filename = os.path.join(workdir, "inventory.db")
+			shutil.copy(source, filename)
+			
+			start = time.time()
+			gui = GUI(database = filename, lazy_threshold = args.lazy_threshold, instrumentation = instrumentation)
+			timings = {'startup': (time.time() - start, 1)}
+			
+			timings.update(Benchmark(gui, args.operations, args.seed).run(args.scenarios))
+			gui.close()
+			
+			for name, timing in timings.iteritems():
+				if name not in best or timing[0] < best[name][0]:
+					best[name] = timing
+			
+			for suffix in ("", "-wal", "-shm"):
+				if os.path.exists(filename + suffix):
+					os.remove(filename + suffix)
+	finally:
+		shutil.rmtree(workdir, ignore_errors = True)
+	
+	results = []
+	for name in ('startup', ) + tuple(args.scenarios):
+		total, operations = best[name]
+		results.append({
+			'items': items,
+			'places': places,
+			'lazy': items > (args.lazy_threshold if args.lazy_threshold is not None else GUI.LAZY_THRESHOLD),
+			'scenario': name,
+			'operations': operations,
+			'total_ms': round(total * 1000, 3),
+			'per_operation_ms': round(total * 1000 / max(operations, 1), 3),
+		})
+	return results
+
+def _parse_sizes(value):
+	return [int(size.replace("k", "000").replace("M", "000000")) for size in value.split(",")]
+
+def build_parser():
+	parser = argparse.ArgumentParser(description = "Benchmark pyStoreMan on generated inventories")
+	parser.add_argument('-s', '--sizes', type = _parse_sizes, default = list(DEFAULT_SIZES), help = "Comma separated numbers of items, e.g. 1k,10k,100k,1M (default: 1k,10k,100k)")
+	parser.add_argument('-p', '--places', type = int, default = 100, help = "Number of places (default: 100)")
+	parser.add_argument('-n', '--operations', type = int, default = 50, help = "Operations per scenario (default: 50)")
+	parser.add_argument('-r', '--repeat', type = int, default = 3, help = "Runs per size, the best time is reported (default: 3)")
+	parser.add_argument('--seed', type = int, default = 0, help = "Seed of the generator and the operations (default: 0)")
+	parser.add_argument('--scenarios', type = lambda value: value.split(","), default = list(Benchmark.SCENARIOS), help = "Comma separated scenarios (default: %s)" % ",".join(Benchmark.SCENARIOS))
+	parser.add_argument('--lazy-threshold', type = int, default = None, help = "Item count above which the item lists are read on demand (default: the GUI's)")
+	parser.add_argument('--cache-dir', default = os.path.join(tempfile.gettempdir(), "storeman-benchmark"), help = "Directory for the generated databases, which are reused")
+	parser.add_argument('--stub-gtk', action = 'store_true', help = "Use the stand-in gtk module even if the real one is available")
+	parser.add_argument('--instrument', action = 'store_true', help = "Include callback and SQL timings in the output")
+	parser.add_argument('--label', default = None, help = "Name of this run, e.g. a version, included in the output")
+	parser.add_argument('-o', '--output', default = "-", help = "File to write the JSON results to, - for stdout (default)")
+	return parser
+
+def main(argv = None):
+	args = build_parser().parse_args(argv)
+	stubbed = use_stubs(args.stub_gtk)
+	
+	from storeman_db import SCHEMA_VERSION
+	from storeman_instrumentation import Instrumentation
+	
+	if not os.path.exists(args.cache_dir):
+		os.makedirs(args.cache_dir)
+	
+	instrumentation = Instrumentation(slow_ms = float("inf")) if args.instrument else None
+	
+	results = []
+	for items in args.sizes:
+		sys.stderr.write("Benchmarking %i items in %i places\n" % (items, args.places))
+		source = get_database(args.cache_dir, items, args.places, args.seed)
+		results.extend(run_size(source, items, args.places, args, instrumentation))
+	
+	output = {
+		'label': args.label,
+		'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'stub_gtk': stubbed,
+		'schema_version': SCHEMA_VERSION,
+		'operations': args.operations,
+		'repeat': args.repeat,
+		'seed': args.seed,
+		'results': results,
+	}
+	if instrumentation is not None:
+		output['instrumentation'] = instrumentation.summary()
+	
+	data = json.dumps(output, indent = 4, sort_keys = True)
+	if args.output == "-":
+		sys.stdout.write(data + "\n")
+	else:
+		with open(args.output, 'w') as f:
+			f.write(data)
+
+if __name__ == "__main__":
+	main()
\ No newline at end of file
@@ -6,114 +6,72 @@
 Class definitions
 """
 
+import collections
 import gobject
+import itertools
 import gtk
-import hashlib
-import random
 import sqlite3
-import time
 
-def _generate_id():
-	# Generate a unique identifier
-	return hashlib.sha1(str(time.time() + random.getrandbits(16))).hexdigest()
+from storeman_backup import BackupManager
+from storeman_collation import compare_keys, fold, sort_key
+from storeman_db import SCHEMA_VERSION, open_database, get_change_counter, get_data_version, get_last_change, get_changes, prune_change_log, quote_name, BackgroundWriter
+from storeman_models import StoragePlace, Item, DUMMY_PLACE, place_id_to_db, to_unicode
+from storeman_instrumentation import TracingConnection
+from storeman_ledger import new_movement, parse_amount_change, bulk_movements, maybe_checkpoint
+from storeman_query import compile_query, QuerySyntaxError
+from storeman_search import SearchIndex
+from storeman_snapshot import snapshot_path, read_snapshot, write_snapshot
+from storeman_stores import STORE_SUBTREE_TOTALS, store_name, attach_stores, create_store_views
+from storeman_treemodel import SQLiteItemModel
 
-class StoragePlace(object):
+class GUI(object):
 	"""
-	A class representing a place where you can store stuff (e.g. a box, a shelf etc.)
+	A class representing the graphical user interface
 	"""
 	
-	def __init__(self, id, name, location, type):
-		self.id = id if id is not None else _generate_id()
-		self.name = name
-		self.location = location
-		self.type = type
+	FILTER_OVERVIEW_ITEMS_PLACE_ID = None
 	
-	def __str__(self):
-		return "%s: %s @ %s (%s)" % (self.id, self.name, self.location, self.type)
+	# Number of rows fetched from the database at once while loading
+	LOAD_CHUNK_SIZE = 1000
 	
-	def save_to_db(self, db_cursor):
-		# Save the object to a database
-		return db_cursor.execute("INSERT INTO `places` (id, name, location, type) VALUES(?, ?, ?, ?)", (self.id, self.name.decode('utf-8'), self.location.decode('utf-8'), self.type.decode('utf-8')))
+	# Milliseconds to wait after the last keystroke before searching
+	SEARCH_DELAY = 200
 	
-	@classmethod
-	def from_db_entry(cls, entry):
-		# Create an object from a database entry
-		return cls(**entry)
+	# Changes are written to the database (in the background) once this many have been made or when nothing has changed for this many milliseconds
+	COMMIT_MAX_CHANGES = 100
+	COMMIT_DELAY = 2000
 	
-	def add_item(self, item):
-		# Add a single item to the storage place
-		item.set_place(self)
+	# With more items than this, the item lists read their rows from the database on demand instead of keeping them all in a ListStore
+	LAZY_THRESHOLD = 100000
 	
-	def add_items(self, items):
-		# Add multiple items to the storage place
-		for item in items:
-			item.set_place(self)
-
-# A dummy place to use if no place has been set on an item
-DUMMY_PLACE = StoragePlace("-1", "DUMMY", "DUMMY", "DUMMY")
-
-class Item(object):
-	"""
-	A class representing an arbitrary item that can be stored in a StoragePlace
-	"""
+	# Number of places whose item lists are kept for the overview
+	OVERVIEW_CACHE_SIZE = 20
 	
-	def __init__(self, id, name, place = DUMMY_PLACE, details = None, amount = 1):
-		self.id = id if id is not None else _generate_id()
-		self.name = name
-		self.details = details
-		self.amount = amount
-		
-		if place is None:
-			place = DUMMY_PLACE
-		
-		self.set_place(place)
-	
-	def __str__(self):
-		return "%s: %s @ %s (%s, %i pcs.)" % (self.id, self.name, self.place.name, self.details, self.amount)
-	
-	def save_to_db(self, db_cursor):
-		# Save the object to a database
-		return db_cursor.execute("INSERT INTO `items` (id, name, place_id, details, amount) VALUES(?, ?, ?, ?, ?)", (self.id, self.name.decode('utf-8'), self.place.id, self.details.decode('utf-8'), self.amount))
-	
-	@classmethod
-	def from_db_entry(cls, entry):
-		# Create an object from a database entry
-		
-		# Lookup the place for the given id
-		if entry['place_id'] == DUMMY_PLACE.id:
-			place = DUMMY_PLACE
-		else:
-			place = StoragePlace(entry['place_id'], "UNKNOWN", "UNKNOWN", "UNKNOWN")
-		
-		return cls(entry['id'], entry['name'], place, entry['details'], entry['amount'])
+	# Changes of at least this many items at once are made with the item lists detached from their views, which catch up once afterwards
+	BATCH_DETACH_SIZE = 500
 	
-	def load_place_data(self, db_cursor):
-		# Load the place data from the database
-		db_cursor.execute("SELECT * FROM `places` WHERE id = ?", (self.place.id, ))
-		entry = db_cursor.fetchone()
-		
-		if entry is None:
-			raise KeyError("No place found with id %s" % self.place.id)
-		
-		self.set_place(StoragePlace.from_db_entry(entry))
-		return True
+	# Milliseconds between two checks for changes other instances have made to the database
+	CHANGE_POLL_INTERVAL = 2000
 	
-	def set_place(self, place):
-		# Put the item into a storage place
-		self.place = place
-
-class GUI(object):
-	"""
-	A class representing the graphical user interface
-	"""
+	# Number of entries kept in the change log when quitting
+	CHANGE_LOG_SIZE = 100000
 	
-	FILTER_OVERVIEW_ITEMS_PLACE_ID = None
+	# Minutes between two backups and number of backups to keep
+	BACKUP_INTERVAL = 60
+	BACKUP_GENERATIONS = 24
 	
 	COL_NAMES_PLACE = {
 		"ID": 0,
 		"NAME": 1,
 		"LOCATION": 2,
-		"TYPE": 3
+		"TYPE": 3,
+		"ITEMS": 4,
+		"AMOUNT": 5,
+		"PARENT_ID": 6,
+		"NAME_KEY": 7,
+		"LOCATION_KEY": 8,
+		"TYPE_KEY": 9,
+		"STORE": 10
 	}
 	
 	COL_NAMES_ITEM = {
@@ -122,16 +80,99 @@ class GUI(object):
 		"PLACE_NAME": 2,
 		"NAME": 3,
 		"DETAILS": 4,
-		"AMOUNT": 5
+		"AMOUNT": 5,
+		"PLACE_NAME_KEY": 6,
+		"NAME_KEY": 7,
+		"DETAILS_KEY": 8,
+		"STORE": 9
 	}
 	
-	def __init__(self, database):
-		self.db = sqlite3.connect(database)
-		self.db.row_factory = sqlite3.Row
+	# Database columns of the editable store columns; amounts are changed through the ledger of stock movements instead
+	DB_COLUMNS_PLACE = {
+		COL_NAMES_PLACE["NAME"]: 'name',
+		COL_NAMES_PLACE["LOCATION"]: 'location',
+		COL_NAMES_PLACE["TYPE"]: 'type'
+	}
+	
+	DB_COLUMNS_ITEM = {
+		COL_NAMES_ITEM["PLACE_ID"]: 'place_id',
+		COL_NAMES_ITEM["NAME"]: 'name',
+		COL_NAMES_ITEM["DETAILS"]: 'details'
+	}
+	
+	# Hidden columns holding the sort keys of the text columns (see storeman_collation), which the views sort by
+	SORT_KEY_COLUMNS_PLACE = {
+		COL_NAMES_PLACE["NAME"]: COL_NAMES_PLACE["NAME_KEY"],
+		COL_NAMES_PLACE["LOCATION"]: COL_NAMES_PLACE["LOCATION_KEY"],
+		COL_NAMES_PLACE["TYPE"]: COL_NAMES_PLACE["TYPE_KEY"]
+	}
+	
+	SORT_KEY_COLUMNS_ITEM = {
+		COL_NAMES_ITEM["PLACE_NAME"]: COL_NAMES_ITEM["PLACE_NAME_KEY"],
+		COL_NAMES_ITEM["NAME"]: COL_NAMES_ITEM["NAME_KEY"],
+		COL_NAMES_ITEM["DETAILS"]: COL_NAMES_ITEM["DETAILS_KEY"]
+	}
+	
+	# Places are dragged as tree rows within the place list only
+	PLACE_DRAG_TARGETS = [('GTK_TREE_MODEL_ROW', gtk.TARGET_SAME_WIDGET, 0)]
+	
+	def __init__(self, database, lazy_threshold = None, instrumentation = None, progressive = False, snapshot = False, backup_dir = None, backup_interval = None, stores = ()):
+		# Optional timing of the callbacks and SQL statements, see storeman_instrumentation
+		self.instrumentation = instrumentation
+		if instrumentation is not None:
+			instrumentation.instrument_gui(self)
+			self.db = open_database(database, factory = TracingConnection)
+			instrumentation.instrument_connection(self.db)
+			writer_args = {'factory': TracingConnection, 'on_open': instrumentation.instrument_connection}
+		else:
+			self.db = open_database(database)
+			writer_args = {}
+		
+		# The databases of other stores are attached to the reading connection and shown next to this one, but only this one can be changed
+		self.store_name = store_name(database)
+		self.stores = [self.store_name] + attach_stores(self.db, self.store_name, stores)
+		create_store_views(self.db, self.store_name, self.stores[1:])
+		
+		# All changes are written by a thread of their own, this connection is only used for reading
 		self.cur = self.db.cursor()
-		self.cur.execute("CREATE TABLE IF NOT EXISTS `places` (id, name, location, type)")
-		self.cur.execute("CREATE TABLE IF NOT EXISTS `items` (id, name, place_id, details, amount)")
-		self.db.commit()
+		self.writer = BackgroundWriter(database, max_changes = self.COMMIT_MAX_CHANGES, delay = self.COMMIT_DELAY / 1000.0, on_error = self._writer_error, **writer_args)
+		self.write_failed = False
+		self.closed = False
+		
+		# With a snapshot, the rows are saved on quit and read back on the next start if the database hasn't changed; changes of the other stores would go unnoticed
+		self.snapshot_file = snapshot_path(database) if snapshot and not stores else None
+		self.loader = None # Generator of the progressive loading in progress
+		
+		self.lazy_threshold = lazy_threshold if lazy_threshold is not None else self.LAZY_THRESHOLD
+		self.lazy_items = False
+		self.lazymodel_overview_items = SQLiteItemModel(self.db)
+		self.lazymodel_search_items = SQLiteItemModel(self.db)
+		
+		self.search_index = SearchIndex()
+		self.search_term = ""
+		self.search_query = compile_query(u"", stores = True) # The compiled search term, None if it's invalid
+		self.search_results = None # ID -> score of the items matching the search term, None if all items are shown
+		self.search_timeout = None
+		
+		self.inventory_totals = [0, 0] # Number of items, total amount
+		self.unassigned_totals = [0, 0] # The same for the items without a place
+		
+		self.overview_views = collections.OrderedDict() # Place ID -> (ListStore, ID -> Iter) of recently viewed places
+		self.overview_refresh = None
+		
+		# Changes made by other instances are picked up from the change log
+		# Attached stores have data versions and change logs of their own, so these are kept per schema
+		self.data_versions = {} # Schema -> data version at the last check
+		self.change_seqs = {} # Schema -> position in its change log the ListStores are up to date with
+		self.deferred_changes = set() # (table, ID) of changed rows that had changes of our own waiting to be written
+		self.change_poll = gobject.timeout_add(self.CHANGE_POLL_INTERVAL, self._poll_changes)
+		
+		# Optional backups in a thread of their own
+		self.backups = None
+		self.backup_timeout = None
+		if backup_dir is not None:
+			self.backups = BackupManager(database, backup_dir, generations = self.BACKUP_GENERATIONS, full_every = self.BACKUP_GENERATIONS, on_error = self._backup_error)
+			self.backup_timeout = gobject.timeout_add(int((backup_interval or self.BACKUP_INTERVAL) * 60000), self._start_backup)
 		
 		self.window = gtk.Window()
 		self.window.connect('destroy', self.quit)
@@ -143,70 +184,1151 @@ class GUI(object):
 		self.window.set_icon(self.icon)
 		self.build_ui()
 		
-		self.load_data()
+		if progressive:
+			self.load_data_progressively()
+		else:
+			self.load_data()
 	
 	def load_data(self):
-		self.cur.execute("SELECT * FROM `places`")
-		place_entries = self.cur.fetchall()
-		for entry in place_entries:
-			self.add_place(StoragePlace.from_db_entry(entry), save_to_db = False)
+		# Fill the ListStores from the snapshot or straight from the database, all at once
+		self.loader = None
+		self.commit_changes()
+		for fraction in self._load_chunks(attach_early = False):
+			pass
+	
+	def load_data_progressively(self):
+		# Fill the ListStores a chunk at a time from the main loop, so the window can be used while loading
+		self.loader = self._load_chunks(attach_early = True)
+		self.progressbar_load.set_fraction(0.0)
+		self.progressbar_load.show()
+		if self.writer.has_pending():
+			# Start once our changes are in the database, without waiting for them here
+			self._after_write(gobject.idle_add, self._load_next_chunk, self.loader)
+		else:
+			gobject.idle_add(self._load_next_chunk, self.loader)
+	
+	def _load_next_chunk(self, loader):
+		if loader is not self.loader:
+			# Loading has been started again in the meantime
+			return False
+		
+		try:
+			self.progressbar_load.set_fraction(next(loader))
+			return True
+		except StopIteration:
+			self.loader = None
+			self.progressbar_load.hide()
+			return False
+	
+	def _read_rows(self, cur):
+		# Get iterators over the place and item rows (in ListStore column order) and the number of items
+		if self.snapshot_file is not None:
+			snapshot = read_snapshot(self.snapshot_file, SCHEMA_VERSION, get_change_counter(self.db))
+			if snapshot is not None:
+				return snapshot
+		
+		place_names = {}
+		
+		def _places():
+			# The totals include the places inside a place; every place comes after the one it's inside of
+			cur.execute("""SELECT p.id, p.name, p.location, p.type, IFNULL(s.item_count, 0), IFNULL(s.total_amount, 0), IFNULL(p.parent_id, ?), p.name_key, p.store
+				FROM `store_places` p LEFT JOIN (%s) s ON s.place_id = p.id
+				ORDER BY (SELECT MAX(depth) FROM `store_place_tree` WHERE descendant_id = p.id)""" % STORE_SUBTREE_TOTALS, (DUMMY_PLACE.id, ))
+			rows = cur.fetchmany(self.LOAD_CHUNK_SIZE)
+			while rows:
+				for row in rows:
+					place_names[row[0]] = (row[1], row[7])
+					# There are few places, so the keys of their locations and types aren't kept in the database
+					yield row[:8] + (sort_key(row[2]), sort_key(row[3]), row[8])
+				rows = cur.fetchmany(self.LOAD_CHUNK_SIZE)
+		
+		def _items():
+			# Only read once all places have been read
+			cur.execute("SELECT id, place_id, name, details, amount, name_key, details_key, store FROM `store_items`")
+			rows = cur.fetchmany(self.LOAD_CHUNK_SIZE)
+			while rows:
+				for id, place_id, name, details, amount, name_key, details_key, store in rows:
+					if place_id is None:
+						place_id = DUMMY_PLACE.id
+					place_name, place_name_key = place_names.get(place_id, ("UNKNOWN", ""))
+					yield (id, place_id, place_name, name, details, amount, place_name_key, name_key, details_key, store)
+				rows = cur.fetchmany(self.LOAD_CHUNK_SIZE)
+		
+		return _places(), _items(), self.inventory_totals[0]
+	
+	def _load_chunks(self, attach_early):
+		# Load everything, yielding the fraction of items loaded after every chunk
+		# Unless attach_early is set, the stores are detached from all views and filters while loading, so appending rows doesn't emit signals into them
+		self._detach_models()
+		self.treestore_places.clear()
+		self.liststore_items.clear()
+		self.iters_places.clear()
+		self.iters_items.clear()
+		self.item_ids_by_place.clear()
+		self.overview_views.clear()
+		self.search_index.clear()
+		
+		# Everything up to here in the change log is included in what's loaded now
+		for schema in self._schemas():
+			self.data_versions[schema] = get_data_version(self.db, schema)
+			self.change_seqs[schema] = get_last_change(self.db, schema)
+		self.deferred_changes.clear()
+		
+		# The totals are maintained by triggers, so the items don't have to be counted
+		self.inventory_totals = list(self.db.execute("SELECT IFNULL(SUM(item_count), 0), IFNULL(SUM(total_amount), 0) FROM `store_place_totals`").fetchone())
+		self.unassigned_totals = list(self.db.execute("SELECT IFNULL(SUM(item_count), 0), IFNULL(SUM(total_amount), 0) FROM `store_place_totals` WHERE place_id = ?", (DUMMY_PLACE.id, )).fetchone())
+		
+		# Plain tuples are enough here, so skip the sqlite3.Row objects
+		cur = self.db.cursor()
+		cur.row_factory = None
+		places, items, item_count = self._read_rows(cur)
+		
+		append = self.treestore_places.append
+		iters_places = self.iters_places
+		for row in places:
+			iters_places[row[0]] = append(iters_places.get(row[self.COL_NAMES_PLACE["PARENT_ID"]]), row)
+		self._update_summary()
+		
+		# Large inventories are read from the database on demand
+		self.lazy_items = item_count > self.lazy_threshold
+		if self.lazy_items or attach_early:
+			self._attach_models()
+		
+		if self.lazy_items:
+			cur.close()
+			return
+		
+		append = self.liststore_items.append
+		item_ids_by_place = self.item_ids_by_place
+		index_item = self.search_index.add
+		loaded = 0
+		while True:
+			rows = list(itertools.islice(items, self.LOAD_CHUNK_SIZE))
+			if not rows:
+				break
+			
+			for row in rows:
+				id, place_id = row[0], row[1]
+				self.iters_items[id] = append(row)
+				if place_id in item_ids_by_place:
+					item_ids_by_place[place_id].add(id)
+				else:
+					item_ids_by_place[place_id] = set((id, ))
+				index_item(id, row[self.COL_NAMES_ITEM["NAME"]], row[self.COL_NAMES_ITEM["DETAILS"]])
+			
+			loaded += len(rows)
+			yield float(loaded) / max(item_count, 1)
+		
+		cur.close()
+		if attach_early:
+			# Items added to an open place list while loading aren't in its cached copy
+			self.overview_views.clear()
+			self._run_search()
+			self._show_overview_items()
+		else:
+			if self.search_results is not None:
+				self.search_results = self._search_items()
+			self._attach_models()
+	
+	def _detach_models(self):
+		# Disconnect the stores from all views and drop the filter models
+		self.treeview_overview_places.set_model(None)
+		self.tvcolumn_search_items_place_renderer.set_property('model', None)
+		self._detach_item_models()
+	
+	def _detach_item_models(self):
+		self.treeview_overview_items.set_model(None)
+		self.treeview_search_items.set_model(None)
+		self.liststore_filter_search_items = None
+	
+	def _attach_models(self):
+		# Create the filter models and connect the stores to all views
+		self.treeview_overview_places.set_model(self.treestore_places)
+		self.tvcolumn_search_items_place_renderer.set_property('model', self.treestore_places)
+		
+		# The lazy models can't be sorted by GTK, they sort themselves when a column header is clicked
+		for tvcolumn, column in self.sort_columns_items.iteritems():
+			tvcolumn.set_sort_column_id(-1 if self.lazy_items else column)
+			tvcolumn.set_clickable(True)
+		
+		if self.lazy_items:
+			self._set_lazy_filters()
+			self.lazymodel_overview_items.invalidate()
+			self.lazymodel_search_items.invalidate()
+			self.treeview_overview_items.set_model(self.lazymodel_overview_items)
+			self.treeview_search_items.set_model(self.lazymodel_search_items)
+			return
+		
+		self._attach_item_models()
+	
+	def _attach_item_models(self):
+		self.liststore_filter_search_items = self.liststore_items.filter_new()
+		self.liststore_filter_search_items.set_visible_func(self._filter_search_items, data = None)
 		
-		self.cur.execute("SELECT * FROM `items`")
-		item_entries = self.cur.fetchall()
-		for entry in item_entries:
-			self.add_item(Item.from_db_entry(entry), save_to_db = False)
+		self._show_overview_items()
+		self.treeview_search_items.set_model(self.liststore_filter_search_items)
+	
+	def _begin_batch(self, count):
+		# Get ready to change count items at once; returns whether the item lists have been detached for it (see BATCH_DETACH_SIZE)
+		if self.lazy_items or count < self.BATCH_DETACH_SIZE:
+			return False
 		
-		self._reload_place_names()
+		self._detach_item_models()
+		return True
 	
-	def _get_path(self, store, id):
-		# Get the path for the row with the given ID in the given ListStore
-		for index, row in enumerate(store):
-			if row[0] == id:
-				return (index, )
+	def _end_batch(self, detached):
+		# Let the views catch up with a batch of changes
+		if detached:
+			self._attach_item_models()
+	
+	def _refresh_lazy_views(self):
+		# Read the totals and both lazy item lists from the database again after many items have been changed there, once the changes have been written
+		self._after_write(self._reload_lazy_views)
+	
+	def _reload_lazy_views(self):
+		self._reload_totals()
+		self._refresh_lazy_view(self.treeview_overview_items)
+		self._refresh_lazy_view(self.treeview_search_items)
+	
+	def _set_lazy_filters(self):
+		# Apply the selected place and the search term to the lazy models
+		if self.FILTER_OVERVIEW_ITEMS_PLACE_ID is None:
+			self.lazymodel_overview_items.set_filter()
+		elif self.FILTER_OVERVIEW_ITEMS_PLACE_ID == DUMMY_PLACE.id:
+			self.lazymodel_overview_items.set_filter("i.place_id IS NULL")
+		else:
+			self.lazymodel_overview_items.set_filter("i.place_id IN (SELECT descendant_id FROM `store_place_tree` WHERE ancestor_id = ?)", (self.FILTER_OVERVIEW_ITEMS_PLACE_ID, ))
+		
+		self.lazymodel_search_items.set_query(self.search_query)
+	
+	def _refresh_lazy_view(self, view, invalidate = True):
+		# Reattach a lazy model, so its view picks up a new filter, sort order or number of rows
+		model = view.get_model()
+		if model is None:
+			return
+		
+		if invalidate:
+			model.invalidate()
+		view.set_model(None)
+		view.set_model(model)
+	
+	def _edit_lazy_item(self, id, column, value):
+		# Record the change of an item that is read from the database on demand and update the cached rows
+		if column in self.DB_COLUMNS_ITEM:
+			db_value = place_id_to_db(value) if column == self.COL_NAMES_ITEM["PLACE_ID"] else to_unicode(value)
+			self.writer.update('items', id, {self.DB_COLUMNS_ITEM[column]: db_value})
+		
+		# The cached sort keys can stay as they are, the lazy models sort by the ones in the database
+		self.lazymodel_overview_items.update_row(id, column, value)
+		self.lazymodel_search_items.update_row(id, column, value)
+		
+		if column == self.COL_NAMES_ITEM["PLACE_ID"]:
+			# The item has moved, so the cached pages of the places it moved between are wrong now
+			self._after_write(self._refresh_lazy_view, self.treeview_overview_items)
+		else:
+			# Pages read before the change has been written have the old values
+			self._after_write(self._redraw_lazy_views)
+	
+	def _redraw_lazy_views(self):
+		# Read the rows the lazy item lists show from the database again, keeping the views where they are
+		self.lazymodel_overview_items.invalidate()
+		self.lazymodel_search_items.invalidate()
+		self.treeview_overview_items.queue_draw()
+		self.treeview_search_items.queue_draw()
+	
+	def _get_overview_view(self, place_id):
+		# Get the ListStore with the items stored in a place or anywhere inside it, built from the place ID -> item IDs index if it isn't cached
+		view = self.overview_views.pop(place_id, None)
+		if view is None:
+			store = gtk.ListStore(*[self.liststore_items.get_column_type(column) for column in range(self.liststore_items.get_n_columns())])
+			self._set_sort_funcs(store, self.SORT_KEY_COLUMNS_ITEM)
+			iters = {}
+			for id in self._subtree_place_ids(place_id):
+				for item_id in self.item_ids_by_place.get(id, ()):
+					iters[item_id] = store.append(tuple(self.liststore_items[self.iters_items[item_id]]))
+			view = (store, iters)
+			while len(self.overview_views) >= self.OVERVIEW_CACHE_SIZE:
+				self.overview_views.popitem(last = False)
+		
+		self.overview_views[place_id] = view
+		return view
+	
+	def _show_overview_items(self):
+		# Show the items of the selected place (or all items) in the overview item list
+		if self.FILTER_OVERVIEW_ITEMS_PLACE_ID is None:
+			store = self.liststore_items
+		else:
+			store = self._get_overview_view(self.FILTER_OVERVIEW_ITEMS_PLACE_ID)[0]
+		
+		# Keep the sort order the user chose
+		old_store = self.treeview_overview_items.get_model()
+		if old_store is not None and old_store is not store:
+			sort_column, sort_order = old_store.get_sort_column_id()
+			if sort_column is not None and sort_column >= 0:
+				store.set_sort_column_id(sort_column, sort_order)
 		
-		return None
+		self.treeview_overview_items.set_model(store)
+	
+	def _invalidate_overview_items(self, place_id):
+		# Drop the cached item lists of a place and the places it's inside of after items have been moved into or out of it
+		for id in self._place_path_ids(place_id):
+			if self.overview_views.pop(id, None) is None:
+				continue
+			
+			if id == self.FILTER_OVERVIEW_ITEMS_PLACE_ID and self.overview_refresh is None:
+				# Rebuild the list once all changes have been made
+				self.overview_refresh = gobject.idle_add(self._refresh_overview_items)
+	
+	def _refresh_overview_items(self):
+		self.overview_refresh = None
+		if not self.lazy_items and self.treeview_overview_items.get_model() is not None:
+			self._show_overview_items()
+		return False
+	
+	def _sync_overview_views(self, model, path, tree_iter):
+		# Copy a changed item row into the cached item lists that contain it
+		row = tuple(model[tree_iter])
+		id = row[self.COL_NAMES_ITEM["ID"]]
+		for store, iters in self.overview_views.itervalues():
+			view_iter = iters.get(id)
+			if view_iter is not None:
+				store[view_iter] = row
+	
+	def _filter_search_items(self, model, iter, user_data = None):
+		# ListStore filter (for filtering based on search term)
+		if self.search_results is None:
+			return True
+		
+		return model[iter][self.COL_NAMES_ITEM["ID"]] in self.search_results
+	
+	def _index_item_text(self, id, name, details):
+		# Update the search index (and the current results, if they came from it) for an item's name and details
+		self.search_index.update(id, name, details)
+		
+		query = self.search_query
+		if self.search_results is not None and query is not None and query.is_plain:
+			score = self.search_index.score(id, query.words)
+			if score:
+				self.search_results[id] = score
+			else:
+				self.search_results.pop(id, None)
+	
+	def _item_values(self, row):
+		# Get the case-folded fields of an item row the search queries can compare; the name and the details have been folded by the search index already
+		place_iter = self.iters_places.get(row[self.COL_NAMES_ITEM["PLACE_ID"]])
+		place = self.treestore_places[place_iter] if place_iter is not None else None
+		names = []
+		while place_iter is not None:
+			names.append(fold(self.treestore_places[place_iter][self.COL_NAMES_PLACE["NAME"]]))
+			place_iter = self.treestore_places.iter_parent(place_iter)
+		
+		name, details = self.search_index.get_folded(row[self.COL_NAMES_ITEM["ID"]], row[self.COL_NAMES_ITEM["NAME"]], row[self.COL_NAMES_ITEM["DETAILS"]])
+		return {
+			'name': name,
+			'details': details,
+			'amount': row[self.COL_NAMES_ITEM["AMOUNT"]],
+			'place': fold(place[self.COL_NAMES_PLACE["NAME"]]) if place is not None else None,
+			'location': fold(place[self.COL_NAMES_PLACE["LOCATION"]]) if place is not None else None,
+			'type': fold(place[self.COL_NAMES_PLACE["TYPE"]]) if place is not None else None,
+			'in': names,
+		}
+	
+	def _recheck_search_row(self, model, path, tree_iter):
+		# Keep the results of a structured query up to date when an item changes, before the search filter looks at it
+		query = self.search_query
+		if query is None or query.is_plain or self.search_results is None or self.liststore_filter_search_items is None:
+			return
+		
+		row = model[tree_iter]
+		id = row[self.COL_NAMES_ITEM["ID"]]
+		if not query.matches(self._item_values(row)):
+			self.search_results.pop(id, None)
+		elif id not in self.search_results:
+			self.search_results[id] = self.search_index.score(id, query.words) if query.words else 0
+	
+	def _recheck_place_items(self, place_id):
+		# Let the search filter look at the items of a place and the places inside it again after the place has changed
+		query = self.search_query
+		if query is None or query.is_plain or self.search_results is None:
+			return
+		
+		if self.lazy_items:
+			self._refresh_lazy_view(self.treeview_search_items)
+			return
+		
+		for id in self._subtree_place_ids(place_id):
+			for item_id in self.item_ids_by_place.get(id, ()):
+				tree_iter = self.iters_items[item_id]
+				self.liststore_items.row_changed(self.liststore_items.get_path(tree_iter), tree_iter)
+	
+	def _search_items(self):
+		# Get ID -> score of the items matching the current search query
+		query = self.search_query
+		if query is None or self.lazy_items:
+			return {}
+		
+		if query.is_plain:
+			return self.search_index.search(query.words)
+		
+		# Everything else is answered by the database, which has indexes on the place, the amount and the name
+		if self.writer.has_pending():
+			# It doesn't know about our latest changes yet, so search again once they're written
+			self._after_write(self._rerun_search, query)
+		cur = self.db.cursor()
+		cur.row_factory = None
+		cur.execute("SELECT i.id FROM `store_items` i WHERE %s" % query.where, query.params)
+		if query.words:
+			results = dict((id, self.search_index.score(id, query.words)) for id, in cur)
+		else:
+			results = dict.fromkeys((id for id, in cur), 0)
+		cur.close()
+		return results
+	
+	def _run_search(self):
+		# Search for the current search term and show the matching items
+		self.search_timeout = None
+		self.search_term = self.entry_search_term.get_text()
+		label = "Matching Items"
+		try:
+			self.search_query = compile_query(to_unicode(self.search_term), stores = True)
+		except QuerySyntaxError as error:
+			# Nothing matches until the query can be understood
+			self.search_query = None
+			label = "Matching Items (%s)" % error
+		
+		if self.search_query is not None and self.search_query.tree is None:
+			self.search_results = None
+			label = "All Items"
+		else:
+			self.search_results = self._search_items()
+		
+		self.frame_search_item_list.set_label(label)
+		if self.lazy_items:
+			self._set_lazy_filters()
+			self._refresh_lazy_view(self.treeview_search_items)
+		elif self.liststore_filter_search_items is not None:
+			self.liststore_filter_search_items.refilter()
+		
+		return False
+	
+	def _rerun_search(self, query):
+		# Search again for a query that has been answered before our changes were written, unless the search term has changed since
+		if query is self.search_query and self.search_timeout is None:
+			self._run_search()
+	
+	def _get_index(self, store):
+		# Get the ID -> Iter index belonging to the given ListStore
+		if store is self.treestore_places:
+			return self.iters_places
+		elif store is self.liststore_items:
+			return self.iters_items
+		
+		raise ValueError("No index for this model")
 	
 	def _get_iter(self, store, id):
 		# Get the Iter object for the row with the given ID in the given ListStore
-		path = self._get_path(store, id)
-		if path is None:
+		# ListStore iters stay valid until their row is removed, so they can be kept around
+		return self._get_index(store).get(id)
+	
+	def _get_path(self, store, id):
+		# Get the path for the row with the given ID in the given ListStore
+		tree_iter = self._get_iter(store, id)
+		if tree_iter is None:
 			return None
 		
-		return store.get_iter(path)
+		return store.get_path(tree_iter)
 	
-	def _reload_place_names(self):
-		places = {}
+	def _remove_row(self, store, id):
+		# Remove the row with the given ID from the given ListStore and its index
+		tree_iter = self._get_index(store).pop(id, None)
+		if tree_iter is None:
+			return False
 		
-		for entry in self.liststore_places:
-			places[entry[self.COL_NAMES_PLACE["ID"]]] = entry[self.COL_NAMES_PLACE["NAME"]]
+		store.remove(tree_iter)
+		return True
+	
+	def _get_place_name(self, place_id):
+		# Get the name to display for the place with the given ID
+		tree_iter = self.iters_places.get(place_id)
+		if tree_iter is None:
+			return "UNKNOWN"
 		
-		for item in self.liststore_items:
-			try:
-				item[self.COL_NAMES_ITEM["PLACE_NAME"]] = places[item[self.COL_NAMES_ITEM["PLACE_ID"]]]
-			except KeyError:
-				item[self.COL_NAMES_ITEM["PLACE_NAME"]] = "UNKNOWN"
+		return self.treestore_places[tree_iter][self.COL_NAMES_PLACE["NAME"]]
+	
+	def _get_place_name_key(self, place_id):
+		# Get the sort key of the name of a place; items without a place come first
+		tree_iter = self.iters_places.get(place_id)
+		if tree_iter is None:
+			return ""
+		
+		return self.treestore_places[tree_iter][self.COL_NAMES_PLACE["NAME_KEY"]]
+	
+	def _get_place_store(self, place_id):
+		# Get the store a place belongs to; items of every store can be left without a place
+		tree_iter = self.iters_places.get(place_id)
+		if tree_iter is None:
+			return self.store_name
+		
+		return self.treestore_places[tree_iter][self.COL_NAMES_PLACE["STORE"]]
+	
+	def _set_sort_funcs(self, store, key_columns):
+		# Sort the text columns of a store by their keys, which are compared as they are
+		for key_column in key_columns.itervalues():
+			store.set_sort_func(key_column, compare_keys, key_column)
+	
+	def _set_text(self, entry, column, value):
+		# Set a column of a place or item row, together with the hidden column holding its sort key if it's a text column
+		key_columns = self.SORT_KEY_COLUMNS_PLACE if entry.model is self.treestore_places else self.SORT_KEY_COLUMNS_ITEM
+		key_column = key_columns.get(column)
+		if key_column is None:
+			entry[column] = value
+		else:
+			entry.model.set(entry.iter, column, value, key_column, sort_key(value))
+	
+	def _set_place_name(self, entry, place_id):
+		# Show the name of the place of an item row
+		entry.model.set(entry.iter, self.COL_NAMES_ITEM["PLACE_NAME"], self._get_place_name(place_id), self.COL_NAMES_ITEM["PLACE_NAME_KEY"], self._get_place_name_key(place_id))
+	
+	def _iter_place_iters(self, parent = None):
+		# Iterate over the iters of all places inside a place (or of all places for None), each one before the places inside it
+		tree_iter = self.treestore_places.iter_children(parent)
+		while tree_iter is not None:
+			yield tree_iter
+			for child in self._iter_place_iters(tree_iter):
+				yield child
+			tree_iter = self.treestore_places.iter_next(tree_iter)
+	
+	def _subtree_place_ids(self, place_id):
+		# Get the IDs of a place and of all places inside it
+		tree_iter = self.iters_places.get(place_id)
+		if tree_iter is None:
+			return [place_id]
+		
+		return [place_id] + [self.treestore_places[child][self.COL_NAMES_PLACE["ID"]] for child in self._iter_place_iters(tree_iter)]
+	
+	def _place_path_ids(self, place_id):
+		# Get the IDs of a place and of all places it's inside of, innermost first
+		ids = [place_id]
+		tree_iter = self.iters_places.get(place_id)
+		while tree_iter is not None:
+			tree_iter = self.treestore_places.iter_parent(tree_iter)
+			if tree_iter is not None:
+				ids.append(self.treestore_places[tree_iter][self.COL_NAMES_PLACE["ID"]])
+		
+		return ids
+	
+	def _index_item_place(self, item_id, old_place_id, new_place_id):
+		# Move an item between the sets of the place ID -> item IDs index (None means no place)
+		if old_place_id is not None:
+			item_ids = self.item_ids_by_place.get(old_place_id)
+			if item_ids is not None:
+				item_ids.discard(item_id)
+				if not item_ids:
+					del self.item_ids_by_place[old_place_id]
+			self._invalidate_overview_items(old_place_id)
+		
+		if new_place_id is not None:
+			self.item_ids_by_place.setdefault(new_place_id, set()).add(item_id)
+			self._invalidate_overview_items(new_place_id)
+	
+	def _update_place_names(self, place_id):
+		# Update the place name of all items stored in the given place
+		if self.lazy_items:
+			# The lazy models get the place names from the database, once the new name has been written
+			self._after_write(self._redraw_lazy_views)
+			return
+		
+		for item_id in self.item_ids_by_place.get(place_id, ()):
+			self._set_place_name(self.liststore_items[self.iters_items[item_id]], place_id)
+	
+	def _unassign_place_items(self, place_id):
+		# Move all items stored in a removed place to the dummy place
+		if self.lazy_items:
+			# The database does this on its own
+			self._refresh_lazy_views()
+			return
+		
+		item_ids = self.item_ids_by_place.pop(place_id, ())
+		self._invalidate_overview_items(place_id)
+		for item_id in item_ids:
+			entry = self.liststore_items[self.iters_items[item_id]]
+			entry[self.COL_NAMES_ITEM["PLACE_ID"]] = DUMMY_PLACE.id
+			self._set_place_name(entry, DUMMY_PLACE.id)
+			self._index_item_place(item_id, None, DUMMY_PLACE.id)
+	
+	def _add_place_totals(self, tree_iter, items, amount):
+		# Add to the item count and total amount of a place and of all places it's inside of
+		while tree_iter is not None:
+			entry = self.treestore_places[tree_iter]
+			entry[self.COL_NAMES_PLACE["ITEMS"]] += items
+			entry[self.COL_NAMES_PLACE["AMOUNT"]] += amount
+			tree_iter = self.treestore_places.iter_parent(tree_iter)
+	
+	def _count_items(self, place_id, items, amount):
+		# Add to the item count and total amount of a place (and the places it's inside of) and of the whole inventory (the database has triggers for this)
+		tree_iter = self.iters_places.get(place_id)
+		if tree_iter is not None:
+			self._add_place_totals(tree_iter, items, amount)
+		else:
+			self.unassigned_totals[0] += items
+			self.unassigned_totals[1] += amount
+		
+		self.inventory_totals[0] += items
+		self.inventory_totals[1] += amount
+		self._update_summary()
+	
+	def _update_summary(self):
+		# Show the totals of the whole inventory below the place list
+		self.label_overview_summary.set_text("%i items (total amount %i) in %i places, %i items (total amount %i) without a place" % (
+			self.inventory_totals[0], self.inventory_totals[1], len(self.iters_places), self.unassigned_totals[0], self.unassigned_totals[1]))
+	
+	def _update_item(self, entry, column):
+		# Record the change of a single column of an item row
+		if column not in self.DB_COLUMNS_ITEM:
+			return
+		
+		value = entry[column]
+		if column == self.COL_NAMES_ITEM["PLACE_ID"]:
+			value = place_id_to_db(value)
+		
+		self.writer.update('items', entry[self.COL_NAMES_ITEM["ID"]], {self.DB_COLUMNS_ITEM[column]: to_unicode(value)})
+	
+	def _update_place(self, entry, column):
+		# Record the change of a single column of a place row
+		if column not in self.DB_COLUMNS_PLACE:
+			return
+		
+		self.writer.update('places', entry[self.COL_NAMES_PLACE["ID"]], {self.DB_COLUMNS_PLACE[column]: to_unicode(entry[column])})
+	
+	def commit_changes(self):
+		# Wait until all changes made so far have been written to the database; the main loop uses _after_write instead
+		self.writer.flush()
+	
+	def _after_write(self, callback, *args):
+		# Call callback(*args) from the main loop once all changes made so far have been written, without waiting for it
+		self.writer.flush_async(lambda: gobject.idle_add(self._call_after_write, callback, args))
+	
+	def _call_after_write(self, callback, args):
+		if not self.closed:
+			callback(*args)
+		return False
+	
+	def _writer_error(self, error):
+		# Called in the writer thread when changes couldn't be written, so show the error in the main loop
+		self.write_failed = True
+		gobject.idle_add(self._show_error, "Your latest changes could not be saved: %s" % error)
+	
+	def _show_error(self, message):
+		# Show an error message to the user
+		dialog = gtk.MessageDialog(self.window, gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK, message)
+		dialog.run()
+		dialog.destroy()
+	
+	def _check_writable(self, stores):
+		# Tell the user if any of some rows belongs to another store, which can't be changed here; returns whether all of them can be changed
+		for store in stores:
+			if store != self.store_name:
+				self._show_error("The places and items of %s can only be looked at here. Open its database on its own to change them." % store)
+				return False
+		
+		return True
+	
+	def _ask(self, title, widgets):
+		# Show a dialog with some widgets and OK and Cancel buttons; returns whether OK has been clicked
+		dialog = gtk.Dialog(title, self.window, gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT, (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL, gtk.STOCK_OK, gtk.RESPONSE_OK))
+		dialog.set_default_response(gtk.RESPONSE_OK)
+		for widget in widgets:
+			dialog.vbox.pack_start(widget, expand = False, padding = 5)
+		dialog.show_all()
+		response = dialog.run()
+		dialog.destroy()
+		return response == gtk.RESPONSE_OK
+	
+	def _place_combo(self):
+		# Get a ComboBox to pick a place with
+		combo = gtk.ComboBox(self.treestore_places)
+		renderer = gtk.CellRendererText()
+		combo.pack_start(renderer, True)
+		combo.add_attribute(renderer, 'text', self.COL_NAMES_PLACE["NAME"])
+		combo.set_active(0)
+		return combo
+	
+	def _combo_place_id(self, combo):
+		tree_iter = combo.get_active_iter()
+		return self.treestore_places[tree_iter][self.COL_NAMES_PLACE["ID"]] if tree_iter is not None else None
+	
+	def _ask_place(self, count):
+		# Ask where to move count items to; returns the ID of the place or None
+		combo = self._place_combo()
+		if not self._ask("Move Items", [gtk.Label("Move %i item(s) to:" % count), combo]):
+			return None
+		
+		return self._combo_place_id(combo)
+	
+	def _ask_amount_change(self, count):
+		# Ask how to change the amounts of count items, in the syntax of the Amount cell; returns the text or None
+		entry = gtk.Entry()
+		entry.set_activates_default(True)
+		label = gtk.Label("New amount of %i item(s), e.g. 7, or a change, e.g. +10 restock or -3 used for the clock:" % count)
+		if not self._ask("Change Amounts", [label, entry]):
+			return None
+		
+		return entry.get_text()
+	
+	def _ask_place_removal(self, count):
+		# Ask what should happen to the items of count places that are about to be removed
+		# Returns the arguments for remove_places (the place to move them to and whether to remove them), or None to keep the places
+		button_keep = gtk.RadioButton(None, "Leave their items without a place")
+		button_move = gtk.RadioButton(button_keep, "Move their items to:")
+		combo = self._place_combo()
+		button_cascade = gtk.RadioButton(button_keep, "Remove their items and the places inside them, too")
+		if not self._ask("Remove Places", [gtk.Label("Remove %i place(s)." % count), button_keep, button_move, combo, button_cascade]):
+			return None
+		
+		if button_move.get_active():
+			return (self._combo_place_id(combo), False)
+		
+		return (None, button_cascade.get_active())
+	
+	def _schemas(self):
+		# The main database and the attached stores, which are attached under their names
+		return ['main'] + self.stores[1:]
+	
+	def _poll_changes(self):
+		# Apply the changes other instances have made to the database and the attached stores since the last check
+		if self.loader is not None:
+			return True
+		
+		for schema in self._schemas():
+			# Only our own writes can be waiting, and they only go to the main database
+			deferred = self.deferred_changes if schema == 'main' else ()
+			
+			# The data version only changes when another connection (including our writer) has committed something
+			data_version = get_data_version(self.db, schema)
+			if data_version == self.data_versions.get(schema) and not deferred:
+				continue
+			
+			self.data_versions[schema] = data_version
+			changes = get_changes(self.db, self.change_seqs.get(schema, 0), schema)
+			if changes is None:
+				# The log doesn't go back far enough anymore, so start over
+				self.load_data_progressively()
+				return True
+			
+			changes, self.change_seqs[schema] = changes
+			if deferred:
+				changes = list(deferred) + changes
+				self.deferred_changes.clear()
+			
+			if changes:
+				self._apply_changes(changes, schema)
+		return True
+	
+	def _fetch_rows(self, table, columns, ids, schema = 'main'):
+		# Get the rows of a table with the given IDs as ID -> sqlite3.Row
+		rows = {}
+		ids = list(ids)
+		for start in xrange(0, len(ids), 500):
+			chunk = ids[start:start + 500]
+			self.cur.execute("SELECT %s FROM %s.`%s` WHERE id IN (%s)" % (", ".join(columns), quote_name(schema), table, ", ".join("?" * len(chunk))), chunk)
+			for row in self.cur.fetchall():
+				rows[row['id']] = row
+		return rows
+	
+	def _apply_changes(self, changes, schema = 'main'):
+		# Bring the ListStores up to date with the changed rows of a database; rows with changes of our own waiting to be written are looked at again later
+		store = self.store_name if schema == 'main' else schema
+		place_ids = []
+		item_ids = []
+		for table, id in changes:
+			if self.writer.is_pending(table, id):
+				self.deferred_changes.add((table, id))
+			elif table == 'places':
+				place_ids.append(id)
+			elif table == 'items':
+				item_ids.append(id)
+		
+		places = self._fetch_rows('places', ('id', 'name', 'location', 'type', 'parent_id'), place_ids, schema)
+		
+		# New and changed places first, so items moved into a new place find it, and every place after the one it's inside of
+		ordered = []
+		def _add_parents_first(id):
+			if id in places and id not in ordered:
+				_add_parents_first(places[id]['parent_id'])
+				ordered.append(id)
+		for id in place_ids:
+			_add_parents_first(id)
+		
+		for id in ordered:
+			self._apply_place(places[id], store)
+		
+		if not self.lazy_items:
+			items = self._fetch_rows('items', ('id', 'name', 'place_id', 'details', 'amount'), item_ids, schema)
+			for id in item_ids:
+				self._apply_item(id, items.get(id), store)
+		
+		# Removed places last, once their items have been moved out
+		for id in place_ids:
+			if id not in places:
+				self.remove_place(id, save_to_db = False)
+		
+		if self.lazy_items and (item_ids or place_ids):
+			self._refresh_lazy_views()
+	
+	def _apply_place(self, row, store):
+		# Add a place another instance has created in a store, or update the columns it has changed
+		tree_iter = self.iters_places.get(row['id'])
+		if tree_iter is None:
+			self.add_place(StoragePlace(row['id'], row['name'], row['location'], row['type'], row['parent_id']), save_to_db = False, store = store)
+			return
+		
+		entry = self.treestore_places[tree_iter]
+		for column, db_column in self.DB_COLUMNS_PLACE.iteritems():
+			if to_unicode(entry[column]) != row[db_column]:
+				self._set_text(entry, column, row[db_column])
+				if column == self.COL_NAMES_PLACE["NAME"]:
+					self._update_place_names(row['id'])
+				self._recheck_place_items(row['id'])
+		
+		parent_id = row['parent_id'] if row['parent_id'] is not None else DUMMY_PLACE.id
+		if entry[self.COL_NAMES_PLACE["PARENT_ID"]] != parent_id:
+			self.move_place(row['id'], parent_id, save_to_db = False)
+	
+	def _apply_item(self, id, row, store):
+		# Add, update or remove an item of a store the way another instance has
+		tree_iter = self.iters_items.get(id)
+		if tree_iter is None:
+			if row is not None:
+				self.add_item(Item.from_db_entry(dict(zip(row.keys(), row))), save_to_db = False, store = store)
+			return
+		
+		if row is None:
+			self.remove_item(id, save_to_db = False)
+			return
+		
+		entry = self.liststore_items[tree_iter]
+		old_place_id = entry[self.COL_NAMES_ITEM["PLACE_ID"]]
+		place_id = row['place_id'] if row['place_id'] is not None else DUMMY_PLACE.id
+		amount = entry[self.COL_NAMES_ITEM["AMOUNT"]]
+		if place_id != old_place_id:
+			self._count_items(old_place_id, -1, -amount)
+			self._count_items(place_id, 1, amount)
+			entry[self.COL_NAMES_ITEM["PLACE_ID"]] = place_id
+			self._set_place_name(entry, place_id)
+			self._index_item_place(id, old_place_id, place_id)
+		
+		if row['amount'] != amount:
+			self._count_items(place_id, 0, row['amount'] - amount)
+			entry[self.COL_NAMES_ITEM["AMOUNT"]] = row['amount']
+		
+		if to_unicode(entry[self.COL_NAMES_ITEM["NAME"]]) != row['name'] or to_unicode(entry[self.COL_NAMES_ITEM["DETAILS"]]) != row['details']:
+			# Re-index the item before the change reaches the search filter
+			self._index_item_text(id, row['name'], row['details'])
+			self._set_text(entry, self.COL_NAMES_ITEM["NAME"], row['name'])
+			self._set_text(entry, self.COL_NAMES_ITEM["DETAILS"], row['details'])
+	
+	def _reload_totals(self):
+		# Read the totals of all places and the whole inventory from the database
+		self.inventory_totals = list(self.db.execute("SELECT IFNULL(SUM(item_count), 0), IFNULL(SUM(total_amount), 0) FROM `store_place_totals`").fetchone())
+		self.unassigned_totals = [0, 0]
+		for place_id, item_count, total_amount in self.db.execute("SELECT place_id, item_count, total_amount FROM `store_place_totals`"):
+			if place_id not in self.iters_places:
+				self.unassigned_totals[0] += item_count
+				self.unassigned_totals[1] += total_amount
+		
+		totals = dict((place_id, (item_count, total_amount)) for place_id, item_count, total_amount in self.db.execute(STORE_SUBTREE_TOTALS))
+		for tree_iter in self._iter_place_iters():
+			entry = self.treestore_places[tree_iter]
+			entry[self.COL_NAMES_PLACE["ITEMS"]], entry[self.COL_NAMES_PLACE["AMOUNT"]] = totals.get(entry[self.COL_NAMES_PLACE["ID"]], (0, 0))
+		self._update_summary()
+	
+	def _start_backup(self):
+		# Start the next backup, unless the last one is still running
+		self.backups.start()
+		return True
+	
+	def _backup_error(self, error):
+		# Called in the backup thread when a backup has failed
+		gobject.idle_add(self._show_error, "The backup failed: %s" % error)
+	
+	def add_place(self, place, save_to_db = True, store = None):
+		# Add a place of a store (ours unless given) to all place lists, inside its parent place if it has one
+		parent_iter = self.iters_places.get(place.parent_id)
+		parent_id = place.parent_id if parent_iter is not None else DUMMY_PLACE.id
+		self.iters_places[place.id] = self.treestore_places.append(parent_iter, [place.id, place.name, place.location, place.type, 0, 0, parent_id,
+			sort_key(place.name), sort_key(place.location), sort_key(place.type), self.store_name if store is None else store])
+		self._update_summary()
+		
+		if save_to_db:
+			self.writer.insert('places', place.id, place.to_db_entry())
+	
+	def _copy_place_rows(self, tree_iter, parent_iter):
+		# Copy the row of a place and the rows of all places inside it to another parent, pointing the index at the copies
+		store = self.treestore_places
+		row = tuple(store[tree_iter])
+		new_iter = store.append(parent_iter, row)
+		self.iters_places[row[self.COL_NAMES_PLACE["ID"]]] = new_iter
+		child = store.iter_children(tree_iter)
+		while child is not None:
+			self._copy_place_rows(child, new_iter)
+			child = store.iter_next(child)
+		
+		return new_iter
+	
+	def move_place(self, id, parent_id, save_to_db = True):
+		# Move a place and everything inside it into another place, or to the top for DUMMY_PLACE.id; returns whether it has been moved
+		store = self.treestore_places
+		tree_iter = self.iters_places.get(id)
+		if tree_iter is None:
+			return False
+		
+		parent_iter = self.iters_places.get(parent_id)
+		if parent_iter is None:
+			parent_id = DUMMY_PLACE.id
+		elif parent_id == id or store.is_ancestor(tree_iter, parent_iter):
+			# A place can't be moved into itself or a place inside it
+			return False
+		
+		if store[tree_iter][self.COL_NAMES_PLACE["PARENT_ID"]] == parent_id:
+			return False
+		
+		# The totals of everything inside the place move from its old surroundings to the new ones
+		items = store[tree_iter][self.COL_NAMES_PLACE["ITEMS"]]
+		amount = store[tree_iter][self.COL_NAMES_PLACE["AMOUNT"]]
+		self._add_place_totals(store.iter_parent(tree_iter), -items, -amount)
+		self._add_place_totals(parent_iter, items, amount)
+		
+		# TreeStore rows can't be given another parent, so they're copied there and the old ones are removed
+		new_iter = self._copy_place_rows(tree_iter, parent_iter)
+		store[new_iter][self.COL_NAMES_PLACE["PARENT_ID"]] = parent_id
+		store.remove(tree_iter)
+		
+		# The item lists of all places around the old and the new position have changed
+		self.overview_views.clear()
+		if self.FILTER_OVERVIEW_ITEMS_PLACE_ID is not None:
+			if self.lazy_items:
+				self._refresh_lazy_view(self.treeview_overview_items)
+			elif self.overview_refresh is None:
+				self.overview_refresh = gobject.idle_add(self._refresh_overview_items)
+		self._recheck_place_items(id)
+		
+		if save_to_db:
+			self.writer.update('places', id, {'parent_id': place_id_to_db(parent_id)})
+		
+		return True
+	
+	def remove_place(self, id, save_to_db = True):
+		# Remove a place from all place lists, leaving its items without a place; the places inside it move up to its parent
+		if not self._remove_place_row(id):
+			return
+		
+		self._unassign_place_items(id)
+		
+		if save_to_db:
+			self.writer.delete('places', id)
+	
+	def _remove_place_row(self, id):
+		# Remove the row of a place, counting its own items as being without a place; returns whether there was one
+		tree_iter = self.iters_places.get(id)
+		if tree_iter is None:
+			return False
+		
+		# The database moves them on its own
+		store = self.treestore_places
+		children = []
+		child = store.iter_children(tree_iter)
+		while child is not None:
+			children.append(store[child][self.COL_NAMES_PLACE["ID"]])
+			child = store.iter_next(child)
+		for child_id in children:
+			self.move_place(child_id, store[tree_iter][self.COL_NAMES_PLACE["PARENT_ID"]], save_to_db = False)
+		
+		# What's left are the place's own items
+		items = store[tree_iter][self.COL_NAMES_PLACE["ITEMS"]]
+		amount = store[tree_iter][self.COL_NAMES_PLACE["AMOUNT"]]
+		self._add_place_totals(tree_iter, -items, -amount)
+		self.unassigned_totals[0] += items
+		self.unassigned_totals[1] += amount
+		
+		self._remove_row(self.treestore_places, id)
+		self._update_summary()
+		return True
 	
-	def _update_item(self, entry):
-		self.cur.execute("UPDATE `items` SET `name` = ?, `place_id` = ?, `details` = ?, `amount` = ? WHERE `id` = ?", (entry[self.COL_NAMES_ITEM["NAME"]].decode('utf-8'), entry[self.COL_NAMES_ITEM["PLACE_ID"]], entry[self.COL_NAMES_ITEM["DETAILS"]].decode('utf-8'), entry[self.COL_NAMES_ITEM["AMOUNT"]], entry[self.COL_NAMES_ITEM["ID"]]))
+	def remove_places(self, ids, move_items_to = None, cascade = False):
+		# Remove several places in one transaction; their items lose their place, move to the place move_items_to or,
+		# with cascade, are removed together with the places inside them; returns whether the places have been removed
+		ids = [id for id in ids if id in self.iters_places]
+		if cascade:
+			ids = set(place_id for id in ids for place_id in self._subtree_place_ids(id))
+		
+		if not ids or (move_items_to is not None and (move_items_to in ids or move_items_to not in self.iters_places)):
+			return False
+		
+		# The places inside others first, so every place that's removed is empty by then
+		ids = sorted(set(ids), key = lambda id: len(self._get_path(self.treestore_places, id)), reverse = True)
+		statements = []
+		if cascade:
+			statements.append(("DELETE FROM `items` WHERE place_id IN (SELECT id FROM `selection`)", ()))
+		elif move_items_to is not None:
+			statements.append(("UPDATE `items` SET place_id = ? WHERE place_id IN (SELECT id FROM `selection`)", (move_items_to, )))
+		statements.append(("DELETE FROM `places` WHERE id IN (SELECT id FROM `selection`)", ()))
+		
+		if self.lazy_items:
+			self.writer.bulk(ids, statements, [('places', id) for id in ids])
+			for id in ids:
+				self._remove_place_row(id)
+			self._refresh_lazy_views()
+			return True
+		
+		items = [self._item_key(item_id) for id in ids for item_id in self.item_ids_by_place.get(id, ())]
+		self.writer.bulk(ids, statements, [('places', id) for id in ids] + [('items', item[0]) for item in items])
+		if cascade:
+			self.remove_items(items, save_to_db = False)
+		elif move_items_to is not None:
+			self.move_items(items, move_items_to, save_to_db = False)
+		
+		for id in ids:
+			self.remove_place(id, save_to_db = False)
+		return True
 	
-	def _update_place(self, entry):
-		self.cur.execute("UPDATE `places` SET `name` = ?, `location` = ?, `type` = ? WHERE `id` = ?", (entry[self.COL_NAMES_PLACE["NAME"]].decode('utf-8'), entry[self.COL_NAMES_PLACE["LOCATION"]].decode('utf-8'), entry[self.COL_NAMES_PLACE["TYPE"]].decode('utf-8'), entry[self.COL_NAMES_PLACE["ID"]]))
+	def add_item(self, item, save_to_db = True, store = None):
+		# Add an item of a store (ours unless given) to all item lists
+		self._count_items(item.place.id, 1, item.amount)
+		if self.lazy_items:
+			self._add_lazy_item(item, save_to_db)
+			return
+		
+		self._index_item_text(item.id, item.name, item.details)
+		self.iters_items[item.id] = self.liststore_items.append([item.id, item.place.id, self._get_place_name(item.place.id), item.name, item.details, item.amount,
+			self._get_place_name_key(item.place.id), sort_key(item.name), sort_key(item.details), self.store_name if store is None else store])
+		self._index_item_place(item.id, None, item.place.id)
+		
+		if save_to_db:
+			self.writer.insert('items', item.id, item.to_db_entry())
 	
-	def add_place(self, place, save_to_db = True):
-		# Add a place to all place lists
-		self.liststore_places.append([place.id, place.name, place.location, place.type])
+	def remove_item(self, id, save_to_db = True):
+		# Remove an item from all item lists (the lazy models have remove_items)
+		tree_iter = self.iters_items.get(id)
+		if tree_iter is None:
+			return
+		
+		entry = self.liststore_items[tree_iter]
+		place_id = entry[self.COL_NAMES_ITEM["PLACE_ID"]]
+		self._count_items(place_id, -1, -entry[self.COL_NAMES_ITEM["AMOUNT"]])
+		self._index_item_place(id, place_id, None)
+		self._remove_row(self.liststore_items, id)
+		self.search_index.remove(id)
+		if self.search_results is not None:
+			self.search_results.pop(id, None)
 		
 		if save_to_db:
-			place.save_to_db(self.cur)
-			self.db.commit()
+			self.writer.delete('items', id)
+	
+	def _item_key(self, id):
+		# Get the (ID, place ID, amount) of an item, the way the bulk changes of items take them
+		entry = self.liststore_items[self.iters_items[id]]
+		return (id, entry[self.COL_NAMES_ITEM["PLACE_ID"]], entry[self.COL_NAMES_ITEM["AMOUNT"]])
+	
+	def _selected_items(self, selection):
+		# Get the (ID, place ID, amount) of every item selected in an item list
+		model, pathlist = selection.get_selected_rows()
+		return [(model[path][self.COL_NAMES_ITEM["ID"]], model[path][self.COL_NAMES_ITEM["PLACE_ID"]], model[path][self.COL_NAMES_ITEM["AMOUNT"]]) for path in pathlist]
+	
+	def _selected_stores(self, selection):
+		# Get the stores of the items selected in an item list
+		model, pathlist = selection.get_selected_rows()
+		return [model[path][self.COL_NAMES_ITEM["STORE"]] for path in pathlist]
+	
+	def _count_moved_items(self, items, place_id):
+		# Move the counts and amounts of some (ID, place ID, amount) items from their places to another one, a place at a time
+		moved = collections.defaultdict(lambda: [0, 0])
+		for id, old_place_id, amount in items:
+			moved[old_place_id][0] += 1
+			moved[old_place_id][1] += amount
+		
+		for old_place_id, (count, amount) in moved.iteritems():
+			self._count_items(old_place_id, -count, -amount)
+			self._count_items(place_id, count, amount)
 	
-	def add_item(self, item, save_to_db = True):
-		# Add an item to all item lists
-		self.liststore_items.append([item.id, item.place.id, item.place.name, item.name, item.details, item.amount])
+	def move_items(self, items, place_id, save_to_db = True):
+		# Move many items, given as (ID, place ID, amount), to a place (or out of all places for DUMMY_PLACE.id) with a single statement
+		if place_id not in self.iters_places:
+			place_id = DUMMY_PLACE.id
+		
+		items = [item for item in items if item[1] != place_id]
+		if not items:
+			return
+		
+		if save_to_db:
+			self.writer.bulk([item[0] for item in items], [("UPDATE `items` SET place_id = ? WHERE id IN (SELECT id FROM `selection`)", (place_id_to_db(place_id), ))], [('items', item[0]) for item in items])
+		
+		if self.lazy_items:
+			self._refresh_lazy_views()
+			return
+		
+		self._count_moved_items(items, place_id)
+		name = self._get_place_name(place_id)
+		name_key = self._get_place_name_key(place_id)
+		detached = self._begin_batch(len(items))
+		for id, old_place_id, amount in items:
+			entry = self.liststore_items[self.iters_items[id]]
+			entry.model.set(entry.iter, self.COL_NAMES_ITEM["PLACE_ID"], place_id, self.COL_NAMES_ITEM["PLACE_NAME"], name, self.COL_NAMES_ITEM["PLACE_NAME_KEY"], name_key)
+			self._index_item_place(id, old_place_id, place_id)
+		self._end_batch(detached)
+	
+	def remove_items(self, items, save_to_db = True):
+		# Remove many items, given as (ID, place ID, amount), with a single statement
+		if not items:
+			return
 		
 		if save_to_db:
-			item.save_to_db(self.cur)
-			self.db.commit()
+			self.writer.bulk([item[0] for item in items], [("DELETE FROM `items` WHERE id IN (SELECT id FROM `selection`)", ())], [('items', item[0]) for item in items])
+		
+		if self.lazy_items:
+			self._refresh_lazy_views()
+			return
+		
+		detached = self._begin_batch(len(items))
+		for item in items:
+			self.remove_item(item[0], save_to_db = False)
+		self._end_batch(detached)
+	
+	def change_amounts(self, items, text):
+		# Change the amounts of many items, given as (ID, place ID, amount), the way text would change each of them in the Amount cell
+		# ("7" or "+10 restock"), recording all movements with a single statement; raises ValueError for text that isn't an amount
+		statement = bulk_movements(to_unicode(text))
+		deltas = [(id, place_id, parse_amount_change(text, amount)[0]) for id, place_id, amount in items]
+		deltas = [delta for delta in deltas if delta[2]]
+		if not deltas:
+			return
+		
+		self.writer.bulk([delta[0] for delta in deltas], [statement], [('items', delta[0]) for delta in deltas])
+		
+		if self.lazy_items:
+			self._refresh_lazy_views()
+			return
+		
+		for id, place_id, delta in deltas:
+			self._count_items(place_id, 0, delta)
+		detached = self._begin_batch(len(deltas))
+		for id, place_id, delta in deltas:
+			self.liststore_items[self.iters_items[id]][self.COL_NAMES_ITEM["AMOUNT"]] += delta
+		self._end_batch(detached)
+	
+	def _add_lazy_item(self, item, save_to_db = True):
+		# Tell the lazy models where an item has ended up in the database, once it has been written there (unless it's there already)
+		if not save_to_db:
+			self._show_lazy_item(item.id)
+			return
+		
+		self.writer.insert('items', item.id, item.to_db_entry())
+		self._after_write(self._show_lazy_item, item.id)
+	
+	def _show_lazy_item(self, id):
+		for model in (self.lazymodel_overview_items, self.lazymodel_search_items):
+			path = model.find_path(id)
+			if path is not None:
+				model.row_added(path)
 	
 	def callback_treeview_overview_places_changed(self, selection):
 		# A row has been clicked in the overview place list, show contained items in the item list
@@ -221,7 +1343,47 @@ class GUI(object):
 		
 		self.frame_overview_item_list.set_label("Items @ %s" % name if name else "All Items")
 		self.FILTER_OVERVIEW_ITEMS_PLACE_ID = id
-		self.liststore_filter_overview_items.refilter()
+		if self.lazy_items:
+			# The lazy model keeps the pages of recently viewed places
+			self._set_lazy_filters()
+			self._refresh_lazy_view(self.treeview_overview_items, invalidate = False)
+		elif self.treeview_overview_items.get_model() is not None:
+			self._show_overview_items()
+	
+	def callback_treeview_overview_places_drag_data_received(self, view, context, x, y, selection_data, info, timestamp):
+		# A place has been dropped onto another one (or next to it), move it there
+		view.stop_emission('drag-data-received')
+		model, pathlist = self.treeview_overview_places_selection.get_selected_rows()
+		if not pathlist:
+			context.finish(False, False, timestamp)
+			return
+		
+		# Selected places inside other selected places move along with them
+		ids = [model[path][self.COL_NAMES_PLACE["ID"]] for path in pathlist]
+		ids = [id for id in ids if not set(self._place_path_ids(id)[1:]) & set(ids)]
+		drop = view.get_dest_row_at_pos(x, y)
+		if drop is None:
+			# Dropped below all places
+			parent_id = DUMMY_PLACE.id
+		else:
+			path, position = drop
+			if position in (gtk.TREE_VIEW_DROP_INTO_OR_BEFORE, gtk.TREE_VIEW_DROP_INTO_OR_AFTER):
+				parent_id = model[path][self.COL_NAMES_PLACE["ID"]]
+			else:
+				parent_id = model[path][self.COL_NAMES_PLACE["PARENT_ID"]]
+		
+		if not self._check_writable([model[path][self.COL_NAMES_PLACE["STORE"]] for path in pathlist] + [self._get_place_store(parent_id)]):
+			context.finish(False, False, timestamp)
+			return
+		
+		moved = [id for id in ids if self.move_place(id, parent_id)]
+		context.finish(bool(moved), False, timestamp)
+		if moved:
+			self.treeview_overview_places_selection.unselect_all()
+		for id in moved:
+			path = model.get_path(self.iters_places[id])
+			view.expand_to_path(path)
+			self.treeview_overview_places_selection.select_path(path)
 	
 	def callback_treeview_overview_items_changed(self, selection):
 		# A row has been clicked in the overview item list
@@ -231,10 +1393,11 @@ class GUI(object):
 			id = model.get_value(tree_iter, self.COL_NAMES_ITEM["ID"])"""
 	
 	def callback_entry_search_term_changed(self, entry):
-		# Text has been deleted from the search term entry
-		value = entry.get_text()
-		self.frame_search_item_list.set_label("Matching Items" if value else "All Items")
-		self.liststore_filter_search_items.refilter()
+		# The search term has been changed, search once the user stops typing
+		if self.search_timeout is not None:
+			gobject.source_remove(self.search_timeout)
+		
+		self.search_timeout = gobject.timeout_add(self.SEARCH_DELAY, self._run_search)
 	
 	def callback_treeview_search_items_changed(self, selection):
 		# A row has been clicked in the search item list
@@ -243,81 +1406,189 @@ class GUI(object):
 			tree_iter = model.get_iter(path)
 			id = model.get_value(tree_iter, self.COL_NAMES_ITEM["ID"])"""
 	
+	def callback_treeview_column_clicked(self, tvcolumn, view):
+		# A column header has been clicked, sort the lazy model (ListStores are sorted by GTK)
+		if not self.lazy_items:
+			return
+		
+		model = view.get_model()
+		column = self.sort_columns_items[tvcolumn]
+		if model.sort_column == column and model.sort_order == gtk.SORT_ASCENDING:
+			order = gtk.SORT_DESCENDING
+		else:
+			order = gtk.SORT_ASCENDING
+		
+		for other in view.get_columns():
+			other.set_sort_indicator(other is tvcolumn)
+		tvcolumn.set_sort_order(order)
+		
+		model.set_sort(column, order)
+		self._refresh_lazy_view(view)
+	
 	def callback_treeview_cell_edited(self, cell, path, new_text, user_data):
 		# A cell has been edited
-		from_model, for_model, column = user_data
-		_entry = None
+		view, for_model, column = user_data
+		from_model = view.get_model()
 		
 		id = from_model[path][0]
 		
+		store_column = self.COL_NAMES_PLACE["STORE"] if for_model is self.treestore_places else self.COL_NAMES_ITEM["STORE"]
+		if not self._check_writable([from_model[path][store_column]]):
+			return
+		
 		if for_model is self.liststore_items and column == self.COL_NAMES_ITEM["AMOUNT"]:
+			# The amount can be set ("7") or changed with a reason ("-3 used for the clock"), either way it's recorded as a movement
+			row = from_model[path]
 			try:
-				new_text = int(new_text)
+				delta, reason = parse_amount_change(new_text, row[self.COL_NAMES_ITEM["AMOUNT"]])
 			except ValueError:
 				return
+			
+			if not delta:
+				return
+			
+			new_text = row[self.COL_NAMES_ITEM["AMOUNT"]] + delta
+			self._count_items(row[self.COL_NAMES_ITEM["PLACE_ID"]], 0, delta)
+			self.writer.append('movements', new_movement(id, delta, to_unicode(reason)), ('items', id))
+		
+		if for_model is self.liststore_items and self.lazy_items:
+			self._edit_lazy_item(id, column, new_text)
+			return
+		
+		tree_iter = self._get_iter(for_model, id)
+		if tree_iter is None:
+			return
+		
+		entry = for_model[tree_iter]
+		
+		if for_model is self.liststore_items and column in (self.COL_NAMES_ITEM["NAME"], self.COL_NAMES_ITEM["DETAILS"]):
+			# Re-index the item before the change reaches the search filter
+			name = new_text if column == self.COL_NAMES_ITEM["NAME"] else entry[self.COL_NAMES_ITEM["NAME"]]
+			details = new_text if column == self.COL_NAMES_ITEM["DETAILS"] else entry[self.COL_NAMES_ITEM["DETAILS"]]
+			self._index_item_text(id, name, details)
 		
-		for entry in for_model:
-			if entry[0] == id:
-				_entry = entry
-				entry[column] = new_text
+		self._set_text(entry, column, new_text)
 		
-		if for_model is self.liststore_places:
-			self._update_place(_entry)
+		if for_model is self.treestore_places:
+			self._update_place(entry, column)
 		elif for_model is self.liststore_items:
-			self._update_item(_entry)
+			self._update_item(entry, column)
 		
-		if for_model is self.liststore_places and column == self.COL_NAMES_PLACE["NAME"]:
-			# We need to tell the item ListStore about the change of a place's name
-			self._reload_place_names()
+		if for_model is self.treestore_places and column == self.COL_NAMES_PLACE["NAME"]:
+			# We need to tell the items stored in this place about the change of its name
+			self._update_place_names(id)
+		if for_model is self.treestore_places:
+			self._recheck_place_items(id)
 	
 	def callback_treeview_cell_item_place_changed(self, combo, path, new_iter, user_data):
 		# A new place has been selected for an item
-		from_model, for_model = user_data
+		view, for_model = user_data
+		from_model = view.get_model()
 		place_id = combo.get_property('model')[new_iter][0]
 		item_id = from_model[path][self.COL_NAMES_ITEM["ID"]]
-		
-		for entry in for_model:
-			if entry[0] == item_id:
-				entry[self.COL_NAMES_ITEM["PLACE_ID"]] = place_id
-				self._update_item(entry)
-		
-		#self._reload_place_names()
+		if not self._check_writable([from_model[path][self.COL_NAMES_ITEM["STORE"]], self._get_place_store(place_id)]):
+			return
+		
+		# Move the item's amount to the new place
+		old_place_id = from_model[path][self.COL_NAMES_ITEM["PLACE_ID"]]
+		amount = from_model[path][self.COL_NAMES_ITEM["AMOUNT"]]
+		self._count_items(old_place_id, -1, -amount)
+		self._count_items(place_id, 1, amount)
+		
+		if self.lazy_items:
+			self._edit_lazy_item(item_id, self.COL_NAMES_ITEM["PLACE_ID"], place_id)
+			self._edit_lazy_item(item_id, self.COL_NAMES_ITEM["PLACE_NAME"], self._get_place_name(place_id))
+			return
+		
+		tree_iter = self._get_iter(for_model, item_id)
+		if tree_iter is None:
+			return
+		
+		entry = for_model[tree_iter]
+		entry[self.COL_NAMES_ITEM["PLACE_ID"]] = place_id
+		self._set_place_name(entry, place_id)
+		self._index_item_place(item_id, old_place_id, place_id)
+		self._update_item(entry, self.COL_NAMES_ITEM["PLACE_ID"])
 	
 	def callback_button_clicked(self, button, user_data = None):
 		# A button has been clicked
 		if button is self.button_overview_add_place:
 			new_place = StoragePlace(None, "Name", "Location", "Type")
 			self.add_place(new_place)
-		elif button is self.button_overview_remove_place:
+		elif button is self.button_overview_add_inner_place:
 			model, pathlist = self.treeview_overview_places_selection.get_selected_rows()
 			try:
-				id = model[pathlist[0]][self.COL_NAMES_PLACE["ID"]]
-				del model[pathlist[0]]
-				self.cur.execute("DELETE FROM `places` WHERE `id` = ?", (id, ))
+				parent_id = model[pathlist[0]][self.COL_NAMES_PLACE["ID"]]
 			except IndexError:
-				pass
+				return
+			
+			if not self._check_writable([self._get_place_store(parent_id)]):
+				return
+			
+			new_place = StoragePlace(None, "Name", "Location", "Type", parent_id)
+			self.add_place(new_place)
+			self.treeview_overview_places.expand_to_path(model.get_path(self.iters_places[new_place.id]))
+		elif button is self.button_overview_remove_place:
+			model, pathlist = self.treeview_overview_places_selection.get_selected_rows()
+			if not pathlist or not self._check_writable([model[path][self.COL_NAMES_PLACE["STORE"]] for path in pathlist]):
+				return
+			
+			ids = [model[path][self.COL_NAMES_PLACE["ID"]] for path in pathlist]
+			if any(model[path][self.COL_NAMES_PLACE["ITEMS"]] or model.iter_has_child(model.get_iter(path)) for path in pathlist):
+				# Only ask what to do with what's inside them if there is something
+				choice = self._ask_place_removal(len(ids))
+				if choice is None or not self._check_writable([self._get_place_store(choice[0])]):
+					return
+			else:
+				choice = (None, False)
+			
+			if not self.remove_places(ids, *choice):
+				self._show_error("The items can't be moved to a place that's being removed.")
 		elif button is self.button_search_add_item:
 			new_item = Item(None, "Name", None, "", 1)
 			self.add_item(new_item)
 		elif button is self.button_search_remove_item:
-			model, pathlist = self.treeview_search_items_selection.get_selected_rows()
-			try:
-				id = model[pathlist[0]][self.COL_NAMES_ITEM["ID"]]
-				del model[pathlist[0]]
-				self.cur.execute("DELETE FROM `items` WHERE `id` = ?", (id, ))
-			except IndexError:
-				pass
+			if self._check_writable(self._selected_stores(self.treeview_search_items_selection)):
+				self.remove_items(self._selected_items(self.treeview_search_items_selection))
+		elif button is self.button_search_move_items:
+			if not self._check_writable(self._selected_stores(self.treeview_search_items_selection)):
+				return
+			
+			items = self._selected_items(self.treeview_search_items_selection)
+			place_id = self._ask_place(len(items)) if items else None
+			if place_id is not None and self._check_writable([self._get_place_store(place_id)]):
+				self.move_items(items, place_id)
+		elif button is self.button_search_change_amounts:
+			if not self._check_writable(self._selected_stores(self.treeview_search_items_selection)):
+				return
+			
+			items = self._selected_items(self.treeview_search_items_selection)
+			text = self._ask_amount_change(len(items)) if items else None
+			if text is not None:
+				try:
+					self.change_amounts(items, text)
+				except ValueError:
+					self._show_error("%s is not an amount. Type a number to set the amounts, or a number with + or - to change them." % text)
 	
 	def build_ui(self):
 		"""
-		ITEM: Place ListStore
+		ITEM: Place TreeStore
 		"""
-		self.liststore_places = gtk.ListStore(str, str, str, str) # ID (not displayed), Name, Location, Type
+		self.treestore_places = gtk.TreeStore(gobject.TYPE_INT64, str, str, str, int, int, gobject.TYPE_INT64, str, str, str, str) # ID (not displayed), Name, Location, Type, Items, Total Amount (both including the places inside), Parent ID, Name Key, Location Key, Type Key (not displayed), Store
+		self._set_sort_funcs(self.treestore_places, self.SORT_KEY_COLUMNS_PLACE)
+		self.iters_places = {} # ID -> Iter
 		
 		"""
 		ITEM: Item ListStore
 		"""
-		self.liststore_items = gtk.ListStore(str, str, str, str, str, int) # ID (not displayed), Place ID (not displayed), Place Name (not always displayed), Name, Details, Amount
+		self.liststore_items = gtk.ListStore(gobject.TYPE_INT64, gobject.TYPE_INT64, str, str, str, int, str, str, str, str) # ID (not displayed), Place ID (not displayed), Place Name (not always displayed), Name, Details, Amount, Place Name Key, Name Key, Details Key (not displayed), Store
+		self._set_sort_funcs(self.liststore_items, self.SORT_KEY_COLUMNS_ITEM)
+		self.iters_items = {} # ID -> Iter
+		self.item_ids_by_place = {} # Place ID -> set of item IDs
+		self.liststore_items.connect('row-changed', self._sync_overview_views)
+		self.liststore_items.connect('row-inserted', self._recheck_search_row)
+		self.liststore_items.connect('row-changed', self._recheck_search_row)
+		self.sort_columns_items = {} # TreeViewColumn -> item column it sorts by
 		
 		"""
 		PAGE: Overview
@@ -327,47 +1598,74 @@ class GUI(object):
 		self.tvcolumn_overview_places_name_renderer = gtk.CellRendererText()
 		self.tvcolumn_overview_places_location_renderer = gtk.CellRendererText()
 		self.tvcolumn_overview_places_type_renderer = gtk.CellRendererText()
+		self.tvcolumn_overview_places_items_renderer = gtk.CellRendererText()
+		self.tvcolumn_overview_places_amount_renderer = gtk.CellRendererText()
+		self.tvcolumn_overview_places_store_renderer = gtk.CellRendererText()
 		
 		# Make the renderers editable
 		self.tvcolumn_overview_places_name_renderer.set_property('editable', True)
 		self.tvcolumn_overview_places_location_renderer.set_property('editable', True)
 		self.tvcolumn_overview_places_type_renderer.set_property('editable', True)
 		
-		# Connect the renderer signals (the number is the column affected by the edit)
-		self.tvcolumn_overview_places_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_places, self.liststore_places, self.COL_NAMES_PLACE["NAME"]))
-		self.tvcolumn_overview_places_location_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_places, self.liststore_places, self.COL_NAMES_PLACE["LOCATION"]))
-		self.tvcolumn_overview_places_type_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_places, self.liststore_places, self.COL_NAMES_PLACE["TYPE"]))
-		
 		# Define TreeView columns
 		self.tvcolumn_overview_places_name = gtk.TreeViewColumn("Name")
 		self.tvcolumn_overview_places_location = gtk.TreeViewColumn("Location")
 		self.tvcolumn_overview_places_type = gtk.TreeViewColumn("Type")
+		self.tvcolumn_overview_places_items = gtk.TreeViewColumn("Items")
+		self.tvcolumn_overview_places_amount = gtk.TreeViewColumn("Amount")
+		self.tvcolumn_overview_places_store = gtk.TreeViewColumn("Store")
 		
 		# Add renderers to the columns
 		self.tvcolumn_overview_places_name.pack_start(self.tvcolumn_overview_places_name_renderer, True)
 		self.tvcolumn_overview_places_location.pack_start(self.tvcolumn_overview_places_location_renderer, True)
 		self.tvcolumn_overview_places_type.pack_start(self.tvcolumn_overview_places_type_renderer, True)
+		self.tvcolumn_overview_places_items.pack_start(self.tvcolumn_overview_places_items_renderer, True)
+		self.tvcolumn_overview_places_amount.pack_start(self.tvcolumn_overview_places_amount_renderer, True)
+		self.tvcolumn_overview_places_store.pack_start(self.tvcolumn_overview_places_store_renderer, True)
 		
 		# Link the renderers to the ListStore
 		self.tvcolumn_overview_places_name.add_attribute(self.tvcolumn_overview_places_name_renderer, 'text', self.COL_NAMES_PLACE["NAME"])
 		self.tvcolumn_overview_places_location.add_attribute(self.tvcolumn_overview_places_location_renderer, 'text', self.COL_NAMES_PLACE["LOCATION"])
 		self.tvcolumn_overview_places_type.add_attribute(self.tvcolumn_overview_places_type_renderer, 'text', self.COL_NAMES_PLACE["TYPE"])
+		self.tvcolumn_overview_places_items.add_attribute(self.tvcolumn_overview_places_items_renderer, 'text', self.COL_NAMES_PLACE["ITEMS"])
+		self.tvcolumn_overview_places_amount.add_attribute(self.tvcolumn_overview_places_amount_renderer, 'text', self.COL_NAMES_PLACE["AMOUNT"])
+		self.tvcolumn_overview_places_store.add_attribute(self.tvcolumn_overview_places_store_renderer, 'text', self.COL_NAMES_PLACE["STORE"])
 		
 		# Set extras for the columns
-		self.tvcolumn_overview_places_name.set_sort_column_id(self.COL_NAMES_PLACE["NAME"])
-		self.tvcolumn_overview_places_location.set_sort_column_id(self.COL_NAMES_PLACE["LOCATION"])
-		self.tvcolumn_overview_places_type.set_sort_column_id(self.COL_NAMES_PLACE["TYPE"])
+		self.tvcolumn_overview_places_name.set_sort_column_id(self.COL_NAMES_PLACE["NAME_KEY"])
+		self.tvcolumn_overview_places_location.set_sort_column_id(self.COL_NAMES_PLACE["LOCATION_KEY"])
+		self.tvcolumn_overview_places_type.set_sort_column_id(self.COL_NAMES_PLACE["TYPE_KEY"])
+		self.tvcolumn_overview_places_items.set_sort_column_id(self.COL_NAMES_PLACE["ITEMS"])
+		self.tvcolumn_overview_places_amount.set_sort_column_id(self.COL_NAMES_PLACE["AMOUNT"])
+		self.tvcolumn_overview_places_store.set_sort_column_id(self.COL_NAMES_PLACE["STORE"])
+		
+		# The store is only worth showing if there is more than one
+		self.tvcolumn_overview_places_store.set_visible(len(self.stores) > 1)
 		
 		# Build the TreeView
-		self.treeview_overview_places = gtk.TreeView(self.liststore_places)
+		self.treeview_overview_places = gtk.TreeView()
 		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_name)
 		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_location)
 		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_type)
+		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_items)
+		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_amount)
+		self.treeview_overview_places.append_column(self.tvcolumn_overview_places_store)
 		
 		# Connect the signals
 		self.treeview_overview_places_selection = self.treeview_overview_places.get_selection()
+		self.treeview_overview_places_selection.set_mode(gtk.SELECTION_MULTIPLE)
 		self.treeview_overview_places_selection.connect('changed', self.callback_treeview_overview_places_changed)
 		
+		# Places are moved into other places by dragging them there
+		self.treeview_overview_places.enable_model_drag_source(gtk.gdk.BUTTON1_MASK, self.PLACE_DRAG_TARGETS, gtk.gdk.ACTION_MOVE)
+		self.treeview_overview_places.enable_model_drag_dest(self.PLACE_DRAG_TARGETS, gtk.gdk.ACTION_MOVE)
+		self.treeview_overview_places.connect('drag-data-received', self.callback_treeview_overview_places_drag_data_received)
+		
+		# Connect the renderer signals (the number is the column affected by the edit)
+		self.tvcolumn_overview_places_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_places, self.treestore_places, self.COL_NAMES_PLACE["NAME"]))
+		self.tvcolumn_overview_places_location_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_places, self.treestore_places, self.COL_NAMES_PLACE["LOCATION"]))
+		self.tvcolumn_overview_places_type_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_places, self.treestore_places, self.COL_NAMES_PLACE["TYPE"]))
+		
 		# Scrolled Window
 		self.scroll_treeview_overview_places = gtk.ScrolledWindow()
 		
@@ -388,61 +1686,64 @@ class GUI(object):
 		PAGE: Overview
 		ITEM: Item TreeView
 		"""
-		# ListStore filter (for filtering based on place)
-		def _filter_overview_items(model, iter, user_data = None):
-			if self.FILTER_OVERVIEW_ITEMS_PLACE_ID is None:
-				return True
-			
-			return model[iter][self.COL_NAMES_ITEM["PLACE_ID"]] == self.FILTER_OVERVIEW_ITEMS_PLACE_ID
-		
-		self.liststore_filter_overview_items = self.liststore_items.filter_new()
-		self.liststore_filter_overview_items.set_visible_func(_filter_overview_items, data = None)
-		
 		# CellRenderer for the TreeView columns
 		self.tvcolumn_overview_items_name_renderer = gtk.CellRendererText()
 		self.tvcolumn_overview_items_details_renderer = gtk.CellRendererText()
 		self.tvcolumn_overview_items_amount_renderer = gtk.CellRendererText()
+		self.tvcolumn_overview_items_store_renderer = gtk.CellRendererText()
 		
 		# Make the renderers editable
 		self.tvcolumn_overview_items_name_renderer.set_property('editable', True)
 		self.tvcolumn_overview_items_details_renderer.set_property('editable', True)
 		self.tvcolumn_overview_items_amount_renderer.set_property('editable', True)
 		
-		# Connect the renderer signals (the number is the column affected by the edit)
-		self.tvcolumn_overview_items_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_overview_items, self.liststore_items, self.COL_NAMES_ITEM["NAME"]))
-		self.tvcolumn_overview_items_details_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_overview_items, self.liststore_items, self.COL_NAMES_ITEM["DETAILS"]))
-		self.tvcolumn_overview_items_amount_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_overview_items, self.liststore_items, self.COL_NAMES_ITEM["AMOUNT"]))
-		
 		# Define TreeView columns
 		self.tvcolumn_overview_items_name = gtk.TreeViewColumn("Name")
 		self.tvcolumn_overview_items_details = gtk.TreeViewColumn("Details")
 		self.tvcolumn_overview_items_amount = gtk.TreeViewColumn("Amount")
+		self.tvcolumn_overview_items_store = gtk.TreeViewColumn("Store")
 		
 		# Add renderers to the columns
 		self.tvcolumn_overview_items_name.pack_start(self.tvcolumn_overview_items_name_renderer, True)
 		self.tvcolumn_overview_items_details.pack_start(self.tvcolumn_overview_items_details_renderer, True)
 		self.tvcolumn_overview_items_amount.pack_start(self.tvcolumn_overview_items_amount_renderer, True)
+		self.tvcolumn_overview_items_store.pack_start(self.tvcolumn_overview_items_store_renderer, True)
 		
 		# Link the renderers to the ListStore
 		self.tvcolumn_overview_items_name.add_attribute(self.tvcolumn_overview_items_name_renderer, 'text', self.COL_NAMES_ITEM["NAME"])
 		self.tvcolumn_overview_items_details.add_attribute(self.tvcolumn_overview_items_details_renderer, 'text', self.COL_NAMES_ITEM["DETAILS"])
 		self.tvcolumn_overview_items_amount.add_attribute(self.tvcolumn_overview_items_amount_renderer, 'text', self.COL_NAMES_ITEM["AMOUNT"])
+		self.tvcolumn_overview_items_store.add_attribute(self.tvcolumn_overview_items_store_renderer, 'text', self.COL_NAMES_ITEM["STORE"])
 		
 		# Set extras for the columns
-		self.tvcolumn_overview_items_name.set_sort_column_id(self.COL_NAMES_ITEM["NAME"])
-		self.tvcolumn_overview_items_details.set_sort_column_id(self.COL_NAMES_ITEM["DETAILS"])
+		self.tvcolumn_overview_items_name.set_sort_column_id(self.COL_NAMES_ITEM["NAME_KEY"])
+		self.tvcolumn_overview_items_details.set_sort_column_id(self.COL_NAMES_ITEM["DETAILS_KEY"])
 		self.tvcolumn_overview_items_amount.set_sort_column_id(self.COL_NAMES_ITEM["AMOUNT"])
+		self.tvcolumn_overview_items_store.set_sort_column_id(self.COL_NAMES_ITEM["STORE"])
+		self.tvcolumn_overview_items_store.set_visible(len(self.stores) > 1)
+		
+		for tvcolumn in (self.tvcolumn_overview_items_name, self.tvcolumn_overview_items_details, self.tvcolumn_overview_items_amount, self.tvcolumn_overview_items_store):
+			self.sort_columns_items[tvcolumn] = tvcolumn.get_sort_column_id()
 		
 		# Build the TreeView
-		self.treeview_overview_items = gtk.TreeView(self.liststore_filter_overview_items)
+		self.treeview_overview_items = gtk.TreeView()
 		self.treeview_overview_items.append_column(self.tvcolumn_overview_items_name)
 		self.treeview_overview_items.append_column(self.tvcolumn_overview_items_details)
 		self.treeview_overview_items.append_column(self.tvcolumn_overview_items_amount)
+		self.treeview_overview_items.append_column(self.tvcolumn_overview_items_store)
 		
 		# Connect the signals
 		self.treeview_overview_items_selection = self.treeview_overview_items.get_selection()
 		self.treeview_overview_items_selection.connect('changed', self.callback_treeview_overview_items_changed)
 		
+		for tvcolumn in self.treeview_overview_items.get_columns():
+			tvcolumn.connect('clicked', self.callback_treeview_column_clicked, self.treeview_overview_items)
+		
+		# Connect the renderer signals (the number is the column affected by the edit)
+		self.tvcolumn_overview_items_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_items, self.liststore_items, self.COL_NAMES_ITEM["NAME"]))
+		self.tvcolumn_overview_items_details_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_items, self.liststore_items, self.COL_NAMES_ITEM["DETAILS"]))
+		self.tvcolumn_overview_items_amount_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_overview_items, self.liststore_items, self.COL_NAMES_ITEM["AMOUNT"]))
+		
 		# Scrolled Window
 		self.scroll_treeview_overview_items = gtk.ScrolledWindow()
 		
@@ -467,12 +1768,21 @@ class GUI(object):
 		self.hbox_overview_frames.pack_start(self.frame_overview_place_list)
 		self.hbox_overview_frames.pack_start(self.frame_overview_item_list)
 		
+		"""
+		PAGE: Overview
+		ITEM: Summary
+		"""
+		self.label_overview_summary = gtk.Label()
+		self.label_overview_summary.set_alignment(0, 0.5)
+		
 		"""
 		PAGE: Overview
 		ITEM: Buttons
 		"""
 		self.button_overview_add_place = gtk.Button("Add Place")
 		self.button_overview_add_place.connect('clicked', self.callback_button_clicked)
+		self.button_overview_add_inner_place = gtk.Button("Add Place Inside")
+		self.button_overview_add_inner_place.connect('clicked', self.callback_button_clicked)
 		self.button_overview_remove_place = gtk.Button("Remove Place")
 		self.button_overview_remove_place.connect('clicked', self.callback_button_clicked)
 		
@@ -482,6 +1792,7 @@ class GUI(object):
 		"""
 		self.hbox_overview_buttons = gtk.HBox(spacing = 5)
 		self.hbox_overview_buttons.pack_start(self.button_overview_add_place)
+		self.hbox_overview_buttons.pack_start(self.button_overview_add_inner_place)
 		self.hbox_overview_buttons.pack_start(self.button_overview_remove_place)
 		
 		"""
@@ -490,6 +1801,7 @@ class GUI(object):
 		"""
 		self.vbox_overview = gtk.VBox(spacing = 5)
 		self.vbox_overview.pack_start(self.hbox_overview_frames)
+		self.vbox_overview.pack_start(self.label_overview_summary, expand = False)
 		self.vbox_overview.pack_start(self.hbox_overview_buttons, expand = False)
 		
 		"""
@@ -509,77 +1821,80 @@ class GUI(object):
 		PAGE: Search
 		ITEM: Results TreeView
 		"""
-		# ListStore filter (for filtering based on search term)
-		def _filter_search_items(model, iter, user_data = None):
-			if model[iter][3] is None:
-				return True
-			
-			return self.entry_search_term.get_text().lower() in model[iter][3].lower()
-		
-		self.liststore_filter_search_items = self.liststore_items.filter_new()
-		self.liststore_filter_search_items.set_visible_func(_filter_search_items, data = None)
-		
 		# CellRenderer for the TreeView columns
 		self.tvcolumn_search_items_name_renderer = gtk.CellRendererText()
 		self.tvcolumn_search_items_place_renderer = gtk.CellRendererCombo()
 		self.tvcolumn_search_items_details_renderer = gtk.CellRendererText()
 		self.tvcolumn_search_items_amount_renderer = gtk.CellRendererText()
+		self.tvcolumn_search_items_store_renderer = gtk.CellRendererText()
 		
 		# Make the renderers editable
 		self.tvcolumn_search_items_name_renderer.set_property('editable', True)
 		self.tvcolumn_search_items_place_renderer.set_property('editable', True)
 		
 		self.tvcolumn_search_items_place_renderer.set_property('has-entry', False)
-		self.tvcolumn_search_items_place_renderer.set_property('model', self.liststore_places)
 		self.tvcolumn_search_items_place_renderer.set_property('text-column', self.COL_NAMES_PLACE["NAME"])
 		
 		self.tvcolumn_search_items_details_renderer.set_property('editable', True)
 		self.tvcolumn_search_items_amount_renderer.set_property('editable', True)
 		
-		# Connect the renderer signals (the number is the column affected by the edit)
-		self.tvcolumn_search_items_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_search_items, self.liststore_items, self.COL_NAMES_ITEM["NAME"]))
-		
-		self.tvcolumn_search_items_place_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_search_items, self.liststore_items, self.COL_NAMES_ITEM["PLACE_NAME"]))
-		self.tvcolumn_search_items_place_renderer.connect('changed', self.callback_treeview_cell_item_place_changed, (self.liststore_filter_search_items, self.liststore_items))
-		
-		self.tvcolumn_search_items_details_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_search_items, self.liststore_items, self.COL_NAMES_ITEM["DETAILS"]))
-		self.tvcolumn_search_items_amount_renderer.connect('edited', self.callback_treeview_cell_edited, (self.liststore_filter_search_items, self.liststore_items, self.COL_NAMES_ITEM["AMOUNT"]))
-		
 		# Define TreeView columns
 		self.tvcolumn_search_items_name = gtk.TreeViewColumn("Name")
 		self.tvcolumn_search_items_place = gtk.TreeViewColumn("Place")
 		self.tvcolumn_search_items_details = gtk.TreeViewColumn("Details")
 		self.tvcolumn_search_items_amount = gtk.TreeViewColumn("Amount")
+		self.tvcolumn_search_items_store = gtk.TreeViewColumn("Store")
 		
 		# Add renderers to the columns
 		self.tvcolumn_search_items_name.pack_start(self.tvcolumn_search_items_name_renderer, True)
 		self.tvcolumn_search_items_place.pack_start(self.tvcolumn_search_items_place_renderer, True)
 		self.tvcolumn_search_items_details.pack_start(self.tvcolumn_search_items_details_renderer, True)
 		self.tvcolumn_search_items_amount.pack_start(self.tvcolumn_search_items_amount_renderer, True)
+		self.tvcolumn_search_items_store.pack_start(self.tvcolumn_search_items_store_renderer, True)
 		
 		# Link the renderers to the ListStore
 		self.tvcolumn_search_items_name.add_attribute(self.tvcolumn_search_items_name_renderer, 'text', self.COL_NAMES_ITEM["NAME"])
 		self.tvcolumn_search_items_place.add_attribute(self.tvcolumn_search_items_place_renderer, 'text', self.COL_NAMES_ITEM["PLACE_NAME"])
 		self.tvcolumn_search_items_details.add_attribute(self.tvcolumn_search_items_details_renderer, 'text', self.COL_NAMES_ITEM["DETAILS"])
 		self.tvcolumn_search_items_amount.add_attribute(self.tvcolumn_search_items_amount_renderer, 'text', self.COL_NAMES_ITEM["AMOUNT"])
+		self.tvcolumn_search_items_store.add_attribute(self.tvcolumn_search_items_store_renderer, 'text', self.COL_NAMES_ITEM["STORE"])
 		
 		# Set extras for the columns
-		self.tvcolumn_search_items_name.set_sort_column_id(self.COL_NAMES_ITEM["NAME"])
-		self.tvcolumn_search_items_place.set_sort_column_id(self.COL_NAMES_ITEM["PLACE_NAME"])
-		self.tvcolumn_search_items_details.set_sort_column_id(self.COL_NAMES_ITEM["DETAILS"])
+		self.tvcolumn_search_items_name.set_sort_column_id(self.COL_NAMES_ITEM["NAME_KEY"])
+		self.tvcolumn_search_items_place.set_sort_column_id(self.COL_NAMES_ITEM["PLACE_NAME_KEY"])
+		self.tvcolumn_search_items_details.set_sort_column_id(self.COL_NAMES_ITEM["DETAILS_KEY"])
 		self.tvcolumn_search_items_amount.set_sort_column_id(self.COL_NAMES_ITEM["AMOUNT"])
+		self.tvcolumn_search_items_store.set_sort_column_id(self.COL_NAMES_ITEM["STORE"])
+		self.tvcolumn_search_items_store.set_visible(len(self.stores) > 1)
+		
+		for tvcolumn in (self.tvcolumn_search_items_name, self.tvcolumn_search_items_place, self.tvcolumn_search_items_details, self.tvcolumn_search_items_amount, self.tvcolumn_search_items_store):
+			self.sort_columns_items[tvcolumn] = tvcolumn.get_sort_column_id()
 		
 		# Build the TreeView
-		self.treeview_search_items = gtk.TreeView(self.liststore_filter_search_items)
+		self.treeview_search_items = gtk.TreeView()
 		self.treeview_search_items.append_column(self.tvcolumn_search_items_name)
 		self.treeview_search_items.append_column(self.tvcolumn_search_items_place)
 		self.treeview_search_items.append_column(self.tvcolumn_search_items_details)
 		self.treeview_search_items.append_column(self.tvcolumn_search_items_amount)
+		self.treeview_search_items.append_column(self.tvcolumn_search_items_store)
 		
 		# Connect the signals
 		self.treeview_search_items_selection = self.treeview_search_items.get_selection()
+		self.treeview_search_items_selection.set_mode(gtk.SELECTION_MULTIPLE)
 		self.treeview_search_items_selection.connect('changed', self.callback_treeview_search_items_changed)
 		
+		for tvcolumn in self.treeview_search_items.get_columns():
+			tvcolumn.connect('clicked', self.callback_treeview_column_clicked, self.treeview_search_items)
+		
+		# Connect the renderer signals (the number is the column affected by the edit)
+		self.tvcolumn_search_items_name_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_search_items, self.liststore_items, self.COL_NAMES_ITEM["NAME"]))
+		
+		self.tvcolumn_search_items_place_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_search_items, self.liststore_items, self.COL_NAMES_ITEM["PLACE_NAME"]))
+		self.tvcolumn_search_items_place_renderer.connect('changed', self.callback_treeview_cell_item_place_changed, (self.treeview_search_items, self.liststore_items))
+		
+		self.tvcolumn_search_items_details_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_search_items, self.liststore_items, self.COL_NAMES_ITEM["DETAILS"]))
+		self.tvcolumn_search_items_amount_renderer.connect('edited', self.callback_treeview_cell_edited, (self.treeview_search_items, self.liststore_items, self.COL_NAMES_ITEM["AMOUNT"]))
+		
 		# Scrolled Window
 		self.scroll_treeview_search_items = gtk.ScrolledWindow()
 		
@@ -598,8 +1913,12 @@ class GUI(object):
 		"""
 		self.button_search_add_item = gtk.Button("Add Item")
 		self.button_search_add_item.connect('clicked', self.callback_button_clicked)
-		self.button_search_remove_item = gtk.Button("Remove Item")
+		self.button_search_remove_item = gtk.Button("Remove Items")
 		self.button_search_remove_item.connect('clicked', self.callback_button_clicked)
+		self.button_search_move_items = gtk.Button("Move Items")
+		self.button_search_move_items.connect('clicked', self.callback_button_clicked)
+		self.button_search_change_amounts = gtk.Button("Change Amounts")
+		self.button_search_change_amounts.connect('clicked', self.callback_button_clicked)
 		
 		"""
 		PAGE: Search
@@ -608,6 +1927,8 @@ class GUI(object):
 		self.hbox_search_buttons = gtk.HBox(spacing = 5)
 		self.hbox_search_buttons.pack_start(self.button_search_add_item)
 		self.hbox_search_buttons.pack_start(self.button_search_remove_item)
+		self.hbox_search_buttons.pack_start(self.button_search_move_items)
+		self.hbox_search_buttons.pack_start(self.button_search_change_amounts)
 		
 		"""
 		PAGE: Search
@@ -632,18 +1953,70 @@ class GUI(object):
 		self.hbox_main = gtk.HBox(spacing = 10)
 		self.hbox_main.pack_start(self.notebook_main)
 		
+		"""
+		ITEM: Loading Progress
+		"""
+		self.progressbar_load = gtk.ProgressBar()
+		self.progressbar_load.set_text("Loading items...")
+		self.progressbar_load.set_no_show_all(True)
+		
+		"""
+		ITEM: Main VBox
+		"""
+		self.vbox_main = gtk.VBox(spacing = 5)
+		self.vbox_main.pack_start(self.hbox_main)
+		self.vbox_main.pack_start(self.progressbar_load, expand = False)
+		
 		"""
 		ITEM: Main Window
 		"""
-		self.window.add(self.hbox_main)
+		self._attach_models()
+		self.window.add(self.vbox_main)
 		self.window.show_all()
 	
 	def run(self):
 		gtk.main()
 	
-	def quit(self, widget, data = None):
-		# The user wants to quit the application
-		self.db.commit()
+	def close(self):
+		# Write the remaining changes and close the database
+		self.closed = True
+		gobject.source_remove(self.change_poll)
+		if self.backups is not None:
+			gobject.source_remove(self.backup_timeout)
+			self.backups.cancel()
+		
+		self.writer.close()
+		self._write_snapshot()
+		try:
+			prune_change_log(self.db, self.CHANGE_LOG_SIZE)
+			maybe_checkpoint(self.db)
+		except sqlite3.OperationalError:
+			# Another instance is busy writing, the log is pruned and the amounts are checkpointed the next time
+			pass
 		self.cur.close()
 		self.db.close()
+		if self.instrumentation is not None:
+			self.instrumentation.dump()
+	
+	def _write_snapshot(self):
+		# Save the rows for the next start, unless they might not match the database
+		if self.snapshot_file is None or self.lazy_items or self.loader is not None or self.write_failed:
+			return
+		
+		# Pick up the changes of other instances, and don't save anything if there are more of them coming in meanwhile
+		self._poll_changes()
+		change_counter = get_change_counter(self.db)
+		if get_data_version(self.db) != self.data_versions.get('main') or self.deferred_changes or self.loader is not None:
+			return
+		
+		try:
+			write_snapshot(self.snapshot_file, SCHEMA_VERSION, change_counter,
+				(tuple(self.treestore_places[tree_iter]) for tree_iter in self._iter_place_iters()), (tuple(row) for row in self.liststore_items))
+		except (EnvironmentError, ValueError):
+			# The snapshot only saves time, so starting without one next time is fine
+			pass
+	
+	def quit(self, widget, data = None):
+		# The user wants to quit the application
+		self.close()
 		gtk.main_quit()
\ No newline at end of file
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Command line interface, for working with the database without a GUI
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from storeman_backup import BackupManager, restore_backup
+from storeman_collation import fold, sort_key
+from storeman_db import default_database_path, open_database
+from storeman_http import APIServer
+from storeman_ledger import REASON_IMPORT, create_checkpoint, parse_time, stock_as_of, movement_totals
+from storeman_models import StoragePlace, Item, ID_GENERATOR, to_unicode
+
+# Columns of the exchange formats, in file order
+COLUMNS = {
+	'places': ('id', 'name', 'location', 'type', 'parent_id'),
+	'items': ('id', 'name', 'place_id', 'details', 'amount'),
+}
+
+# Number of rows written to or read from the database at once
+BATCH_SIZE = 5000
+
+# Statements to import a batch of rows, run in this order: existing rows are updated first, then new ones are inserted
+# The amounts of existing items are changed by recording the difference as a movement
+# Items referring to a place that doesn't exist are imported without a place
+IMPORT_QUERIES = {
+	'places': (
+		"UPDATE `places` SET `name` = ?, `location` = ?, `type` = ?, `name_key` = ?, `name_folded` = ?, `location_folded` = ?, `type_folded` = ? WHERE `id` = ?",
+		"INSERT OR IGNORE INTO `places` (id, name, location, type, name_key, name_folded, location_folded, type_folded) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+		"INSERT OR REPLACE INTO temp.`import_parents` (id, parent_id) VALUES (?, ?)",
+	),
+	'items': (
+		"INSERT INTO `movements` (item_id, time, delta, reason) SELECT id, ?, ? - amount, ? FROM `items` WHERE `id` = ? AND amount <> ?",
+		"UPDATE `items` SET `name` = ?, `place_id` = (SELECT id FROM `places` WHERE id = ?), `details` = ?, `name_key` = ?, `details_key` = ?, `name_folded` = ?, `details_folded` = ? WHERE `id` = ?",
+		"INSERT OR IGNORE INTO `items` (id, name, place_id, details, amount, name_key, details_key, name_folded, details_folded) VALUES (?, ?, (SELECT id FROM `places` WHERE id = ?), ?, ?, ?, ?, ?, ?)",
+	),
+}
+
+# Places are put into their parents once all of them have been imported, so the parents can come later in the file
+# The parents are collected in a temporary table on the way, kept in a file so big imports don't have to fit into memory;
+# a parent that doesn't exist leaves the place at the top
+# Every place that is moved is taken out of its parent first, so the places can be moved into each other in any order
+IMPORT_PARENTS_TABLE = "CREATE TEMP TABLE IF NOT EXISTS `import_parents` (id INTEGER PRIMARY KEY, parent_id INTEGER)"
+IMPORT_PARENT = "(SELECT p.id FROM temp.`import_parents` i JOIN `places` p ON p.id = i.parent_id WHERE i.id = `places`.id)"
+IMPORT_PARENT_QUERIES = (
+	"UPDATE `places` SET `parent_id` = NULL WHERE `id` IN (SELECT id FROM temp.`import_parents`) AND `parent_id` IS NOT %s" % IMPORT_PARENT,
+	"UPDATE `places` SET `parent_id` = %s WHERE `id` IN (SELECT id FROM temp.`import_parents`) AND `parent_id` IS NOT %s" % (IMPORT_PARENT, IMPORT_PARENT),
+)
+
+# The parent a place will have once the parents have been set
+IMPORT_NEW_PARENT = """(SELECT CASE WHEN i.id IS NULL THEN p.parent_id ELSE (SELECT id FROM `places` WHERE id = i.parent_id) END
+	FROM `places` p LEFT JOIN temp.`import_parents` i ON i.id = p.id WHERE p.id = %s)"""
+
+# The imported places that would end up inside themselves, found by following each one up to the top
+# It's wrapped in a SELECT, as the sqlite3 module would commit the import before a statement starting with WITH
+IMPORT_CYCLES_QUERY = """SELECT start FROM (WITH RECURSIVE `walk` (start, id) AS (
+		SELECT s.id, %s FROM temp.`import_parents` s
+		UNION SELECT start, %s FROM `walk` WHERE id IS NOT NULL AND id <> start)
+	SELECT start FROM `walk` WHERE id = start) ORDER BY start""" % (IMPORT_NEW_PARENT % "s.id", IMPORT_NEW_PARENT % "`walk`.id")
+
+def _guess_format(filename, format):
+	# Use the given format or guess it from the file name
+	if format:
+		return format
+	
+	if filename.lower().endswith(".csv"):
+		return 'csv'
+	
+	return 'jsonl'
+
+def read_rows(fileobj, format):
+	# Read dictionaries from a CSV or JSON lines file, one at a time
+	if format == 'csv':
+		for row in csv.DictReader(fileobj):
+			yield dict((key, to_unicode(value)) for key, value in row.iteritems())
+	else:
+		for line in fileobj:
+			if line.strip():
+				yield json.loads(line)
+
+def _blank_to_none(value):
+	if value is None or (isinstance(value, basestring) and not value.strip()):
+		return None
+	
+	return value
+
+def _parse_id(value, new_ids = None):
+	# Parse an integer ID, taking a new one from new_ids if there is none
+	value = _blank_to_none(value)
+	if value is None:
+		return next(new_ids) if new_ids is not None else None
+	
+	try:
+		return int(value)
+	except ValueError:
+		raise ValueError("Invalid id %r, ids have to be integers" % value)
+
+def _place_from_row(row, new_ids):
+	# Validate an imported row by turning it into a StoragePlace
+	return StoragePlace.from_db_entry({
+		'id': _parse_id(row.get('id'), new_ids),
+		'name': row.get('name') or u"",
+		'location': row.get('location') or u"",
+		'type': row.get('type') or u"",
+		'parent_id': _parse_id(row.get('parent_id')),
+	})
+
+def _item_from_row(row, new_ids):
+	# Validate an imported row by turning it into an Item
+	amount = _blank_to_none(row.get('amount'))
+	return Item.from_db_entry({
+		'id': _parse_id(row.get('id'), new_ids),
+		'name': row.get('name') or u"",
+		'place_id': _parse_id(row.get('place_id')),
+		'details': row.get('details') or u"",
+		'amount': int(amount) if amount is not None else 1,
+	})
+
+def _import_params(table, entry, now):
+	# Get the parameters of each of the import statements for a row
+	if table == 'places':
+		keys = (sort_key(entry['name']), fold(entry['name']), fold(entry['location']), fold(entry['type']))
+		return ((entry['name'], entry['location'], entry['type']) + keys + (entry['id'], ),
+			(entry['id'], entry['name'], entry['location'], entry['type']) + keys,
+			(entry['id'], entry['parent_id']))
+	else:
+		keys = (sort_key(entry['name']), sort_key(entry['details']), fold(entry['name']), fold(entry['details']))
+		return ((now, entry['amount'], REASON_IMPORT, entry['id'], entry['amount']),
+			(entry['name'], entry['place_id'], entry['details']) + keys + (entry['id'], ),
+			(entry['id'], entry['name'], entry['place_id'], entry['details'], entry['amount']) + keys)
+
+def import_rows(db, table, rows, batch_size = BATCH_SIZE):
+	# Import an iterable of row dictionaries in batches, all in one transaction
+	to_object = _place_from_row if table == 'places' else _item_from_row
+	cur = db.cursor()
+	count = 0
+	now = int(time.time())
+	
+	# Rows without an ID get one from blocks reserved in advance
+	new_ids = ID_GENERATOR.iter_ids(batch_size)
+	
+	if table == 'places':
+		# Creating a table would commit the transaction, so it has to happen before anything is written
+		# The temporary storage can only be switched outside of a transaction as well, and that drops all temporary tables
+		temp_store = cur.execute("PRAGMA temp_store").fetchone()[0]
+		cur.execute("PRAGMA temp_store = FILE")
+		cur.execute(IMPORT_PARENTS_TABLE)
+	
+	def _write(batch):
+		for index, query in enumerate(IMPORT_QUERIES[table]):
+			cur.executemany(query, [params[index] for params in batch])
+	
+	try:
+		batch = []
+		for row in rows:
+			entry = to_object(row, new_ids).to_db_entry()
+			batch.append(_import_params(table, entry, now))
+			if len(batch) >= batch_size:
+				_write(batch)
+				count += len(batch)
+				batch = []
+		
+		if batch:
+			_write(batch)
+			count += len(batch)
+		
+		if table == 'places':
+			# The places are only checked as a whole, so a cycle is reported before anything is moved
+			cycle = [row[0] for row in cur.execute(IMPORT_CYCLES_QUERY)]
+			if cycle:
+				raise ValueError("These places would end up inside themselves, nothing has been imported: %s" % ", ".join(str(id) for id in cycle))
+			
+			for query in IMPORT_PARENT_QUERIES:
+				cur.execute(query)
+		db.commit()
+	except:
+		db.rollback()
+		raise
+	finally:
+		if table == 'places':
+			cur.execute("DROP TABLE IF EXISTS temp.`import_parents`")
+			cur.execute("PRAGMA temp_store = %i" % temp_store)
+		cur.close()
+	
+	return count
+
+def export_rows(db, table, fileobj, format, batch_size = BATCH_SIZE):
+	# Write all rows of a table to a file, reading them from the database in batches
+	columns = COLUMNS[table]
+	cur = db.cursor()
+	cur.row_factory = None
+	cur.execute("SELECT %s FROM `%s`" % (", ".join("`%s`" % column for column in columns), table))
+	count = 0
+	
+	if format == 'csv':
+		writer = csv.writer(fileobj)
+		writer.writerow(columns)
+		write = lambda row: writer.writerow([value.encode('utf-8') if isinstance(value, unicode) else ("" if value is None else value) for value in row])
+	else:
+		write = lambda row: fileobj.write(json.dumps(dict(zip(columns, row)), ensure_ascii = False).encode('utf-8') + "\n")
+	
+	rows = cur.fetchmany(batch_size)
+	while rows:
+		for row in rows:
+			write(row)
+		count += len(rows)
+		rows = cur.fetchmany(batch_size)
+	
+	cur.close()
+	return count
+
+def command_import(db, args):
+	format = _guess_format(args.file, args.format)
+	fileobj = sys.stdin if args.file == "-" else open(args.file, 'rb')
+	try:
+		count = import_rows(db, args.table, read_rows(fileobj, format))
+	finally:
+		if fileobj is not sys.stdin:
+			fileobj.close()
+	
+	sys.stderr.write("Imported %i %s\n" % (count, args.table))
+
+def command_export(db, args):
+	format = _guess_format(args.file, args.format)
+	fileobj = sys.stdout if args.file == "-" else open(args.file, 'wb')
+	try:
+		count = export_rows(db, args.table, fileobj, format)
+	finally:
+		if fileobj is not sys.stdout:
+			fileobj.close()
+	
+	sys.stderr.write("Exported %i %s\n" % (count, args.table))
+
+def command_stock(db, args):
+	# Show the amounts of all items at a point in time, or what has been added and taken in a period
+	names = dict(db.execute("SELECT id, name FROM `items`").fetchall())
+	if args.since is not None:
+		until = parse_time(args.until) if args.until else int(time.time())
+		totals = movement_totals(db, parse_time(args.since), until)
+		sys.stdout.write("id\tname\tadded\ttaken\n")
+		for id, (added, taken) in sorted(totals.iteritems(), key = lambda (id, totals): names.get(id, u"")):
+			sys.stdout.write((u"%i\t%s\t%i\t%i\n" % (id, names.get(id, u"(removed)"), added, taken)).encode('utf-8'))
+		return
+	
+	amounts = stock_as_of(db, parse_time(args.as_of) if args.as_of else int(time.time()))
+	sys.stdout.write("id\tname\tamount\n")
+	for id, amount in sorted(amounts.iteritems(), key = lambda (id, amount): names.get(id, u"")):
+		sys.stdout.write((u"%i\t%s\t%i\n" % (id, names.get(id, u"(removed)"), amount)).encode('utf-8'))
+
+def command_checkpoint(db, args):
+	checkpoint_id = create_checkpoint(db)
+	sys.stderr.write("Made checkpoint %i\n" % checkpoint_id)
+
+def command_backup(db, args):
+	directory = args.directory or os.path.join(os.path.dirname(args.database), "backups")
+	backups = BackupManager(args.database, directory, generations = args.generations, incremental = not args.full, full_every = args.generations)
+	filename = backups.backup()
+	sys.stderr.write("Wrote %s\n" % filename)
+
+def command_restore(db, args):
+	restore_backup(args.backup, args.target)
+	sys.stderr.write("Restored %s into %s\n" % (args.backup, args.target))
+
+def command_serve(db, args):
+	# Serve the database over HTTP until interrupted
+	server = APIServer(args.database, host = args.host, port = args.port, log = None if args.quiet else lambda line: sys.stderr.write(line + "\n"))
+	sys.stderr.write("Serving %s on http://%s:%i/\n" % (args.database, server.address[0], server.address[1]))
+	try:
+		server.serve_forever()
+	finally:
+		server.stop()
+
+def build_parser():
+	parser = argparse.ArgumentParser(description = "Manage a pyStoreMan database without the GUI")
+	parser.add_argument('-d', '--database', default = None, help = "Database file (default: ~/.pyStoreMan/storeman.db)")
+	subparsers = parser.add_subparsers(title = "commands")
+	
+	parser_import = subparsers.add_parser('import', help = "Import places or items from a CSV or JSON lines file")
+	parser_import.add_argument('table', choices = sorted(COLUMNS))
+	parser_import.add_argument('file', help = "File to read, - for stdin")
+	parser_import.add_argument('-f', '--format', choices = ('csv', 'jsonl'), help = "File format (default: guessed from the file name)")
+	parser_import.set_defaults(func = command_import)
+	
+	parser_export = subparsers.add_parser('export', help = "Export places or items to a CSV or JSON lines file")
+	parser_export.add_argument('table', choices = sorted(COLUMNS))
+	parser_export.add_argument('file', nargs = '?', default = "-", help = "File to write, - for stdout (default)")
+	parser_export.add_argument('-f', '--format', choices = ('csv', 'jsonl'), help = "File format (default: guessed from the file name)")
+	parser_export.set_defaults(func = command_export)
+	
+	parser_stock = subparsers.add_parser('stock', help = "Show the amounts of all items at a point in time, or the amounts added and taken in a period")
+	parser_stock.add_argument('--as-of', default = None, help = "Date (YYYY-MM-DD [HH:MM]) to show the amounts of (default: now)")
+	parser_stock.add_argument('--since', default = None, help = "Show the amounts added and taken since this date instead")
+	parser_stock.add_argument('--until', default = None, help = "End of the period of --since (default: now)")
+	parser_stock.set_defaults(func = command_stock)
+	
+	parser_checkpoint = subparsers.add_parser('checkpoint', help = "Save the amounts of all items, which speeds up looking up older amounts")
+	parser_checkpoint.set_defaults(func = command_checkpoint)
+	
+	parser_backup = subparsers.add_parser('backup', help = "Make a backup of the database, only storing what has changed since the last one if possible")
+	parser_backup.add_argument('directory', nargs = '?', default = None, help = "Directory of the backups (default: ~/.pyStoreMan/backups)")
+	parser_backup.add_argument('-g', '--generations', type = int, default = 10, help = "Number of backups to keep (default: 10)")
+	parser_backup.add_argument('--full', action = 'store_true', help = "Make a full backup even if an incremental one would do")
+	parser_backup.set_defaults(func = command_backup)
+	
+	parser_restore = subparsers.add_parser('restore', help = "Restore a backup into a new database file")
+	parser_restore.add_argument('backup', help = "Backup file to restore, the backups it's based on have to be in the same directory")
+	parser_restore.add_argument('target', help = "Database file to create")
+	parser_restore.set_defaults(func = command_restore)
+	
+	parser_serve = subparsers.add_parser('serve', help = "Answer questions about the places and items with JSON over HTTP, read-only")
+	parser_serve.add_argument('--host', default = "127.0.0.1", help = "Address to listen on (default: 127.0.0.1, only this computer)")
+	parser_serve.add_argument('-p', '--port', type = int, default = 8080, help = "Port to listen on (default: 8080)")
+	parser_serve.add_argument('-q', '--quiet', action = 'store_true', help = "Don't log the requests")
+	parser_serve.set_defaults(func = command_serve)
+	
+	return parser
+
+def main(argv = None):
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	args.database = args.database or default_database_path()
+	db = open_database(args.database)
+	try:
+		args.func(db, args)
+	except ValueError as error:
+		# Bad input, e.g. in an import file, is reported like a bad argument
+		parser.exit(1, "%s: error: %s\n" % (parser.prog, error))
+	finally:
+		db.close()
+
+if __name__ == "__main__":
+	main()
\ No newline at end of file
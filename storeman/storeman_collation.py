@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Keys for comparing and sorting texts the way people expect: ignoring case, and numbers by their value
+"""
+
+import re
+import unicodedata
+
+NUMBERS = re.compile(r"[0-9]+")
+
+def fold(text):
+	# Get the case-folded form of a text, which searches compare
+	if text is None:
+		return u""
+	
+	if isinstance(text, str):
+		text = text.decode('utf-8')
+	
+	return unicodedata.normalize('NFKC', text).lower()
+
+def _number_key(match):
+	# Numbers are written as their number of digits followed by the digits, so a longer number sorts after a shorter one
+	digits = match.group(0).lstrip("0") or "0"
+	return u"%02i%s" % (min(len(digits), 99), digits)
+
+def sort_key(text):
+	# Get the key a text is sorted by, so "r2" < "R10" < "r10a"; comparing two keys is a plain comparison of strings
+	return NUMBERS.sub(_number_key, fold(text))
+
+def compare_keys(model, a, b, column):
+	# Sort function for a TreeSortable, comparing the sort keys kept in a hidden column
+	return cmp(model.get_value(a, column), model.get_value(b, column))
\ No newline at end of file
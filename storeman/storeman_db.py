@@ -0,0 +1,747 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Database schema and migrations
+"""
+
+import collections
+import itertools
+import os
+import Queue
+import sqlite3
+import threading
+import traceback
+
+from storeman_collation import fold, sort_key
+from storeman_models import ID_GENERATOR
+
+# The schema version this code expects, stored in PRAGMA user_version
+SCHEMA_VERSION = 10
+
+# Columns holding the sort key (see storeman_collation) of a text column, for every table; they're written along with the text
+SORT_KEY_COLUMNS = {
+	'places': {'name': 'name_key'},
+	'items': {'name': 'name_key', 'details': 'details_key'},
+}
+
+# Columns holding the case-folded form (see storeman_collation) of a text column, which the search queries compare (see storeman_query)
+FOLDED_COLUMNS = {
+	'places': {'name': 'name_folded', 'location': 'location_folded', 'type': 'type_folded'},
+	'items': {'name': 'name_folded', 'details': 'details_folded'},
+}
+
+def _migrate_to_1(cur):
+	# Version 0 databases have untyped tables without keys or indexes
+	cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('places', 'items')")
+	old_tables = [row[0] for row in cur.fetchall()]
+	for table in old_tables:
+		cur.execute("ALTER TABLE `%s` RENAME TO `%s_v0`" % (table, table))
+	
+	cur.execute("""CREATE TABLE `places` (
+		`id` TEXT NOT NULL PRIMARY KEY,
+		`name` TEXT NOT NULL DEFAULT '',
+		`location` TEXT NOT NULL DEFAULT '',
+		`type` TEXT NOT NULL DEFAULT ''
+	)""")
+	cur.execute("""CREATE TABLE `items` (
+		`id` TEXT NOT NULL PRIMARY KEY,
+		`name` TEXT NOT NULL DEFAULT '',
+		`place_id` TEXT REFERENCES `places` (`id`) ON DELETE SET NULL,
+		`details` TEXT NOT NULL DEFAULT '',
+		`amount` INTEGER NOT NULL DEFAULT 1
+	)""")
+	cur.execute("CREATE INDEX `items_place_id` ON `items` (`place_id`)")
+	
+	if 'places' in old_tables:
+		cur.execute("""INSERT OR IGNORE INTO `places` (id, name, location, type)
+			SELECT id, IFNULL(name, ''), IFNULL(location, ''), IFNULL(type, '')
+			FROM `places_v0` WHERE id IS NOT NULL""")
+		cur.execute("DROP TABLE `places_v0`")
+	
+	if 'items' in old_tables:
+		# Items without a place (or with a place that has since been removed) get a NULL place_id
+		cur.execute("""INSERT OR IGNORE INTO `items` (id, name, place_id, details, amount)
+			SELECT id, IFNULL(name, ''),
+				CASE WHEN place_id IN (SELECT id FROM `places`) THEN place_id ELSE NULL END,
+				IFNULL(details, ''), IFNULL(CAST(amount AS INTEGER), 0)
+			FROM `items_v0` WHERE id IS NOT NULL""")
+		cur.execute("DROP TABLE `items_v0`")
+
+def _migrate_to_2(cur):
+	# Replace the 40 character SHA-1 IDs with 64 bit integers, which are also the rowid
+	cur.execute("ALTER TABLE `items` RENAME TO `items_v1`")
+	cur.execute("ALTER TABLE `places` RENAME TO `places_v1`")
+	cur.execute("DROP INDEX IF EXISTS `items_place_id`")
+	
+	cur.execute("""CREATE TABLE `places` (
+		`id` INTEGER PRIMARY KEY,
+		`name` TEXT NOT NULL DEFAULT '',
+		`location` TEXT NOT NULL DEFAULT '',
+		`type` TEXT NOT NULL DEFAULT ''
+	)""")
+	cur.execute("""CREATE TABLE `items` (
+		`id` INTEGER PRIMARY KEY,
+		`name` TEXT NOT NULL DEFAULT '',
+		`place_id` INTEGER REFERENCES `places` (`id`) ON DELETE SET NULL,
+		`details` TEXT NOT NULL DEFAULT '',
+		`amount` INTEGER NOT NULL DEFAULT 1
+	)""")
+	cur.execute("CREATE INDEX `items_place_id` ON `items` (`place_id`)")
+	
+	# Map every old ID to a new one, keeping the insertion order
+	cur.execute("CREATE TEMP TABLE `id_map` (`old_id` TEXT PRIMARY KEY, `new_id` INTEGER NOT NULL)")
+	for table in ('places_v1', 'items_v1'):
+		cur.execute("SELECT COUNT(*) FROM `%s`" % table)
+		new_ids = ID_GENERATOR.allocate(cur.fetchone()[0])
+		cur.execute("SELECT id FROM `%s` ORDER BY rowid" % table)
+		old_ids = [row[0] for row in cur.fetchall()]
+		cur.executemany("INSERT INTO `id_map` (old_id, new_id) VALUES (?, ?)", itertools.izip(old_ids, new_ids))
+	
+	cur.execute("""INSERT INTO `places` (id, name, location, type)
+		SELECT m.new_id, p.name, p.location, p.type
+		FROM `places_v1` p JOIN `id_map` m ON m.old_id = p.id""")
+	cur.execute("""INSERT INTO `items` (id, name, place_id, details, amount)
+		SELECT m.new_id, i.name, pm.new_id, i.details, i.amount
+		FROM `items_v1` i JOIN `id_map` m ON m.old_id = i.id LEFT JOIN `id_map` pm ON pm.old_id = i.place_id""")
+	
+	cur.execute("DROP TABLE `items_v1`")
+	cur.execute("DROP TABLE `places_v1`")
+	cur.execute("DROP TABLE `id_map`")
+
+def _create_place_totals_triggers(cur):
+	# Keep `place_totals` up to date on every change of `items`; items without a place are counted under place_id -1
+	cur.execute("""CREATE TRIGGER `items_totals_insert` AFTER INSERT ON `items` BEGIN
+		INSERT INTO `place_totals` (place_id) SELECT IFNULL(NEW.place_id, -1)
+			WHERE NOT EXISTS (SELECT 1 FROM `place_totals` WHERE place_id = IFNULL(NEW.place_id, -1));
+		UPDATE `place_totals` SET item_count = item_count + 1, total_amount = total_amount + NEW.amount
+			WHERE place_id = IFNULL(NEW.place_id, -1);
+	END""")
+	cur.execute("""CREATE TRIGGER `items_totals_delete` AFTER DELETE ON `items` BEGIN
+		UPDATE `place_totals` SET item_count = item_count - 1, total_amount = total_amount - OLD.amount
+			WHERE place_id = IFNULL(OLD.place_id, -1);
+	END""")
+	cur.execute("""CREATE TRIGGER `items_totals_update` AFTER UPDATE OF place_id, amount ON `items` BEGIN
+		UPDATE `place_totals` SET item_count = item_count - 1, total_amount = total_amount - OLD.amount
+			WHERE place_id = IFNULL(OLD.place_id, -1);
+		INSERT INTO `place_totals` (place_id) SELECT IFNULL(NEW.place_id, -1)
+			WHERE NOT EXISTS (SELECT 1 FROM `place_totals` WHERE place_id = IFNULL(NEW.place_id, -1));
+		UPDATE `place_totals` SET item_count = item_count + 1, total_amount = total_amount + NEW.amount
+			WHERE place_id = IFNULL(NEW.place_id, -1);
+	END""")
+	
+	# The items of a removed place are moved to place_id NULL by the foreign key, which fires the update trigger
+	# (INSERT OR IGNORE isn't used above because the foreign key action would turn the conflict into an error)
+	cur.execute("""CREATE TRIGGER `places_totals_delete` AFTER DELETE ON `places` BEGIN
+		DELETE FROM `place_totals` WHERE place_id = OLD.id;
+	END""")
+
+def rebuild_place_totals(cur):
+	# Count the items and amounts of every place from scratch, e.g. after the items have been changed without the triggers
+	cur.execute("DELETE FROM `place_totals`")
+	cur.execute("""INSERT INTO `place_totals` (place_id, item_count, total_amount)
+		SELECT IFNULL(place_id, -1), COUNT(*), IFNULL(SUM(amount), 0) FROM `items` GROUP BY IFNULL(place_id, -1)""")
+
+def _migrate_to_3(cur):
+	# Add the item count and total amount of every place, maintained by triggers
+	cur.execute("""CREATE TABLE `place_totals` (
+		`place_id` INTEGER PRIMARY KEY,
+		`item_count` INTEGER NOT NULL DEFAULT 0,
+		`total_amount` INTEGER NOT NULL DEFAULT 0
+	)""")
+	rebuild_place_totals(cur)
+	_create_place_totals_triggers(cur)
+
+def _create_change_counter_triggers(cur):
+	# Count every change of `places` and `items`, so copies of their contents can tell whether they're still current
+	for table in ('places', 'items'):
+		for event in ('INSERT', 'UPDATE', 'DELETE'):
+			cur.execute("""CREATE TRIGGER `%s_count_%s` AFTER %s ON `%s` BEGIN
+				UPDATE `storeman_meta` SET value = value + 1 WHERE key = 'change_counter';
+			END""" % (table, event.lower(), event, table))
+
+def _migrate_to_4(cur):
+	# Add a counter of all changes to places and items
+	cur.execute("""CREATE TABLE `storeman_meta` (
+		`key` TEXT NOT NULL PRIMARY KEY,
+		`value` INTEGER NOT NULL DEFAULT 0
+	)""")
+	cur.execute("INSERT INTO `storeman_meta` (key, value) VALUES ('change_counter', 0)")
+	_create_change_counter_triggers(cur)
+
+def _create_change_log_triggers(cur):
+	# Log the ID of every inserted, changed or removed place and item
+	for table in ('places', 'items'):
+		for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+			cur.execute("""CREATE TRIGGER `%s_log_%s` AFTER %s ON `%s` BEGIN
+				INSERT INTO `change_log` (table_name, row_id) VALUES ('%s', %s.id);
+			END""" % (table, event.lower(), event, table, table, row))
+
+def _migrate_to_5(cur):
+	# Add a log of changed rows, so other connections can pick up just the rows that have changed
+	cur.execute("""CREATE TABLE `change_log` (
+		`seq` INTEGER PRIMARY KEY AUTOINCREMENT,
+		`table_name` TEXT NOT NULL,
+		`row_id` INTEGER NOT NULL
+	)""")
+	_create_change_log_triggers(cur)
+
+def _migrate_to_6(cur):
+	# Index the columns the search queries compare, see storeman_query
+	cur.execute("CREATE INDEX `items_amount` ON `items` (`amount`)")
+	cur.execute("CREATE INDEX `items_name` ON `items` (`name` COLLATE NOCASE)")
+
+def _create_ledger_triggers(cur):
+	# Every movement is added to the amount of its item, in the same transaction
+	cur.execute("""CREATE TRIGGER `movements_apply` AFTER INSERT ON `movements` WHEN NEW.applied BEGIN
+		UPDATE `items` SET amount = amount + NEW.delta WHERE id = NEW.item_id;
+	END""")
+	
+	# The amount an item is added with and the one it's removed with are recorded as movements that are already applied
+	cur.execute("""CREATE TRIGGER `items_ledger_insert` AFTER INSERT ON `items` BEGIN
+		INSERT INTO `movements` (item_id, time, delta, reason, applied) VALUES (NEW.id, CAST(strftime('%s', 'now') AS INTEGER), NEW.amount, 'added', 0);
+	END""")
+	cur.execute("""CREATE TRIGGER `items_ledger_delete` AFTER DELETE ON `items` BEGIN
+		INSERT INTO `movements` (item_id, time, delta, reason, applied) VALUES (OLD.id, CAST(strftime('%s', 'now') AS INTEGER), -OLD.amount, 'removed', 0);
+	END""")
+
+def _migrate_to_7(cur):
+	# Add the append-only ledger of stock movements, which items.amount is the sum of, and checkpoints of all amounts
+	cur.execute("""CREATE TABLE `movements` (
+		`id` INTEGER PRIMARY KEY AUTOINCREMENT,
+		`item_id` INTEGER NOT NULL,
+		`time` INTEGER NOT NULL,
+		`delta` INTEGER NOT NULL,
+		`reason` TEXT NOT NULL DEFAULT '',
+		`applied` INTEGER NOT NULL DEFAULT 1
+	)""")
+	cur.execute("CREATE INDEX `movements_item_id` ON `movements` (`item_id`)")
+	cur.execute("CREATE INDEX `movements_time` ON `movements` (`time`)")
+	cur.execute("""CREATE TABLE `checkpoints` (
+		`id` INTEGER PRIMARY KEY AUTOINCREMENT,
+		`time` INTEGER NOT NULL,
+		`last_movement` INTEGER NOT NULL
+	)""")
+	cur.execute("CREATE INDEX `checkpoints_time` ON `checkpoints` (`time`)")
+	cur.execute("""CREATE TABLE `checkpoint_amounts` (
+		`checkpoint_id` INTEGER NOT NULL,
+		`item_id` INTEGER NOT NULL,
+		`amount` INTEGER NOT NULL,
+		PRIMARY KEY (`checkpoint_id`, `item_id`)
+	)""")
+	
+	# The history starts with the amounts the items have now
+	cur.execute("""INSERT INTO `movements` (item_id, time, delta, reason, applied)
+		SELECT id, CAST(strftime('%s', 'now') AS INTEGER), amount, 'opening balance', 0 FROM `items` ORDER BY id""")
+	_create_ledger_triggers(cur)
+
+def rebuild_place_tree(cur):
+	# Fill `place_tree` from scratch, following the parent of every place
+	cur.execute("DELETE FROM `place_tree`")
+	cur.execute("""WITH RECURSIVE `tree` (ancestor_id, descendant_id, depth) AS (
+			SELECT id, id, 0 FROM `places`
+			UNION ALL
+			SELECT p.parent_id, t.descendant_id, t.depth + 1 FROM `tree` t JOIN `places` p ON p.id = t.ancestor_id WHERE p.parent_id IS NOT NULL
+		)
+		INSERT INTO `place_tree` (ancestor_id, descendant_id, depth) SELECT ancestor_id, descendant_id, depth FROM `tree`""")
+
+def _create_place_tree_triggers(cur):
+	# Keep the closure table `place_tree` up to date: it links every place to itself (at depth 0) and to every place it's inside of
+	cur.execute("""CREATE TRIGGER `places_tree_insert` AFTER INSERT ON `places` BEGIN
+		INSERT INTO `place_tree` (ancestor_id, descendant_id, depth) VALUES (NEW.id, NEW.id, 0);
+		INSERT INTO `place_tree` (ancestor_id, descendant_id, depth)
+			SELECT ancestor_id, NEW.id, depth + 1 FROM `place_tree` WHERE descendant_id = NEW.parent_id;
+	END""")
+	cur.execute("""CREATE TRIGGER `places_tree_check` BEFORE UPDATE OF parent_id ON `places` WHEN NEW.parent_id IS NOT NULL BEGIN
+		SELECT RAISE(ABORT, 'A place can''t be moved into itself or a place inside it')
+			WHERE EXISTS (SELECT 1 FROM `place_tree` WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id);
+	END""")
+	
+	# A moved place takes everything inside it along: the links from its old ancestors are replaced by links from the new ones
+	cur.execute("""CREATE TRIGGER `places_tree_move` AFTER UPDATE OF parent_id ON `places` WHEN NEW.parent_id IS NOT OLD.parent_id BEGIN
+		DELETE FROM `place_tree` WHERE descendant_id IN (SELECT descendant_id FROM `place_tree` WHERE ancestor_id = NEW.id)
+			AND ancestor_id NOT IN (SELECT descendant_id FROM `place_tree` WHERE ancestor_id = NEW.id);
+		INSERT INTO `place_tree` (ancestor_id, descendant_id, depth)
+			SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1 FROM `place_tree` a, `place_tree` d
+			WHERE a.descendant_id = NEW.parent_id AND d.ancestor_id = NEW.id;
+	END""")
+	
+	# The places inside a removed place move up to its parent
+	cur.execute("""CREATE TRIGGER `places_tree_delete` AFTER DELETE ON `places` BEGIN
+		UPDATE `places` SET parent_id = OLD.parent_id WHERE parent_id = OLD.id;
+		DELETE FROM `place_tree` WHERE descendant_id = OLD.id;
+	END""")
+
+def _migrate_to_8(cur):
+	# Let places be inside of other places, with a closure table for looking up everything inside a place at once
+	cur.execute("ALTER TABLE `places` ADD COLUMN `parent_id` INTEGER REFERENCES `places` (`id`)")
+	cur.execute("CREATE INDEX `places_parent_id` ON `places` (`parent_id`)")
+	cur.execute("""CREATE TABLE `place_tree` (
+		`ancestor_id` INTEGER NOT NULL,
+		`descendant_id` INTEGER NOT NULL,
+		`depth` INTEGER NOT NULL,
+		PRIMARY KEY (`ancestor_id`, `descendant_id`)
+	)""")
+	cur.execute("CREATE INDEX `place_tree_descendant_id` ON `place_tree` (`descendant_id`)")
+	rebuild_place_tree(cur)
+	_create_place_tree_triggers(cur)
+
+def _migrate_to_9(cur):
+	# Add the sort keys of the names and details, so sorting doesn't have to normalize the texts on every comparison
+	for table, columns in sorted(SORT_KEY_COLUMNS.iteritems()):
+		for column, key_column in sorted(columns.iteritems()):
+			cur.execute("ALTER TABLE `%s` ADD COLUMN `%s` TEXT NOT NULL DEFAULT ''" % (table, key_column))
+		
+		# The function is only needed here, the keys of new rows are computed before they're written
+		cur.connection.create_function("storeman_sort_key", 1, sort_key)
+		cur.execute("UPDATE `%s` SET %s" % (table, ", ".join("`%s` = storeman_sort_key(`%s`)" % (key_column, column) for column, key_column in sorted(columns.iteritems()))))
+	
+	cur.execute("CREATE INDEX `items_name_key` ON `items` (`name_key`)")
+	cur.execute("CREATE INDEX `items_details_key` ON `items` (`details_key`)")
+
+def _migrate_to_10(cur):
+	# Add the case-folded texts, so the search queries compare them through an index instead of folding every row
+	cur.connection.create_function("storeman_fold", 1, fold)
+	for table, columns in sorted(FOLDED_COLUMNS.iteritems()):
+		for column, folded_column in sorted(columns.iteritems()):
+			cur.execute("ALTER TABLE `%s` ADD COLUMN `%s` TEXT NOT NULL DEFAULT ''" % (table, folded_column))
+		
+		cur.execute("UPDATE `%s` SET %s" % (table, ", ".join("`%s` = storeman_fold(`%s`)" % (folded_column, column) for column, folded_column in sorted(columns.iteritems()))))
+	
+	cur.execute("CREATE INDEX `items_name_folded` ON `items` (`name_folded`)")
+	cur.execute("CREATE INDEX `items_details_folded` ON `items` (`details_folded`)")
+	cur.execute("CREATE INDEX `places_name_folded` ON `places` (`name_folded`)")
+	
+	# NOCASE only ignores the case of ASCII letters, so the searches don't compare the names with it anymore
+	cur.execute("DROP INDEX `items_name`")
+
+def with_text_keys(table, values):
+	# Add the sort keys and the folded forms of the text columns among a dictionary of column -> value
+	for column, key_column in SORT_KEY_COLUMNS.get(table, {}).iteritems():
+		if column in values:
+			values[key_column] = sort_key(values[column])
+	
+	for column, folded_column in FOLDED_COLUMNS.get(table, {}).iteritems():
+		if column in values:
+			values[folded_column] = fold(values[column])
+	
+	return values
+
+# MIGRATIONS[n] upgrades a database from version n to version n + 1
+MIGRATIONS = [
+	_migrate_to_1,
+	_migrate_to_2,
+	_migrate_to_3,
+	_migrate_to_4,
+	_migrate_to_5,
+	_migrate_to_6,
+	_migrate_to_7,
+	_migrate_to_8,
+	_migrate_to_9,
+	_migrate_to_10,
+]
+
+def get_schema_version(db):
+	# Get the schema version of a database
+	return db.execute("PRAGMA user_version").fetchone()[0]
+
+def get_change_counter(db):
+	# Get the number of changes made to places and items so far
+	return db.execute("SELECT value FROM `storeman_meta` WHERE key = 'change_counter'").fetchone()[0]
+
+# The number of items and their total amount in every place together with all places inside it
+SUBTREE_TOTALS = """SELECT c.ancestor_id AS place_id, SUM(t.item_count) AS item_count, SUM(t.total_amount) AS total_amount
+	FROM `place_tree` c JOIN `place_totals` t ON t.place_id = c.descendant_id GROUP BY c.ancestor_id"""
+
+def get_subtree_totals(db, place_id):
+	# Get the number of items and their total amount in a place and all places inside it
+	return tuple(db.execute("""SELECT IFNULL(SUM(t.item_count), 0), IFNULL(SUM(t.total_amount), 0)
+		FROM `place_tree` c JOIN `place_totals` t ON t.place_id = c.descendant_id WHERE c.ancestor_id = ?""", (place_id, )).fetchone())
+
+def quote_name(name):
+	# Quote the name of a table or an attached database for a statement
+	return "`%s`" % name.replace("`", "``")
+
+def get_data_version(db, schema = 'main'):
+	# Get a number that changes whenever another connection has committed a change to the database (or an attached one), without reading it
+	return db.execute("PRAGMA %s.data_version" % quote_name(schema)).fetchone()[0]
+
+def get_last_change(db, schema = 'main'):
+	# Get the sequence number of the latest entry in the change log
+	return db.execute("SELECT IFNULL(MAX(seq), 0) FROM %s.`change_log`" % quote_name(schema)).fetchone()[0]
+
+def get_changes(db, since, schema = 'main'):
+	# Get the (table, ID) pairs of all rows changed after the given sequence number, each one once, and the sequence number of the latest change
+	# Returns None instead if the log has been pruned past that point, so the changes can't be told apart anymore
+	cur = db.cursor()
+	cur.row_factory = None
+	try:
+		first = cur.execute("SELECT MIN(seq) FROM %s.`change_log`" % quote_name(schema)).fetchone()[0]
+		if first is not None and first > since + 1:
+			return None
+		
+		cur.execute("""SELECT table_name, row_id, MAX(seq) FROM %s.`change_log` WHERE seq > ?
+			GROUP BY table_name, row_id ORDER BY MAX(seq)""" % quote_name(schema), (since, ))
+		changes = cur.fetchall()
+	finally:
+		cur.close()
+	
+	last = changes[-1][2] if changes else since
+	return [(table, id) for table, id, seq in changes], last
+
+def prune_change_log(db, keep = 100000):
+	# Remove all but the latest entries of the change log
+	db.execute("DELETE FROM `change_log` WHERE seq <= (SELECT MAX(seq) FROM `change_log`) - ?", (keep, ))
+	db.commit()
+
+def migrate(db):
+	# Bring a database up to SCHEMA_VERSION, one version at a time
+	version = get_schema_version(db)
+	if version > SCHEMA_VERSION:
+		raise RuntimeError("Database schema version %i is newer than the supported version %i" % (version, SCHEMA_VERSION))
+	
+	if version == SCHEMA_VERSION:
+		return False
+	
+	# Run each migration in its own explicit transaction; the sqlite3 module would otherwise commit before every DDL statement
+	isolation_level = db.isolation_level
+	db.isolation_level = None
+	try:
+		cur = db.cursor()
+		while version < SCHEMA_VERSION:
+			cur.execute("BEGIN IMMEDIATE")
+			try:
+				MIGRATIONS[version](cur)
+				version += 1
+				cur.execute("PRAGMA user_version = %i" % version)
+				cur.execute("COMMIT")
+			except:
+				cur.execute("ROLLBACK")
+				raise
+		cur.close()
+	finally:
+		db.isolation_level = isolation_level
+	
+	return True
+
+def default_database_path():
+	# Store the database in ~/.pyStoreMan/storeman.db
+	db_file = os.path.join(os.path.expanduser("~"), ".pyStoreMan/storeman.db")
+	dirname = os.path.dirname(db_file)
+	if not os.path.exists(dirname):
+		os.makedirs(dirname)
+	
+	return db_file
+
+def configure_connection(db):
+	# Set up a connection for many small transactions: WAL journal, no fsync per commit, bigger page cache
+	db.execute("PRAGMA journal_mode = WAL")
+	db.execute("PRAGMA synchronous = NORMAL")
+	db.execute("PRAGMA cache_size = -16000")
+	db.execute("PRAGMA temp_store = MEMORY")
+	db.execute("PRAGMA busy_timeout = 5000")
+	
+	# Foreign keys can only be switched on outside of a transaction
+	db.execute("PRAGMA foreign_keys = ON")
+
+def open_database(filename, factory = sqlite3.Connection):
+	# Open a database, migrating it to the current schema if necessary
+	db = sqlite3.connect(filename, factory = factory)
+	db.row_factory = sqlite3.Row
+	migrate(db)
+	configure_connection(db)
+	return db
+
+class TransactionManager(object):
+	"""
+	A unit of work on a database connection: changes are collected and written together in one transaction
+	
+	Only the columns that have actually been changed are written. Inserts are written first, then appended rows
+	(like stock movements, which have no ID of their own), then updates, then deletes, so rows can refer to other
+	rows inserted in the same transaction. Changes of many rows at once (see bulk) come last; they should be written
+	right after they have been recorded, so nothing recorded later ends up before them.
+	"""
+	
+	def __init__(self, db, max_changes = 100):
+		self.db = db
+		self.max_changes = max_changes
+		self.inserts = collections.OrderedDict() # (table, id) -> {column: value}
+		self.appends = [] # (table, {column: value}) of rows that are only ever added, in order
+		self.updates = collections.OrderedDict() # (table, id) -> {column: value}, only the changed columns
+		self.deletes = collections.OrderedDict() # (table, id) -> True
+		self.bulks = [] # (IDs, [(query, params), ...]) of the changes of many rows at once, in order
+		
+		# The IDs of the rows a bulk change applies to; created up front, since the sqlite3 module commits before DDL statements
+		self.db.execute("CREATE TEMP TABLE IF NOT EXISTS `selection` (`id` INTEGER PRIMARY KEY)")
+	
+	def __len__(self):
+		return len(self.inserts) + len(self.appends) + len(self.updates) + len(self.deletes) + len(self.bulks)
+	
+	def is_full(self):
+		# Check whether enough changes have been collected to write them, or a bulk change is waiting
+		return len(self) >= self.max_changes or bool(self.bulks)
+	
+	def insert(self, table, id, values):
+		# Record a new row
+		values = with_text_keys(table, dict(values))
+		values['id'] = id
+		self.inserts[(table, id)] = values
+	
+	def append(self, table, values):
+		# Record a new row that gets its ID from the database
+		self.appends.append((table, with_text_keys(table, dict(values))))
+	
+	def update(self, table, id, values):
+		# Record changed columns of a row
+		key = (table, id)
+		if key in self.deletes:
+			return
+		
+		values = with_text_keys(table, dict(values))
+		if key in self.inserts:
+			self.inserts[key].update(values)
+		elif key in self.updates:
+			self.updates[key].update(values)
+		else:
+			self.updates[key] = dict(values)
+	
+	def delete(self, table, id):
+		# Record the removal of a row
+		key = (table, id)
+		self.updates.pop(key, None)
+		self.deletes[key] = True
+	
+	def bulk(self, ids, statements):
+		# Record statements that change many rows at once, each one a (query, params) pair
+		# The queries find the IDs they apply to in the temporary table `selection`, e.g. "DELETE FROM `items` WHERE id IN (SELECT id FROM `selection`)"
+		self.bulks.append((list(ids), list(statements)))
+	
+	def discard(self):
+		# Forget all recorded changes
+		self.inserts.clear()
+		del self.appends[:]
+		self.updates.clear()
+		self.deletes.clear()
+		del self.bulks[:]
+	
+	def _grouped(self, changes):
+		# Group consecutive changes with the same table and columns, so each group is one executemany call
+		group_key = None
+		group = []
+		for (table, id), values in changes:
+			columns = tuple(sorted(values)) if values is not True else ()
+			if (table, columns) != group_key and group:
+				yield group_key, group
+				group = []
+			group_key = (table, columns)
+			group.append((id, values))
+		
+		if group:
+			yield group_key, group
+	
+	def flush(self):
+		# Write all recorded changes in a single transaction
+		if not len(self):
+			return 0
+		
+		count = len(self)
+		cur = self.db.cursor()
+		try:
+			for (table, columns), group in self._grouped(self.inserts.iteritems()):
+				query = "INSERT INTO `%s` (%s) VALUES (%s)" % (table, ", ".join("`%s`" % column for column in columns), ", ".join("?" * len(columns)))
+				cur.executemany(query, [[values[column] for column in columns] for id, values in group])
+			
+			for (table, columns), group in self._grouped(((table, None), values) for table, values in self.appends):
+				query = "INSERT INTO `%s` (%s) VALUES (%s)" % (table, ", ".join("`%s`" % column for column in columns), ", ".join("?" * len(columns)))
+				cur.executemany(query, [[values[column] for column in columns] for id, values in group])
+			
+			for (table, columns), group in self._grouped(self.updates.iteritems()):
+				query = "UPDATE `%s` SET %s WHERE `id` = ?" % (table, ", ".join("`%s` = ?" % column for column in columns))
+				cur.executemany(query, [[values[column] for column in columns] + [id] for id, values in group])
+			
+			for (table, columns), group in self._grouped(self.deletes.iteritems()):
+				cur.executemany("DELETE FROM `%s` WHERE `id` = ?" % table, [(id, ) for id, values in group])
+			
+			for ids, statements in self.bulks:
+				cur.execute("DELETE FROM `selection`")
+				cur.executemany("INSERT OR IGNORE INTO `selection` (id) VALUES (?)", [(id, ) for id in ids])
+				for query, params in statements:
+					cur.execute(query, params)
+				cur.execute("DELETE FROM `selection`")
+			
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		finally:
+			# A failed change would fail again, so don't keep it around
+			self.discard()
+			cur.close()
+		
+		return count
+
+class BackgroundWriter(object):
+	"""
+	Writes changes to the database in a thread of its own, so the caller never waits for the disk
+	
+	Changes are put on a queue and written by a TransactionManager on a separate connection, once max_changes of
+	them have been collected or nothing new has arrived for delay seconds. Errors are passed to on_error, which is
+	called in the writer thread; they never stop the thread, so flush() and close() always return. If the connection
+	can't even be opened, every change is reported as failed and dropped.
+	"""
+	
+	def __init__(self, filename, max_changes = 100, delay = 2.0, on_error = None, factory = sqlite3.Connection, on_open = None):
+		self.filename = filename
+		self.max_changes = max_changes
+		self.delay = delay
+		self.on_error = on_error
+		self.factory = factory
+		self.on_open = on_open # Called with the writer's connection once it has been opened
+		self.queue = Queue.Queue()
+		self.pending = {} # (table, ID) -> number of queued changes of that row that haven't been written yet
+		self.pending_lock = threading.Lock()
+		self.thread = threading.Thread(target = self._run, name = "storeman-writer")
+		self.thread.daemon = True
+		self.thread.start()
+	
+	def _put(self, record, keys):
+		with self.pending_lock:
+			for key in keys:
+				self.pending[key] = self.pending.get(key, 0) + 1
+		self.queue.put(record + (keys, ))
+	
+	def insert(self, table, id, values):
+		self._put(('insert', table, id, dict(values)), [(table, id)])
+	
+	def append(self, table, values, row = None):
+		# Add a row that gets its ID from the database; row is the (table, ID) of the row it changes, if any, which counts as pending until it's written
+		self._put(('append', table, dict(values)), [row] if row is not None else [])
+	
+	def update(self, table, id, values):
+		self._put(('update', table, id, dict(values)), [(table, id)])
+	
+	def delete(self, table, id):
+		self._put(('delete', table, id), [(table, id)])
+	
+	def bulk(self, ids, statements, rows = ()):
+		# Change many rows at once with set-based statements (see TransactionManager.bulk), written right away in one transaction
+		# rows are the (table, ID) of the rows they change, which count as pending until they're written
+		self._put(('bulk', list(ids), list(statements)), list(rows))
+	
+	def is_pending(self, table, id):
+		# Check whether changes of a row are waiting to be written
+		with self.pending_lock:
+			return (table, id) in self.pending
+	
+	def has_pending(self):
+		# Check whether any changes are waiting to be written
+		with self.pending_lock:
+			return bool(self.pending)
+	
+	def _written(self, keys):
+		# Forget the queued changes that have just been written (or have failed)
+		with self.pending_lock:
+			for key in keys:
+				count = self.pending.get(key, 0) - 1
+				if count > 0:
+					self.pending[key] = count
+				else:
+					self.pending.pop(key, None)
+	
+	def flush(self):
+		# Write all changes made so far and wait until they are committed
+		self.queue.put(('flush', None))
+		self.queue.join()
+	
+	def flush_async(self, callback):
+		# Write all changes made so far without waiting for it; callback is called in the writer thread once they are committed (or have failed)
+		self.queue.put(('flush', callback))
+	
+	def close(self):
+		# Write all changes made so far and stop the thread
+		if self.thread.is_alive():
+			self.queue.put(('stop', ))
+			self.thread.join()
+	
+	def _report(self, error):
+		# Pass an error to on_error; one raised by on_error itself can only be printed
+		try:
+			if self.on_error is not None:
+				self.on_error(error)
+		except Exception:
+			traceback.print_exc()
+	
+	def _call(self, func, *args):
+		# Call something on behalf of the caller, reporting what it raises instead of stopping the thread
+		try:
+			func(*args)
+		except Exception as error:
+			self._report(error)
+	
+	def _open(self):
+		# Open the connection, None if that fails
+		try:
+			db = open_database(self.filename, factory = self.factory)
+		except Exception as error:
+			self._report(error)
+			return None
+		
+		if self.on_open is not None:
+			self._call(self.on_open, db)
+		return db
+	
+	def _drop(self):
+		# Take the records off the queue without writing them, until asked to stop
+		while True:
+			record = self.queue.get()
+			if record[0] == 'flush':
+				if record[1] is not None:
+					self._call(record[1])
+			elif record[0] != 'stop':
+				self._written(record[-1])
+			self.queue.task_done()
+			
+			if record[0] == 'stop':
+				break
+	
+	def _run(self):
+		# The connection has to be opened in the thread that uses it
+		db = self._open()
+		if db is None:
+			self._drop()
+			return
+		
+		transactions = TransactionManager(db, max_changes = self.max_changes)
+		received = 0 # Records taken from the queue whose changes haven't been written yet
+		keys = [] # The rows they change
+		while True:
+			try:
+				record = self.queue.get(timeout = self.delay) if received else self.queue.get()
+			except Queue.Empty:
+				record = None
+			
+			if record is not None:
+				received += 1
+				if record[0] in ('insert', 'append', 'update', 'delete', 'bulk'):
+					keys.extend(record[-1])
+					self._call(getattr(transactions, record[0]), *record[1:-1])
+			
+			# Write when nothing has happened for a while, when someone waits for it, when there's enough to write or a bulk change has come
+			if record is None or record[0] in ('flush', 'stop') or transactions.is_full():
+				try:
+					self._call(transactions.flush)
+					self._written(keys)
+					keys = []
+					if record is not None and record[0] == 'flush' and record[1] is not None:
+						self._call(record[1])
+				finally:
+					# Whoever waits in flush() has to be woken up, whatever has happened
+					for i in xrange(received):
+						self.queue.task_done()
+					received = 0
+			
+			if record is not None and record[0] == 'stop':
+				break
+		
+		db.close()
\ No newline at end of file
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+A local, read-only HTTP server answering questions about the places and items with JSON
+"""
+
+import BaseHTTPServer
+import collections
+import json
+import Queue
+import re
+import SocketServer
+import sqlite3
+import threading
+import urlparse
+
+from storeman_db import SUBTREE_TOTALS, get_change_counter, get_data_version
+from storeman_query import Query, QuerySyntaxError
+
+# Number of read-only connections shared by the request threads
+POOL_SIZE = 4
+
+# Seconds between two looks at whether the database has been changed
+POLL_INTERVAL = 1.0
+
+# Number of responses to keep until the database is changed
+CACHE_SIZE = 200
+
+# Number of items returned by a search if the request doesn't say otherwise, and the most it may ask for
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+PLACES_QUERY = """SELECT p.id, p.name, p.location, p.type, p.parent_id, IFNULL(t.item_count, 0), IFNULL(t.total_amount, 0)
+	FROM `places` p LEFT JOIN (%s) t ON t.place_id = p.id ORDER BY p.name_key, p.id""" % SUBTREE_TOTALS
+
+ITEMS_QUERY = "SELECT i.id, i.name, i.place_id, i.details, i.amount FROM `items` i"
+
+PLACE_ITEMS_QUERY = ITEMS_QUERY + """ WHERE i.place_id IN (SELECT descendant_id FROM `place_tree` WHERE ancestor_id = ?)
+	ORDER BY i.name_key, i.id"""
+
+PLACE_COLUMNS = ('id', 'name', 'location', 'type', 'parent_id', 'item_count', 'total_amount')
+ITEM_COLUMNS = ('id', 'name', 'place_id', 'details', 'amount')
+
+# IDs are 64 bit numbers, which JavaScript can't represent exactly, so they are sent as strings
+ID_COLUMNS = ('id', 'parent_id', 'place_id')
+
+class RequestError(Exception):
+	"""
+	Raised while handling a request to answer it with an HTTP error
+	"""
+	
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status = status
+
+def _to_json(columns, row):
+	return dict((column, unicode(value) if column in ID_COLUMNS and value is not None else value) for column, value in zip(columns, row))
+
+def _parse_int(value, name):
+	try:
+		return int(value)
+	except ValueError:
+		raise RequestError(400, "%s has to be a number, not %s" % (name, value))
+
+def _parse_id(value):
+	# IDs are matched by the routes already, but may still be too big for SQLite
+	id = int(value)
+	if not -2 ** 63 <= id < 2 ** 63:
+		raise RequestError(404, "No such id %s" % value)
+	
+	return id
+
+def _parse_query_string(query):
+	# Get the parameters of a query string as lists of unicode values, which have to be UTF-8 encoded
+	try:
+		return dict((name.decode('utf-8'), [value.decode('utf-8') for value in values]) for name, values in urlparse.parse_qs(query).items())
+	except UnicodeDecodeError:
+		raise RequestError(400, "The query string isn't valid UTF-8")
+
+class ConnectionPool(object):
+	"""
+	A fixed number of read-only connections to a database, each used by one thread at a time
+	"""
+	
+	def __init__(self, database, size = POOL_SIZE):
+		self.connections = Queue.Queue()
+		for index in range(size):
+			db = sqlite3.connect(database, check_same_thread = False)
+			db.execute("PRAGMA query_only = 1")
+			db.execute("PRAGMA busy_timeout = 5000")
+			self.connections.put(db)
+		self.size = size
+	
+	def read(self, query, params = ()):
+		# Run a query on one of the connections, waiting for one to become free, and get all rows
+		db = self.connections.get()
+		try:
+			cur = db.cursor()
+			try:
+				cur.execute(query, params)
+				return cur.fetchall()
+			finally:
+				cur.close()
+		finally:
+			self.connections.put(db)
+	
+	def close(self):
+		for index in range(self.size):
+			self.connections.get().close()
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+	server_version = "pyStoreMan"
+	
+	def do_GET(self):
+		self.server.api.handle(self)
+	
+	def do_HEAD(self):
+		self.server.api.handle(self, body = False)
+	
+	def log_message(self, format, *args):
+		if self.server.api.log is not None:
+			self.server.api.log(format % args)
+
+class APIServer(object):
+	"""
+	Serves the places and items of a database as JSON over HTTP, e.g. for label printers and dashboards
+	
+	GET /places                   All places with the number of items and their total amount in each one, inside places included
+	GET /places/<id>/items        The items in a place and all places inside it
+	GET /items?q=...              The items matching a search query (see storeman_query), with limit and offset
+	GET /items/<id>               A single item
+	
+	The queries run on a pool of read-only connections, so the server can run next to the GUI or any other writer.
+	Every response carries the change counter of the database as its ETag, and responses are cached until the
+	counter changes. A watcher thread looks at the data version of the database every poll_interval seconds, so a
+	request whose If-None-Match matches is answered with 304 Not Modified without touching the database.
+	"""
+	
+	ROUTES = (
+		(re.compile(r"^/places/?$"), '_get_places'),
+		(re.compile(r"^/places/(-?\d+)/items/?$"), '_get_place_items'),
+		(re.compile(r"^/items/?$"), '_search_items'),
+		(re.compile(r"^/items/(-?\d+)/?$"), '_get_item'),
+	)
+	
+	def __init__(self, database, host = "127.0.0.1", port = 8080, pool_size = POOL_SIZE, poll_interval = POLL_INTERVAL, log = None):
+		self.database = database
+		self.poll_interval = poll_interval
+		self.log = log # Called with a line for every request, None to log nothing
+		self.pool = ConnectionPool(database, pool_size)
+		
+		self.watcher_db = sqlite3.connect(database, check_same_thread = False)
+		self.data_version = get_data_version(self.watcher_db)
+		self.change_counter = get_change_counter(self.watcher_db)
+		
+		self.cache = collections.OrderedDict() # Path with query string -> (change counter, body)
+		self.lock = threading.Lock() # Guards the cache and the change counter, which the request threads share with the watcher
+		self.stopped = threading.Event()
+		self.server_thread = None
+		self.watcher_thread = None
+		
+		self.httpd = _Server((host, port), _Handler)
+		self.httpd.api = self
+		self.address = self.httpd.server_address
+	
+	def _etag(self, change_counter):
+		return '"%i"' % change_counter
+	
+	def _watch(self):
+		# Pick up the new change counter whenever the database has been committed to, dropping the cached responses
+		while not self.stopped.wait(self.poll_interval):
+			try:
+				data_version = get_data_version(self.watcher_db)
+				if data_version != self.data_version:
+					change_counter = get_change_counter(self.watcher_db)
+					with self.lock:
+						self.data_version = data_version
+						if change_counter != self.change_counter:
+							self.change_counter = change_counter
+							self.cache.clear()
+			except sqlite3.Error:
+				# Locked for too long, try again next time
+				pass
+	
+	def _start_thread(self, target, name):
+		thread = threading.Thread(target = target, name = name)
+		thread.daemon = True
+		thread.start()
+		return thread
+	
+	def start(self):
+		# Serve and watch the database in threads of their own
+		self.watcher_thread = self._start_thread(self._watch, "storeman-http-watcher")
+		self.server_thread = self._start_thread(self.httpd.serve_forever, "storeman-http")
+	
+	def serve_forever(self):
+		# Serve in the calling thread until interrupted, watching the database in another one
+		self.watcher_thread = self._start_thread(self._watch, "storeman-http-watcher")
+		try:
+			self.httpd.serve_forever()
+		except KeyboardInterrupt:
+			pass
+	
+	def stop(self):
+		# Stop serving, wait for the threads and close the connections
+		self.stopped.set()
+		if self.server_thread is not None:
+			self.httpd.shutdown()
+			self.server_thread.join()
+		if self.watcher_thread is not None:
+			self.watcher_thread.join()
+		self.httpd.server_close()
+		self.pool.close()
+		self.watcher_db.close()
+	
+	def handle(self, request, body = True):
+		# Answer a request, from the cache if possible
+		with self.lock:
+			change_counter = self.change_counter
+		etag = self._etag(change_counter)
+		
+		tags = [tag.strip() for tag in request.headers.get('If-None-Match', "").split(",")]
+		if etag in tags or "W/" + etag in tags or "*" in tags:
+			self._respond(request, 304, etag, None)
+			return
+		
+		with self.lock:
+			cached = self.cache.pop(request.path, None)
+			if cached is not None and cached[0] == change_counter:
+				self.cache[request.path] = cached
+		
+		if cached is not None and cached[0] == change_counter:
+			self._respond(request, 200, etag, cached[1] if body else None)
+			return
+		
+		try:
+			data = self._route(request.path)
+		except RequestError as error:
+			self._respond(request, error.status, None, json.dumps({'error': unicode(error)}) if body else None)
+			return
+		except sqlite3.Error as error:
+			self._respond(request, 503, None, json.dumps({'error': unicode(error)}) if body else None)
+			return
+		
+		content = json.dumps(data, ensure_ascii = False).encode('utf-8')
+		with self.lock:
+			# Only cache the response if the database hasn't been changed while it was being put together
+			if self.change_counter == change_counter:
+				while len(self.cache) >= CACHE_SIZE:
+					self.cache.popitem(last = False)
+				self.cache[request.path] = (change_counter, content)
+		
+		self._respond(request, 200, etag, content if body else None)
+	
+	def _respond(self, request, status, etag, content):
+		request.send_response(status)
+		if etag is not None:
+			request.send_header('ETag', etag)
+			request.send_header('Cache-Control', "no-cache")
+		if content is not None:
+			request.send_header('Content-Type', "application/json; charset=utf-8")
+			request.send_header('Content-Length', str(len(content)))
+		request.end_headers()
+		if content is not None:
+			request.wfile.write(content)
+	
+	def _route(self, path):
+		url = urlparse.urlparse(path)
+		params = _parse_query_string(url.query)
+		for pattern, name in self.ROUTES:
+			match = pattern.match(url.path)
+			if match:
+				return getattr(self, name)(params, *match.groups())
+		
+		raise RequestError(404, "Unknown path %s" % url.path.decode('utf-8', 'replace'))
+	
+	def _get_places(self, params):
+		return [_to_json(PLACE_COLUMNS, row) for row in self.pool.read(PLACES_QUERY)]
+	
+	def _get_place_items(self, params, place_id):
+		place_id = _parse_id(place_id)
+		if not self.pool.read("SELECT 1 FROM `places` WHERE id = ?", (place_id, )):
+			raise RequestError(404, "No place with id %i" % place_id)
+		
+		return [_to_json(ITEM_COLUMNS, row) for row in self.pool.read(PLACE_ITEMS_QUERY, (place_id, ))]
+	
+	def _search_items(self, params):
+		text = params.get('q', [u""])[0]
+		limit = min(_parse_int(params.get('limit', [DEFAULT_LIMIT])[0], "limit"), MAX_LIMIT)
+		offset = _parse_int(params.get('offset', [0])[0], "offset")
+		if limit < 0 or offset < 0:
+			raise RequestError(400, "limit and offset can't be negative")
+		
+		# The compiled queries aren't shared with the GUI thread, the responses are cached anyway
+		try:
+			query = Query(text)
+		except QuerySyntaxError as error:
+			raise RequestError(400, unicode(error))
+		
+		where = " WHERE %s" % query.where if query.where else ""
+		rows = self.pool.read(ITEMS_QUERY + where + " ORDER BY i.name_key, i.id LIMIT ? OFFSET ?", query.params + (limit, offset))
+		return [_to_json(ITEM_COLUMNS, row) for row in rows]
+	
+	def _get_item(self, params, id):
+		rows = self.pool.read(ITEMS_QUERY + " WHERE i.id = ?", (_parse_id(id), ))
+		if not rows:
+			raise RequestError(404, "No item with id %s" % id)
+		
+		return _to_json(ITEM_COLUMNS, rows[0])
\ No newline at end of file
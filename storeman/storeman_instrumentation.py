@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Opt-in timing of GUI callbacks and SQL statements
+"""
+
+import functools
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Set this environment variable (or pass --instrument to storeman.py) to switch the instrumentation on
+ENV_ENABLE = "STOREMAN_INSTRUMENT"
+ENV_SLOW_MS = "STOREMAN_SLOW_MS"
+
+class TracingCursor(sqlite3.Cursor):
+	"""
+	A cursor that reports the time taken by every statement to the instrumentation of its connection
+	
+	Connection.execute() creates its cursor through Connection.cursor(), so those statements are timed as well.
+	"""
+	
+	def _timed(self, sql, method, *args):
+		instrumentation = self.connection.instrumentation
+		if instrumentation is None:
+			return method(self, sql, *args)
+		
+		self.last_sql = sql
+		instrumentation.vm_steps = 0
+		start = time.time()
+		try:
+			return method(self, sql, *args)
+		finally:
+			instrumentation.record('sql', sql, time.time() - start, instrumentation.vm_steps)
+	
+	def _timed_fetch(self, method, *args):
+		instrumentation = self.connection.instrumentation
+		if instrumentation is None or getattr(self, 'last_sql', None) is None:
+			return method(self, *args)
+		
+		instrumentation.vm_steps = 0
+		start = time.time()
+		try:
+			return method(self, *args)
+		finally:
+			# Reading the rows is where most of the work of a SELECT happens
+			instrumentation.record('sql', self.last_sql, time.time() - start, instrumentation.vm_steps)
+	
+	def execute(self, sql, *args):
+		return self._timed(sql, sqlite3.Cursor.execute, *args)
+	
+	def executemany(self, sql, *args):
+		return self._timed(sql, sqlite3.Cursor.executemany, *args)
+	
+	def executescript(self, sql):
+		return self._timed(sql, sqlite3.Cursor.executescript)
+	
+	def fetchone(self):
+		return self._timed_fetch(sqlite3.Cursor.fetchone)
+	
+	def fetchmany(self, *args):
+		return self._timed_fetch(sqlite3.Cursor.fetchmany, *args)
+	
+	def fetchall(self):
+		return self._timed_fetch(sqlite3.Cursor.fetchall)
+
+class TracingConnection(sqlite3.Connection):
+	"""
+	A connection whose cursors are TracingCursors, pass it to sqlite3.connect() as the factory
+	"""
+	
+	instrumentation = None
+	
+	def cursor(self, factory = TracingCursor):
+		return sqlite3.Connection.cursor(self, factory)
+
+def _normalize_sql(sql):
+	# Collapse the whitespace of a statement, so it can be used as a key
+	return re.sub(r"\s+", " ", sql).strip()
+
+class Instrumentation(object):
+	"""
+	Call counters and timers for callbacks and SQL statements, with a log of slow operations
+	
+	Every operation taking longer than slow_ms milliseconds is appended to the slow log right away; the summary of
+	all operations is written by dump(), which the GUI calls when it quits. Operations may be recorded from several
+	threads, e.g. the GUI and the background writer.
+	"""
+	
+	# Methods of the GUI that are timed besides the callback_* handlers
+	HOT_PATHS = (
+		'_filter_search_items',
+		'_sync_overview_views',
+		'_update_place_names',
+		'_update_item',
+		'_run_search',
+		'_poll_changes',
+		'load_data',
+		'commit_changes',
+	)
+	
+	# Number of SQLite virtual machine instructions between two calls of the progress handler
+	PROGRESS_STEPS = 1000
+	
+	def __init__(self, slow_ms = 50, log_file = None, summary_file = None):
+		self.slow_ms = slow_ms
+		self.log_file = log_file # None means stderr
+		self.summary_file = summary_file # None means stderr
+		self.stats = {} # (kind, name) -> [calls, total seconds, max seconds, VM steps]
+		self.lock = threading.Lock() # Guards the statistics and the slow log
+		self._local = threading.local()
+		self._log = None
+	
+	@property
+	def vm_steps(self):
+		# VM steps of the statement running in the calling thread, counted by the progress handler of its connection
+		return getattr(self._local, 'vm_steps', 0)
+	
+	@vm_steps.setter
+	def vm_steps(self, value):
+		self._local.vm_steps = value
+	
+	@classmethod
+	def from_environment(cls, enabled = False):
+		# Create the instrumentation if it has been switched on by the caller or the environment, None otherwise
+		if not enabled and not os.environ.get(ENV_ENABLE):
+			return None
+		
+		directory = os.path.join(os.path.expanduser("~"), ".pyStoreMan")
+		return cls(
+			slow_ms = float(os.environ.get(ENV_SLOW_MS, 50)),
+			log_file = os.path.join(directory, "slow.log"),
+			summary_file = os.path.join(directory, "instrumentation.json"),
+		)
+	
+	def record(self, kind, name, duration, vm_steps = 0):
+		# Add one operation to the statistics and log it if it was slow
+		if kind == 'sql':
+			name = _normalize_sql(name)
+		
+		with self.lock:
+			stats = self.stats.get((kind, name))
+			if stats is None:
+				self.stats[(kind, name)] = [1, duration, duration, vm_steps]
+			else:
+				stats[0] += 1
+				stats[1] += duration
+				stats[3] += vm_steps
+				if duration > stats[2]:
+					stats[2] = duration
+			
+			if duration * 1000 >= self.slow_ms:
+				self._write_log("%s %s %.1f ms %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), kind, duration * 1000, name))
+	
+	def _write_log(self, line):
+		if self.log_file is None:
+			sys.stderr.write(line)
+			return
+		
+		if self._log is None:
+			self._log = open(self.log_file, 'a')
+		self._log.write(line)
+		self._log.flush()
+	
+	def wrap(self, kind, name, func):
+		# Get a version of func that records the time of every call
+		@functools.wraps(func)
+		def _timed(*args, **kwargs):
+			start = time.time()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				self.record(kind, name, time.time() - start)
+		
+		return _timed
+	
+	def instrument_gui(self, gui):
+		# Replace the callbacks and hot paths of a GUI with timed versions; has to happen before the signals are connected
+		for name in dir(type(gui)):
+			if name.startswith('callback_') or name in self.HOT_PATHS:
+				setattr(gui, name, self.wrap('callback', name, getattr(gui, name)))
+	
+	def _progress(self):
+		self.vm_steps += self.PROGRESS_STEPS
+		return 0
+	
+	def instrument_connection(self, db):
+		# Time the statements of a connection opened with factory = TracingConnection
+		db.instrumentation = self
+		db.set_progress_handler(self._progress, self.PROGRESS_STEPS)
+	
+	def summary(self):
+		# Get the statistics as a dictionary, slowest operations first
+		summary = {'callback': [], 'sql': []}
+		with self.lock:
+			stats = [(key, list(values)) for key, values in self.stats.iteritems()]
+		
+		for (kind, name), (calls, total, maximum, vm_steps) in stats:
+			entry = {
+				'name': name,
+				'calls': calls,
+				'total_ms': round(total * 1000, 3),
+				'mean_ms': round(total * 1000 / calls, 3),
+				'max_ms': round(maximum * 1000, 3),
+			}
+			if kind == 'sql':
+				entry['vm_steps'] = vm_steps
+			summary[kind].append(entry)
+		
+		for entries in summary.itervalues():
+			entries.sort(key = lambda entry: entry['total_ms'], reverse = True)
+		
+		return summary
+	
+	def dump(self):
+		# Write the summary as JSON
+		data = json.dumps(self.summary(), indent = 4, sort_keys = True)
+		if self.summary_file is None:
+			sys.stderr.write(data + "\n")
+		else:
+			with open(self.summary_file, 'w') as f:
+				f.write(data)
+		
+		with self.lock:
+			if self._log is not None:
+				self._log.close()
+				self._log = None
\ No newline at end of file
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+The stock movement ledger: every change of an amount, and the amounts at any point in time
+"""
+
+import time
+
+# Reasons of the movements that don't come with one
+REASON_EDIT = u"edit"
+REASON_IMPORT = u"import"
+
+# A checkpoint of all amounts is made once this many movements have been recorded since the last one
+CHECKPOINT_INTERVAL = 10000
+
+def new_movement(item_id, delta, reason = None, when = None):
+	# Get the columns of a movement of an item's amount, to be written to the `movements` table
+	return {'item_id': item_id, 'time': int(when if when is not None else time.time()), 'delta': delta, 'reason': reason or REASON_EDIT}
+
+def _parse_amount_text(text):
+	# Split what the user has typed for an amount into the number, whether it's added to the amount (rather than replacing it) and the reason
+	number, _, reason = text.strip().partition(" ")
+	return int(number), number.startswith(("+", "-")), reason.strip() or None
+
+def parse_amount_change(text, amount):
+	# Get the change and its reason from what the user has typed for an amount: "7" sets it, "+10 restock" or "-3 used for the clock" adds to it
+	number, relative, reason = _parse_amount_text(text)
+	return (number if relative else number - amount), reason
+
+def bulk_movements(text, when = None):
+	# Get the statement recording the movements for an amount typed for many items at once, as a (query, params) pair
+	# The items are the ones listed in the temporary table `selection` (see storeman_db.TransactionManager.bulk); items already at a new amount get no movement
+	number, relative, reason = _parse_amount_text(text)
+	when = int(when if when is not None else time.time())
+	if relative:
+		return ("INSERT INTO `movements` (item_id, time, delta, reason) SELECT id, ?, ?, ? FROM `items` WHERE id IN (SELECT id FROM `selection`)",
+			(when, number, reason or REASON_EDIT))
+	
+	return ("INSERT INTO `movements` (item_id, time, delta, reason) SELECT id, ?, ? - amount, ? FROM `items` WHERE id IN (SELECT id FROM `selection`) AND amount <> ?",
+		(when, number, reason or REASON_EDIT, number))
+
+def parse_time(text):
+	# Get the timestamp of a local date ("2014-06-01") or date and time ("2014-06-01 18:30")
+	for format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+		try:
+			return int(time.mktime(time.strptime(text.strip(), format)))
+		except ValueError:
+			pass
+	
+	raise ValueError("Invalid date %r, use YYYY-MM-DD or YYYY-MM-DD HH:MM" % text)
+
+def create_checkpoint(db, when = None):
+	# Save the amounts of all items as they are now, returning the ID of the checkpoint
+	cur = db.cursor()
+	try:
+		cur.execute("INSERT INTO `checkpoints` (time, last_movement) VALUES (?, (SELECT IFNULL(MAX(id), 0) FROM `movements`))", (int(when if when is not None else time.time()), ))
+		checkpoint_id = cur.lastrowid
+		cur.execute("INSERT INTO `checkpoint_amounts` (checkpoint_id, item_id, amount) SELECT ?, id, amount FROM `items` WHERE amount <> 0", (checkpoint_id, ))
+		db.commit()
+	except:
+		db.rollback()
+		raise
+	finally:
+		cur.close()
+	
+	return checkpoint_id
+
+def maybe_checkpoint(db, interval = CHECKPOINT_INTERVAL):
+	# Make a checkpoint if at least interval movements have been recorded since the last one, returning its ID or None
+	row = db.execute("SELECT IFNULL(MAX(last_movement), 0) FROM `checkpoints`").fetchone()
+	if db.execute("SELECT COUNT(*) FROM `movements` WHERE id > ?", (row[0], )).fetchone()[0] < interval:
+		return None
+	
+	return create_checkpoint(db)
+
+def _checkpoint_before(db, when):
+	# Get the ID and last movement of the latest checkpoint made at or before a point in time, (None, 0) if there is none
+	row = db.execute("SELECT id, last_movement FROM `checkpoints` WHERE time <= ? ORDER BY time DESC, id DESC LIMIT 1", (when, )).fetchone()
+	return (row[0], row[1]) if row is not None else (None, 0)
+
+def stock_as_of(db, when, item_id = None):
+	# Get the amount of every item at a point in time as an ID -> amount dictionary (leaving out the ones at zero), or the amount of a single item
+	# The amounts start from the latest checkpoint before that time, so only the movements since then are read
+	checkpoint_id, last_movement = _checkpoint_before(db, when)
+	
+	if item_id is not None:
+		amount = 0
+		if checkpoint_id is not None:
+			row = db.execute("SELECT amount FROM `checkpoint_amounts` WHERE checkpoint_id = ? AND item_id = ?", (checkpoint_id, item_id)).fetchone()
+			amount = row[0] if row is not None else 0
+		
+		row = db.execute("SELECT IFNULL(SUM(delta), 0) FROM `movements` WHERE item_id = ? AND id > ? AND time <= ?", (item_id, last_movement, when)).fetchone()
+		return amount + row[0]
+	
+	amounts = {}
+	if checkpoint_id is not None:
+		amounts.update(db.execute("SELECT item_id, amount FROM `checkpoint_amounts` WHERE checkpoint_id = ?", (checkpoint_id, )).fetchall())
+	
+	for id, delta in db.execute("SELECT item_id, SUM(delta) FROM `movements` WHERE id > ? AND time <= ? GROUP BY item_id", (last_movement, when)):
+		amount = amounts.get(id, 0) + delta
+		if amount:
+			amounts[id] = amount
+		else:
+			amounts.pop(id, None)
+	
+	return amounts
+
+def movement_totals(db, since, until):
+	# Get the amounts added to and taken from every item in a period of time as an ID -> (added, taken) dictionary
+	# Items that have been added or removed as a whole don't count
+	rows = db.execute("""SELECT item_id, IFNULL(SUM(CASE WHEN delta > 0 THEN delta END), 0), IFNULL(SUM(CASE WHEN delta < 0 THEN -delta END), 0)
+		FROM `movements` WHERE time >= ? AND time < ? AND applied GROUP BY item_id""", (since, until))
+	return dict((id, (added, taken)) for id, added, taken in rows)
+
+def item_history(db, item_id):
+	# Get the movements of an item, oldest first, as (time, delta, reason) tuples
+	return [tuple(row) for row in db.execute("SELECT time, delta, reason FROM `movements` WHERE item_id = ? ORDER BY id", (item_id, ))]
\ No newline at end of file
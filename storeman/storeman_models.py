@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Data model classes
+"""
+
+import itertools
+import random
+import threading
+import time
+
+from storeman_collation import fold, sort_key
+
+class IdGenerator(object):
+	"""
+	Generates unique, time-ordered 63 bit integer IDs
+	
+	An ID consists of the milliseconds since EPOCH (41 bits), a random node number picked per process (10 bits)
+	and a sequence number (12 bits). IDs never repeat within a process, even if the clock goes backwards,
+	and blocks of consecutive IDs can be reserved at once for bulk inserts.
+	"""
+	
+	EPOCH = 1388534400000 # 2014-01-01 00:00:00 UTC in milliseconds
+	NODE_BITS = 10
+	SEQUENCE_BITS = 12
+	
+	def __init__(self, node = None):
+		self.node = node if node is not None else random.getrandbits(self.NODE_BITS)
+		self.last_timestamp = -1
+		self.sequence = 0
+		self.lock = threading.Lock()
+	
+	def allocate(self, count):
+		# Reserve a block of count IDs, returned as an iterator of consecutive ranges
+		max_sequence = 1 << self.SEQUENCE_BITS
+		ranges = []
+		
+		with self.lock:
+			timestamp = max(int(time.time() * 1000) - self.EPOCH, self.last_timestamp)
+			sequence = self.sequence if timestamp == self.last_timestamp else 0
+			
+			while count > 0:
+				if sequence == max_sequence:
+					# This millisecond is used up, borrow the next one
+					timestamp += 1
+					sequence = 0
+				
+				size = min(count, max_sequence - sequence)
+				base = (timestamp << (self.NODE_BITS + self.SEQUENCE_BITS)) | (self.node << self.SEQUENCE_BITS)
+				ranges.append(xrange(base + sequence, base + sequence + size))
+				sequence += size
+				count -= size
+			
+			self.last_timestamp = timestamp
+			self.sequence = sequence
+		
+		return itertools.chain(*ranges)
+	
+	def next_id(self):
+		# Get a single new ID
+		return next(self.allocate(1))
+	
+	def iter_ids(self, block_size = 1000):
+		# Endlessly yield new IDs, reserving them block by block
+		while True:
+			for id in self.allocate(block_size):
+				yield id
+
+# The ID generator used for all new places and items
+ID_GENERATOR = IdGenerator()
+
+def _generate_id():
+	# Generate a unique identifier
+	return ID_GENERATOR.next_id()
+
+def to_unicode(text):
+	# The GTK widgets give us UTF-8 byte strings, the database wants unicode
+	if isinstance(text, str):
+		return text.decode('utf-8')
+	
+	return text
+
+class StoragePlace(object):
+	"""
+	A class representing a place where you can store stuff (e.g. a box, a shelf etc.), which can be inside another place
+	"""
+	
+	__slots__ = ('id', 'name', 'location', 'type', 'parent_id')
+	
+	def __init__(self, id, name, location, type, parent_id = None):
+		self.id = id if id is not None else _generate_id()
+		self.name = name
+		self.location = location
+		self.type = type
+		self.parent_id = parent_id # None for places that aren't inside another one
+	
+	def __str__(self):
+		return "%s: %s @ %s (%s)" % (self.id, self.name, self.location, self.type)
+	
+	def save_to_db(self, db_cursor):
+		# Save the object to a database
+		entry = self.to_db_entry()
+		return db_cursor.execute("INSERT INTO `places` (id, name, location, type, parent_id, name_key, name_folded, location_folded, type_folded) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			(entry['id'], entry['name'], entry['location'], entry['type'], entry['parent_id'], sort_key(entry['name']), fold(entry['name']), fold(entry['location']), fold(entry['type'])))
+	
+	def to_db_entry(self):
+		# Get the database columns of the object
+		return {'id': self.id, 'name': to_unicode(self.name), 'location': to_unicode(self.location), 'type': to_unicode(self.type), 'parent_id': place_id_to_db(self.parent_id)}
+	
+	@classmethod
+	def from_db_entry(cls, entry):
+		# Create an object from a database entry (a dict or an sqlite3.Row), ignoring the columns that aren't attributes, like the sort keys
+		return cls(*[entry[key] for key in cls.__slots__])
+	
+	def add_item(self, item):
+		# Add a single item to the storage place
+		item.set_place(self)
+	
+	def add_items(self, items):
+		# Add multiple items to the storage place
+		for item in items:
+			item.set_place(self)
+
+# A dummy place to use if no place has been set on an item (or as the parent of the places that aren't inside another one)
+DUMMY_PLACE = StoragePlace(-1, "DUMMY", "DUMMY", "DUMMY")
+
+def place_id_to_db(place_id):
+	# Items without a place are stored with a NULL place_id
+	return None if place_id == DUMMY_PLACE.id else place_id
+
+class Item(object):
+	"""
+	A class representing an arbitrary item that can be stored in a StoragePlace
+	"""
+	
+	__slots__ = ('id', 'name', 'place', 'details', 'amount')
+	
+	def __init__(self, id, name, place = DUMMY_PLACE, details = None, amount = 1):
+		self.id = id if id is not None else _generate_id()
+		self.name = name
+		self.details = details
+		self.amount = amount
+		
+		if place is None:
+			place = DUMMY_PLACE
+		
+		self.set_place(place)
+	
+	def __str__(self):
+		return "%s: %s @ %s (%s, %i pcs.)" % (self.id, self.name, self.place.name, self.details, self.amount)
+	
+	def save_to_db(self, db_cursor):
+		# Save the object to a database
+		entry = self.to_db_entry()
+		return db_cursor.execute("INSERT INTO `items` (id, name, place_id, details, amount, name_key, details_key, name_folded, details_folded) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			(entry['id'], entry['name'], entry['place_id'], entry['details'], entry['amount'], sort_key(entry['name']), sort_key(entry['details']), fold(entry['name']), fold(entry['details'])))
+	
+	def to_db_entry(self):
+		# Get the database columns of the object
+		return {'id': self.id, 'name': to_unicode(self.name), 'place_id': place_id_to_db(self.place.id), 'details': to_unicode(self.details or ""), 'amount': self.amount}
+	
+	@classmethod
+	def from_db_entry(cls, entry):
+		# Create an object from a database entry
+		
+		# Only the ID of the place is known here; the GUI and the CLI look places up by their ID, so nothing else is loaded
+		if entry['place_id'] is None or entry['place_id'] == DUMMY_PLACE.id:
+			place = DUMMY_PLACE
+		else:
+			place = StoragePlace(entry['place_id'], "UNKNOWN", "UNKNOWN", "UNKNOWN")
+		
+		return cls(entry['id'], entry['name'], place, entry['details'], entry['amount'])
+	
+	def set_place(self, place):
+		# Put the item into a storage place
+		self.place = place
\ No newline at end of file
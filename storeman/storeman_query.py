@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+The query language of the search box, parsed into a tree and compiled to SQL
+"""
+
+import collections
+import re
+import sys
+
+from storeman_collation import fold
+
+# A query is a sequence of terms that all have to match, e.g. place:"Shelf 3" amount<5 details:resistor 10k or in:"Room 2"
+# Terms are words, "quoted phrases" or field:value comparisons; OR, a leading - (not) and parentheses combine them.
+# A field value ending with an unquoted * (name:res*) matches the texts starting with the rest of it.
+TOKENS = re.compile(r"""\s*(?:
+	(?P<open>\() |
+	(?P<close>\)) |
+	(?P<field>[A-Za-z]+)(?P<op>:|!=|<=|>=|=|<|>)(?P<value>"(?:[^"\\]|\\.)*"?|[^\s()]*) |
+	(?P<not>-)(?=[^\s)]) |
+	(?P<phrase>"(?:[^"\\]|\\.)*"?) |
+	(?P<word>[^\s()]+)
+)""", re.VERBOSE | re.UNICODE)
+
+# Fields of the items and the columns they compare; the place fields are looked up in the places table
+# Texts are compared in their case-folded columns (see storeman_db.FOLDED_COLUMNS), folded the same way as the values given to matches()
+ITEM_FIELDS = {
+	'name': "i.name_folded",
+	'details': "i.details_folded",
+	'amount': "i.amount",
+}
+
+PLACE_FIELDS = {
+	'place': "name_folded",
+	'location': "location_folded",
+	'type': "type_folded",
+}
+
+# Fields that match if the item's place or any place it's inside of matches
+TREE_FIELDS = {
+	'in': "name_folded",
+}
+
+NUMERIC_FIELDS = ('amount', )
+
+# Tables the place fields are looked up in, for a single database or across all stores (see storeman_stores)
+TABLES = {
+	'places': "`places`",
+	'place_tree': "`place_tree`",
+}
+
+STORE_TABLES = {
+	'places': "`store_places`",
+	'place_tree': "`store_place_tree`",
+}
+
+OPERATORS = {
+	'=': "=",
+	'!=': "<>",
+	'<': "<",
+	'<=': "<=",
+	'>': ">",
+	'>=': ">=",
+}
+
+# Number of compiled queries to keep
+CACHE_SIZE = 100
+
+class QuerySyntaxError(ValueError):
+	"""
+	Raised for a query that can't be parsed
+	"""
+
+def _unquote(value):
+	# Remove the quotes around a phrase (the closing one may be missing while it's being typed) and its escapes
+	if value.startswith('"'):
+		value = value[1:-1] if len(value) > 1 and value.endswith('"') and not value.endswith('\\"') else value[1:]
+		value = re.sub(r"\\(.)", r"\1", value)
+	
+	return value
+
+def _prefix_range(value):
+	# Get the range of the texts starting with a value as the value and the first text after all of them, None if there is none
+	# SQLite compares texts by their UTF-8 bytes, which is the order of the code points, so the range can be searched in an index
+	for index in reversed(xrange(len(value))):
+		code = ord(value[index])
+		if code < sys.maxunicode:
+			return value, value[:index] + unichr(code + 1)
+	
+	return value, None
+
+def _compare(a, op, b):
+	if op == '=':
+		return a == b
+	elif op == '!=':
+		return a != b
+	elif op == '<':
+		return a < b
+	elif op == '<=':
+		return a <= b
+	elif op == '>':
+		return a > b
+	
+	return a >= b
+
+def _in_tree(condition, tables):
+	# Get the condition for items stored in a place matching a condition on the places (aliased p), or anywhere inside one
+	return "(i.place_id IS NOT NULL AND i.place_id IN (SELECT t.descendant_id FROM %s t JOIN %s p ON p.id = t.ancestor_id WHERE %s))" % (tables['place_tree'], tables['places'], condition)
+
+class And(object):
+	"""
+	Matches if all children match
+	"""
+	
+	__slots__ = ('children', )
+	
+	def __init__(self, children):
+		self.children = children
+	
+	def sql(self, params, tables):
+		return "(%s)" % " AND ".join(child.sql(params, tables) for child in self.children)
+	
+	def matches(self, values):
+		return all(child.matches(values) for child in self.children)
+
+class Or(object):
+	"""
+	Matches if any child matches
+	"""
+	
+	__slots__ = ('children', )
+	
+	def __init__(self, children):
+		self.children = children
+	
+	def sql(self, params, tables):
+		return "(%s)" % " OR ".join(child.sql(params, tables) for child in self.children)
+	
+	def matches(self, values):
+		return any(child.matches(values) for child in self.children)
+
+class Not(object):
+	"""
+	Matches if its child doesn't
+	"""
+	
+	__slots__ = ('child', )
+	
+	def __init__(self, child):
+		self.child = child
+	
+	def sql(self, params, tables):
+		return "NOT (%s)" % self.child.sql(params, tables)
+	
+	def matches(self, values):
+		return not self.child.matches(values)
+
+class Contains(object):
+	"""
+	Matches if a field (or, without one, the name or the details) contains a text, ignoring case
+	"""
+	
+	__slots__ = ('field', 'value', 'folded')
+	
+	def __init__(self, field, value):
+		self.field = field
+		self.value = value
+		self.folded = fold(value)
+	
+	def sql(self, params, tables):
+		contains = "instr(%s, ?) > 0"
+		if self.field is None:
+			params.extend((self.folded, self.folded))
+			return "(%s OR %s)" % (contains % ITEM_FIELDS['name'], contains % ITEM_FIELDS['details'])
+		
+		params.append(self.folded)
+		if self.field in PLACE_FIELDS:
+			# Items without a place don't match, not even when negated
+			return "(i.place_id IS NOT NULL AND i.place_id IN (SELECT id FROM %s WHERE %s))" % (tables['places'], contains % PLACE_FIELDS[self.field])
+		
+		if self.field in TREE_FIELDS:
+			return _in_tree(contains % ("p." + TREE_FIELDS[self.field]), tables)
+		
+		return contains % ITEM_FIELDS[self.field]
+	
+	def matches(self, values):
+		value = self.folded
+		if self.field is None:
+			return value in values['name'] or value in values['details']
+		
+		if self.field in TREE_FIELDS:
+			return any(value in text for text in values[self.field])
+		
+		text = values[self.field]
+		return text is not None and value in text
+
+class Prefix(object):
+	"""
+	Matches if a text field starts with a text, ignoring case
+	"""
+	
+	__slots__ = ('field', 'value', 'folded')
+	
+	def __init__(self, field, value):
+		self.field = field
+		self.value = value
+		self.folded = fold(value)
+	
+	def _condition(self, column, params):
+		start, end = _prefix_range(self.folded)
+		params.append(start)
+		if end is None:
+			return "%s >= ?" % column
+		
+		params.append(end)
+		return "(%s >= ? AND %s < ?)" % (column, column)
+	
+	def sql(self, params, tables):
+		if self.field in PLACE_FIELDS:
+			return "(i.place_id IS NOT NULL AND i.place_id IN (SELECT id FROM %s WHERE %s))" % (tables['places'], self._condition(PLACE_FIELDS[self.field], params))
+		
+		if self.field in TREE_FIELDS:
+			return _in_tree(self._condition("p." + TREE_FIELDS[self.field], params), tables)
+		
+		return self._condition(ITEM_FIELDS[self.field], params)
+	
+	def matches(self, values):
+		value = values[self.field]
+		if value is None:
+			return False
+		
+		if self.field in TREE_FIELDS:
+			return any(text.startswith(self.folded) for text in value)
+		
+		return value.startswith(self.folded)
+
+class Compare(object):
+	"""
+	Matches if a field compares to a value with the given operator; texts are compared ignoring case
+	"""
+	
+	__slots__ = ('field', 'op', 'value', 'folded')
+	
+	def __init__(self, field, op, value):
+		self.field = field
+		self.op = op
+		self.value = value
+		self.folded = value if field in NUMERIC_FIELDS else fold(value)
+	
+	def sql(self, params, tables):
+		params.append(self.folded)
+		if self.field in PLACE_FIELDS:
+			return "(i.place_id IS NOT NULL AND i.place_id IN (SELECT id FROM %s WHERE %s %s ?))" % (tables['places'], PLACE_FIELDS[self.field], OPERATORS[self.op])
+		
+		if self.field in TREE_FIELDS:
+			return _in_tree("p.%s %s ?" % (TREE_FIELDS[self.field], OPERATORS[self.op]), tables)
+		
+		return "%s %s ?" % (ITEM_FIELDS[self.field], OPERATORS[self.op])
+	
+	def matches(self, values):
+		value = values[self.field]
+		if value is None:
+			return False
+		
+		if self.field in NUMERIC_FIELDS:
+			return _compare(value, self.op, self.value)
+		
+		if self.field in TREE_FIELDS:
+			return any(_compare(text, self.op, self.folded) for text in value)
+		
+		return _compare(value, self.op, self.folded)
+
+class _Parser(object):
+	"""
+	A recursive descent parser for the tokens of a query
+	"""
+	
+	def __init__(self, text):
+		self.tokens = self._tokenize(text)
+		self.position = 0
+	
+	def _tokenize(self, text):
+		tokens = []
+		position = 0
+		text = text.rstrip()
+		while position < len(text):
+			match = TOKENS.match(text, position)
+			position = match.end()
+			kind = match.lastgroup
+			if kind == 'value':
+				field = match.group('field').lower()
+				op = match.group('op')
+				value = _unquote(match.group('value'))
+				if op == ':' and value.endswith("*") and not match.group('value').startswith('"'):
+					op = '*'
+					value = value[:-1]
+				if field not in ITEM_FIELDS and field not in PLACE_FIELDS and field not in TREE_FIELDS:
+					# Not a field we know, so it's just a word with a colon in it
+					tokens.append(('word', match.group(0).strip()))
+				elif value:
+					# A field without a value is still being typed and matches everything
+					tokens.append(('term', field, op, value))
+			elif kind == 'phrase':
+				value = _unquote(match.group('phrase'))
+				if value:
+					tokens.append(('word', value))
+			elif kind == 'word' and match.group('word') == "OR":
+				tokens.append(('or', ))
+			else:
+				tokens.append((kind, match.group(kind)))
+		
+		return tokens
+	
+	def _peek(self):
+		return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+	
+	def _next(self):
+		token = self.tokens[self.position]
+		self.position += 1
+		return token
+	
+	def parse(self):
+		# Get the tree of the whole query, None for an empty one
+		if not self.tokens:
+			return None
+		
+		tree = self._parse_or()
+		if self.position < len(self.tokens):
+			raise QuerySyntaxError("Unexpected )")
+		
+		return tree
+	
+	def _parse_or(self):
+		children = [self._parse_and()]
+		while self._peek() == 'or':
+			self._next()
+			children.append(self._parse_and())
+		
+		return children[0] if len(children) == 1 else Or(children)
+	
+	def _parse_and(self):
+		children = []
+		while self._peek() not in (None, 'or', 'close'):
+			children.append(self._parse_unary())
+		
+		if not children:
+			raise QuerySyntaxError("Missing search term")
+		
+		return children[0] if len(children) == 1 else And(children)
+	
+	def _parse_unary(self):
+		token = self._next()
+		if token[0] == 'not':
+			if self._peek() in (None, 'or', 'close'):
+				raise QuerySyntaxError("Missing search term after -")
+			return Not(self._parse_unary())
+		
+		if token[0] == 'open':
+			tree = self._parse_or()
+			if self._peek() != 'close':
+				raise QuerySyntaxError("Missing )")
+			self._next()
+			return tree
+		
+		if token[0] == 'term':
+			return self._term(*token[1:])
+		
+		return Contains(None, token[1])
+	
+	def _term(self, field, op, value):
+		if field in NUMERIC_FIELDS:
+			if op == '*':
+				raise QuerySyntaxError("%s can't be matched by its start" % field)
+			try:
+				value = int(value)
+			except ValueError:
+				raise QuerySyntaxError("%s needs a number, not %s" % (field, value))
+			
+			# For numbers, a colon means equal
+			return Compare(field, '=' if op == ':' else op, value)
+		
+		if op == ':':
+			return Contains(field, value)
+		
+		if op == '*':
+			return Prefix(field, value)
+		
+		return Compare(field, op, value)
+
+class Query(object):
+	"""
+	A parsed search query, compiled to an SQL condition on the items table (aliased i)
+	
+	Queries that are nothing but words can also be answered by the SearchIndex, which is_plain tells. With stores, the
+	places are looked up in the views over all stores instead of the places of a single database.
+	"""
+	
+	def __init__(self, text, stores = False):
+		self.text = text
+		self.tree = _Parser(text).parse()
+		
+		params = []
+		self.where = self.tree.sql(params, STORE_TABLES if stores else TABLES) if self.tree is not None else None
+		self.params = tuple(params)
+		
+		# The words of the query that count towards the score of an item
+		terms = self.tree.children if isinstance(self.tree, And) else [self.tree] if self.tree is not None else []
+		words = [term.value for term in terms if isinstance(term, Contains) and term.field is None]
+		self.words = u" ".join(words)
+		self.is_plain = len(words) == len(terms) and not any(len(word.split()) != 1 for word in words)
+	
+	def matches(self, values):
+		# Check whether an item matches; values maps the field names to its values, the texts case-folded (see storeman_collation), with None for the
+		# place fields of items without a place and a list of the names of its place and the places that one is inside of for the tree fields
+		return self.tree is None or self.tree.matches(values)
+
+_cache = collections.OrderedDict()
+
+def compile_query(text, stores = False):
+	# Get the compiled query for a text, reusing the last CACHE_SIZE ones
+	key = (text, stores)
+	query = _cache.pop(key, None)
+	if query is None:
+		query = Query(text, stores)
+		while len(_cache) >= CACHE_SIZE:
+			_cache.popitem(last = False)
+	
+	_cache[key] = query
+	return query
\ No newline at end of file
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+In-memory full-text search over item names and details
+"""
+
+from storeman_collation import fold
+
+def _normalize(text):
+	# Bring a text into the form used for indexing and matching
+	return fold(text)
+
+def _trigrams(text):
+	# Get the set of all three-character substrings of a text
+	return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+class SearchIndex(object):
+	"""
+	A trigram index over the name and details of items
+	
+	A query is split into words and every word has to occur somewhere in the name or the details of an item.
+	Candidates for words of three or more characters come straight from the trigram sets, so only they are checked.
+	"""
+	
+	# Score of a word matching the start of the name, somewhere in the name or only in the details
+	SCORE_NAME_PREFIX = 3
+	SCORE_NAME = 2
+	SCORE_DETAILS = 1
+	
+	def __init__(self):
+		self.documents = {} # ID -> (normalized name, normalized details)
+		self.trigrams = {} # Trigram -> set of IDs
+	
+	def __len__(self):
+		return len(self.documents)
+	
+	def __contains__(self, id):
+		return id in self.documents
+	
+	def clear(self):
+		self.documents.clear()
+		self.trigrams.clear()
+	
+	def add(self, id, name, details):
+		# Add an item to the index
+		if id in self.documents:
+			self.remove(id)
+		
+		name = _normalize(name)
+		details = _normalize(details)
+		self.documents[id] = (name, details)
+		
+		trigrams = self.trigrams
+		for trigram in _trigrams(name) | _trigrams(details):
+			if trigram in trigrams:
+				trigrams[trigram].add(id)
+			else:
+				trigrams[trigram] = set((id, ))
+	
+	def get_folded(self, id, name, details):
+		# Get the case-folded name and details of an item, from the index if it's in there
+		document = self.documents.get(id)
+		if document is None:
+			return (_normalize(name), _normalize(details))
+		
+		return document
+	
+	def update(self, id, name, details):
+		# Re-index an item after its name or details have changed
+		self.add(id, name, details)
+	
+	def remove(self, id):
+		# Remove an item from the index
+		document = self.documents.pop(id, None)
+		if document is None:
+			return False
+		
+		for trigram in _trigrams(document[0]) | _trigrams(document[1]):
+			ids = self.trigrams.get(trigram)
+			if ids is not None:
+				ids.discard(id)
+				if not ids:
+					del self.trigrams[trigram]
+		
+		return True
+	
+	def _candidates(self, word):
+		# Get the IDs that can contain the given word
+		trigrams = _trigrams(word)
+		if not trigrams:
+			# Too short to use the index
+			return self.documents
+		
+		sets = []
+		for trigram in trigrams:
+			ids = self.trigrams.get(trigram)
+			if not ids:
+				return ()
+			sets.append(ids)
+		
+		sets.sort(key = len)
+		return sets[0].intersection(*sets[1:])
+	
+	def _score_document(self, document, words):
+		# Get the score of a document for the given words or 0 if it doesn't match all of them
+		name, details = document
+		score = 0
+		for word in words:
+			if name.startswith(word):
+				score += self.SCORE_NAME_PREFIX
+			elif word in name:
+				score += self.SCORE_NAME
+			elif word in details:
+				score += self.SCORE_DETAILS
+			else:
+				return 0
+		
+		return score
+	
+	def score(self, id, query):
+		# Get the score of a single item for the given query or 0 if it doesn't match
+		document = self.documents.get(id)
+		words = _normalize(query).split()
+		if document is None or not words:
+			return 0
+		
+		return self._score_document(document, words)
+	
+	def search(self, query):
+		# Get a dictionary of matching IDs -> score for the given query
+		words = _normalize(query).split()
+		if not words:
+			return dict.fromkeys(self.documents, 0)
+		
+		# Start with the word that has the fewest candidates
+		candidates = min((self._candidates(word) for word in words), key = len)
+		
+		results = {}
+		documents = self.documents
+		for id in candidates:
+			score = self._score_document(documents[id], words)
+			if score:
+				results[id] = score
+		
+		return results
+	
+	def ranked(self, query):
+		# Get the matching IDs for the given query, best matches first
+		results = self.search(query)
+		return sorted(results, key = results.get, reverse = True)
\ No newline at end of file
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+A compact binary copy of the ListStore rows, for starting without reading the database
+"""
+
+import itertools
+import mmap
+import os
+import struct
+
+MAGIC = "SMSNAP02"
+
+# Magic, schema version, change counter, number of places, number of items
+HEADER = struct.Struct("<8siqii")
+
+# Columns of the place rows and the item rows, in the order of the store columns (places parents first): 'q' are 64 bit integers, 's' are strings
+PLACE_COLUMNS = "qsssqqqssss"
+ITEM_COLUMNS = "qqsssqssss"
+
+# Strings are stored one after another, separated by this byte
+SEPARATOR = "\0"
+
+def snapshot_path(database):
+	# The snapshot is kept next to the database
+	return database + ".snapshot"
+
+def _encode(value):
+	if isinstance(value, unicode):
+		return value.encode('utf-8')
+	
+	return value
+
+def _write_columns(f, rows, types):
+	# Write the columns of a list of rows, each one as its length in bytes followed by the data
+	for column, type in enumerate(types):
+		if type == 's':
+			values = [_encode(row[column]) for row in rows]
+			if any(SEPARATOR in value for value in values):
+				raise ValueError("Strings containing NUL bytes can't be stored in a snapshot")
+			data = SEPARATOR.join(values)
+		else:
+			data = struct.pack("<%i%s" % (len(rows), type), *[row[column] for row in rows])
+		f.write(struct.pack("<q", len(data)))
+		f.write(data)
+
+def _read_columns(buffer, offset, count, types):
+	# Read the columns written by _write_columns, returning them and the offset after the last one
+	columns = []
+	for type in types:
+		length = struct.unpack_from("<q", buffer, offset)[0]
+		offset += 8
+		if type == 's':
+			column = buffer[offset:offset + length].split(SEPARATOR) if count else []
+		elif length != count * struct.calcsize("<" + type):
+			raise ValueError("Damaged snapshot")
+		else:
+			column = struct.unpack_from("<%i%s" % (count, type), buffer, offset)
+		offset += length
+		if len(column) != count:
+			raise ValueError("Damaged snapshot")
+		columns.append(column)
+	
+	return columns, offset
+
+def write_snapshot(filename, schema_version, change_counter, place_rows, item_rows):
+	# Write the rows of the place and item ListStores, replacing the old snapshot only once the new one is complete
+	place_rows = list(place_rows)
+	item_rows = list(item_rows)
+	temp_filename = filename + ".tmp"
+	with open(temp_filename, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, schema_version, change_counter, len(place_rows), len(item_rows)))
+		_write_columns(f, place_rows, PLACE_COLUMNS)
+		_write_columns(f, item_rows, ITEM_COLUMNS)
+	
+	os.rename(temp_filename, filename)
+
+def read_snapshot(filename, schema_version, change_counter):
+	# Get iterators over the place and item rows and the number of items, or None if there's no valid snapshot
+	try:
+		f = open(filename, 'rb')
+	except IOError:
+		return None
+	
+	try:
+		buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+	except (ValueError, EnvironmentError):
+		# Empty file
+		f.close()
+		return None
+	
+	try:
+		if len(buffer) < HEADER.size:
+			return None
+		
+		magic, version, counter, place_count, item_count = HEADER.unpack_from(buffer, 0)
+		if magic != MAGIC or version != schema_version or counter != change_counter:
+			return None
+		
+		place_columns, offset = _read_columns(buffer, HEADER.size, place_count, PLACE_COLUMNS)
+		item_columns, offset = _read_columns(buffer, offset, item_count, ITEM_COLUMNS)
+	except (ValueError, struct.error):
+		return None
+	finally:
+		buffer.close()
+		f.close()
+	
+	return itertools.izip(*place_columns), itertools.izip(*item_columns), item_count
\ No newline at end of file
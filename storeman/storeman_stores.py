@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Several inventory databases (stores) opened at once, attached to one connection and read through views spanning all of them
+"""
+
+import os
+
+from storeman_db import open_database, quote_name
+
+# Temporary views over the places, items, place tree and totals of all stores, each row with the name of its store
+STORE_VIEWS = (
+	('store_places', 'places', "id, name, location, type, parent_id, name_key, name_folded, location_folded, type_folded"),
+	('store_items', 'items', "id, name, place_id, details, amount, name_key, details_key, name_folded, details_folded"),
+	('store_place_tree', 'place_tree', "ancestor_id, descendant_id, depth"),
+	('store_place_totals', 'place_totals', "place_id, item_count, total_amount"),
+)
+
+# The same as storeman_db.SUBTREE_TOTALS, over all stores
+STORE_SUBTREE_TOTALS = """SELECT c.ancestor_id AS place_id, SUM(t.item_count) AS item_count, SUM(t.total_amount) AS total_amount
+	FROM `store_place_tree` c JOIN `store_place_totals` t ON t.place_id = c.descendant_id GROUP BY c.ancestor_id"""
+
+# Schema names SQLite keeps for itself
+RESERVED_NAMES = ('main', 'temp')
+
+class StoreError(RuntimeError):
+	"""
+	Raised for a store that can't be opened next to the others
+	"""
+
+def store_name(filename):
+	# Get the name a store is shown with: its file name without the extension
+	return os.path.splitext(os.path.basename(filename))[0]
+
+def _quote_text(text):
+	return "'%s'" % text.replace("'", "''")
+
+def _find_shared_id(db, schema, other):
+	# Get a table in which two stores have a row with the same ID, or None; the views rely on the IDs being unique across all stores
+	for table in ('places', 'items'):
+		if db.execute("SELECT 1 FROM %s.`%s` WHERE id IN (SELECT id FROM %s.`%s`) LIMIT 1" % (quote_name(schema), table, quote_name(other), table)).fetchone():
+			return table
+	
+	return None
+
+def attach_stores(db, main_name, filenames):
+	# Attach the databases of other stores to a connection under their names, migrating them first; returns the names
+	names = []
+	for filename in filenames:
+		name = store_name(filename)
+		if name.lower() in RESERVED_NAMES:
+			raise StoreError("A store can't be called %s, rename the file %s" % (name, filename))
+		
+		if name.lower() in [other.lower() for other in [main_name] + names]:
+			raise StoreError("There is more than one store called %s, rename one of the files" % name)
+		
+		if not os.path.exists(filename):
+			raise StoreError("There is no database %s" % filename)
+		
+		open_database(filename).close()
+		
+		# Attaching doesn't work within a transaction
+		db.commit()
+		db.execute("ATTACH DATABASE ? AS %s" % quote_name(name), (filename, ))
+		for other in ['main'] + names:
+			table = _find_shared_id(db, name, other)
+			if table is not None:
+				db.execute("DETACH DATABASE %s" % quote_name(name))
+				raise StoreError("The stores %s and %s have %s with the same ID, they can't be opened together" % (name, main_name if other == 'main' else other, table))
+		names.append(name)
+	
+	return names
+
+def create_store_views(db, main_name, names = ()):
+	# Create the views over the main database (shown as main_name) and the attached stores for this connection
+	schemas = [('main', main_name)] + [(name, name) for name in names]
+	for view, table, columns in STORE_VIEWS:
+		selects = ["SELECT %s AS store, %s FROM %s.`%s`" % (_quote_text(name), columns, quote_name(schema), table) for schema, name in schemas]
+		db.execute("DROP VIEW IF EXISTS temp.`%s`" % view)
+		db.execute("CREATE TEMP VIEW `%s` AS %s" % (view, " UNION ALL ".join(selects)))
\ No newline at end of file
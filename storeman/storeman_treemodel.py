@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+A TreeModel that reads its rows from the database on demand
+"""
+
+import collections
+import gobject
+import gtk
+
+class SQLiteItemModel(gtk.GenericTreeModel):
+	"""
+	A lazy, read-through TreeModel over the items of all stores (see storeman_stores)
+	
+	Rows are fetched in pages of PAGE_SIZE rows and kept in an LRU cache of CACHE_PAGES pages, keyed by the sort
+	order and the filter, so only the rows the view actually shows are ever read. The columns are the same as the
+	ones of GUI.liststore_items.
+	
+	Pages are read by keyset: the sort keys of the first and last row of every page read so far are kept, and a page
+	is read from the nearest one of those (or from either end of the list) on, instead of skipping all rows before it
+	with OFFSET. Scrolling through the list or jumping to its end only ever reads the rows that are shown.
+	"""
+	
+	COLUMN_TYPES = (gobject.TYPE_INT64, gobject.TYPE_INT64, str, str, str, int, str, str, str, str)
+	
+	SELECT = """SELECT i.id, IFNULL(i.place_id, -1), IFNULL(p.name, 'UNKNOWN'), i.name, i.details, i.amount, IFNULL(p.name_key, ''), i.name_key, i.details_key, i.store
+		FROM `store_items` i LEFT JOIN `store_places` p ON p.id = i.place_id"""
+	COUNT = "SELECT COUNT(*) FROM `store_items` i"
+	
+	# SQL expressions to sort by, for each sortable column; texts are sorted by their indexed sort keys (see storeman_collation)
+	SORT_EXPRESSIONS = {
+		5: "i.amount",
+		6: "IFNULL(p.name_key, '')",
+		7: "i.name_key",
+		8: "i.details_key",
+		9: "i.store",
+	}
+	
+	PAGE_SIZE = 200
+	CACHE_PAGES = 50
+	
+	def __init__(self, db):
+		gtk.GenericTreeModel.__init__(self)
+		self.db = db
+		
+		self.sort_column = None
+		self.sort_order = gtk.SORT_ASCENDING
+		self.filter_where = None
+		self.filter_params = ()
+		
+		self.pages = collections.OrderedDict() # (sort, filter, page number) -> list of rows
+		self.bounds = {} # (sort, filter) -> {page number: (sort key of its first row, sort key of its last row)}
+		self.counts = {} # Filter -> number of rows
+	
+	def _read(self, query, params):
+		cur = self.db.cursor()
+		cur.row_factory = None
+		cur.execute(query, params)
+		rows = cur.fetchall()
+		cur.close()
+		return rows
+	
+	def _sort_key(self):
+		return (self.sort_column, self.sort_order)
+	
+	def _filter_key(self):
+		return (self.filter_where, self.filter_params)
+	
+	def _where(self):
+		return " WHERE %s" % self.filter_where if self.filter_where else ""
+	
+	def _order_by(self, reverse = False):
+		direction = "DESC" if (self.sort_order == gtk.SORT_DESCENDING) != reverse else "ASC"
+		expression = self.SORT_EXPRESSIONS.get(self.sort_column)
+		if expression is None:
+			return " ORDER BY i.id %s" % direction
+		
+		return " ORDER BY %s %s, i.id %s" % (expression, direction, direction)
+	
+	def _row_key(self, row):
+		# Get the sort key of a row: the value it's sorted by and its ID, which makes it unique
+		if self.sort_column in self.SORT_EXPRESSIONS:
+			return (row[self.sort_column], row[0])
+		
+		return (row[0], )
+	
+	def _seek(self, key, before = False):
+		# Get the condition for the rows sorted after (or before) the row with the given sort key
+		expression = self.SORT_EXPRESSIONS.get(self.sort_column)
+		operator = "<" if (self.sort_order == gtk.SORT_DESCENDING) != before else ">"
+		if expression is None:
+			return "i.id %s ?" % operator
+		
+		return "(%s, i.id) %s (?, ?)" % (expression, operator)
+	
+	def _read_page(self, number):
+		# Read a page from the nearest page whose bounds are known, or from the start or the end of the list
+		bounds = self.bounds.setdefault((self._sort_key(), self._filter_key()), {})
+		start = number * self.PAGE_SIZE
+		
+		# Each way to get there: (rows to skip, key to seek from or None, whether to read backwards, rows to read)
+		ways = [(start, None, False, self.PAGE_SIZE)]
+		for other, (first, last) in bounds.iteritems():
+			if other == number:
+				# The page itself has been dropped from the cache
+				continue
+			elif other < number:
+				ways.append(((number - other - 1) * self.PAGE_SIZE, last, False, self.PAGE_SIZE))
+			else:
+				ways.append(((other - number - 1) * self.PAGE_SIZE, first, True, self.PAGE_SIZE))
+		if start >= self.PAGE_SIZE:
+			count = self.get_count()
+			end = min(start + self.PAGE_SIZE, count)
+			if end <= start:
+				return []
+			ways.append((count - end, None, True, end - start))
+		skip, key, backwards, limit = min(ways)
+		
+		conditions = ["(%s)" % self.filter_where] if self.filter_where else []
+		params = self.filter_params
+		if key is not None:
+			conditions.append(self._seek(key, before = backwards))
+			params += key
+		where = " WHERE %s" % " AND ".join(conditions) if conditions else ""
+		
+		page = [list(row) for row in self._read(self.SELECT + where + self._order_by(reverse = backwards) + " LIMIT ? OFFSET ?", params + (limit, skip))]
+		if backwards:
+			page.reverse()
+		if page:
+			bounds[number] = (self._row_key(page[0]), self._row_key(page[-1]))
+		
+		return page
+	
+	def _get_page(self, number):
+		# Get a page of rows, from the cache if possible
+		key = (self._sort_key(), self._filter_key(), number)
+		page = self.pages.pop(key, None)
+		if page is None:
+			page = self._read_page(number)
+			while len(self.pages) >= self.CACHE_PAGES:
+				self.pages.popitem(last = False)
+		
+		self.pages[key] = page
+		return page
+	
+	def _get_row(self, index):
+		page = self._get_page(index // self.PAGE_SIZE)
+		try:
+			return page[index % self.PAGE_SIZE]
+		except IndexError:
+			return None
+	
+	def get_count(self):
+		# Get the number of rows matching the current filter
+		key = self._filter_key()
+		count = self.counts.get(key)
+		if count is None:
+			count = self._read(self.COUNT + self._where(), self.filter_params)[0][0]
+			self.counts[key] = count
+		
+		return count
+	
+	def invalidate(self):
+		# Forget all cached rows and counts, e.g. after the database has been changed behind our back
+		self.pages.clear()
+		self.bounds.clear()
+		self.counts.clear()
+	
+	def set_sort(self, column, order = gtk.SORT_ASCENDING):
+		# Sort by the given column; the view has to be reattached afterwards
+		self.sort_column = column
+		self.sort_order = order
+	
+	def set_filter(self, where = None, params = ()):
+		# Only show rows matching an SQL condition on the items table (aliased i); the view has to be reattached afterwards
+		self.filter_where = where
+		self.filter_params = tuple(params)
+	
+	def set_query(self, query):
+		# Only show rows matching a compiled search query (see storeman_query), or no rows at all for None
+		if query is None:
+			self.set_filter("0")
+		else:
+			self.set_filter(query.where, query.params)
+	
+	def find_path(self, id):
+		# Get the path of the row with the given ID, or None if it doesn't match the filter
+		for key, page in self.pages.iteritems():
+			if key[:2] == (self._sort_key(), self._filter_key()):
+				for offset, row in enumerate(page):
+					if row[0] == id:
+						return (key[2] * self.PAGE_SIZE + offset, )
+		
+		expression = self.SORT_EXPRESSIONS.get(self.sort_column)
+		where = "i.id = ?" + (" AND (%s)" % self.filter_where if self.filter_where else "")
+		rows = self._read("SELECT %s FROM `store_items` i LEFT JOIN `store_places` p ON p.id = i.place_id WHERE %s" % (expression or "i.id", where), (id, ) + self.filter_params)
+		if not rows:
+			return None
+		
+		# Count the rows sorted before this one
+		key = (rows[0][0], id) if expression is not None else (id, )
+		query = self.COUNT + " LEFT JOIN `store_places` p ON p.id = i.place_id WHERE " + self._seek(key, before = True) + (" AND (%s)" % self.filter_where if self.filter_where else "")
+		return (self._read(query, key + self.filter_params)[0][0], )
+	
+	def update_row(self, id, column, value):
+		# Change a value in the cached copy of a row after it has been changed in the database
+		for key, page in self.pages.iteritems():
+			for offset, row in enumerate(page):
+				if row[0] == id:
+					row[column] = value
+					if key[:2] == (self._sort_key(), self._filter_key()):
+						path = (key[2] * self.PAGE_SIZE + offset, )
+						self.row_changed(path, self.get_iter(path))
+	
+	def row_added(self, path):
+		# Tell the view about a row that has been added to the database at the given path
+		self.invalidate()
+		self.row_inserted(path, self.get_iter(path))
+	
+	def row_removed(self, path):
+		# Tell the view about a row that has been removed from the database at the given path
+		self.invalidate()
+		self.row_deleted(path)
+	
+	def on_get_flags(self):
+		return gtk.TREE_MODEL_LIST_ONLY
+	
+	def on_get_n_columns(self):
+		return len(self.COLUMN_TYPES)
+	
+	def on_get_column_type(self, column):
+		return self.COLUMN_TYPES[column]
+	
+	def on_get_iter(self, path):
+		if path[0] < self.get_count():
+			return path[0]
+		
+		return None
+	
+	def on_get_path(self, rowref):
+		return (rowref, )
+	
+	def on_get_value(self, rowref, column):
+		row = self._get_row(rowref)
+		if row is None:
+			return None
+		
+		return row[column]
+	
+	def on_iter_next(self, rowref):
+		if rowref + 1 < self.get_count():
+			return rowref + 1
+		
+		return None
+	
+	def on_iter_children(self, rowref):
+		if rowref is None and self.get_count():
+			return 0
+		
+		return None
+	
+	def on_iter_has_child(self, rowref):
+		return False
+	
+	def on_iter_n_children(self, rowref):
+		if rowref is None:
+			return self.get_count()
+		
+		return 0
+	
+	def on_iter_nth_child(self, rowref, n):
+		if rowref is None and n < self.get_count():
+			return n
+		
+		return None
+	
+	def on_iter_parent(self, rowref):
+		return None
\ No newline at end of file
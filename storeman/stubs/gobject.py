@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Minimal stand-in for the gobject module, used to run the GUI code headless
+"""
+
+import time
+
+TYPE_INT64 = long
+TYPE_UINT64 = long
+TYPE_STRING = str
+TYPE_PYOBJECT = object
+
+_sources = {}
+_next_source_id = [1]
+
+def _add_source(interval, callback, args):
+	source_id = _next_source_id[0]
+	_next_source_id[0] += 1
+	_sources[source_id] = [time.time() + interval / 1000.0, interval, callback, args]
+	return source_id
+
+def threads_init():
+	pass
+
+def idle_add(callback, *args, **kwargs):
+	return _add_source(0, callback, args)
+
+def timeout_add(interval, callback, *args, **kwargs):
+	return _add_source(interval, callback, args)
+
+def timeout_add_seconds(interval, callback, *args, **kwargs):
+	return _add_source(interval * 1000, callback, args)
+
+def source_remove(source_id):
+	return _sources.pop(source_id, None) is not None
+
+def pending():
+	return bool(_sources)
+
+def iteration(wait_timers = False):
+	# Dispatch the next due source; idle sources and expired timers run first
+	if not _sources:
+		return False
+	
+	source_id, source = min(_sources.items(), key = lambda entry: (entry[1][0], entry[0]))
+	delay = source[0] - time.time()
+	if delay > 0:
+		if not wait_timers:
+			return False
+		time.sleep(delay)
+	
+	if source[2](*source[3]):
+		source[0] = time.time() + source[1] / 1000.0
+	else:
+		_sources.pop(source_id, None)
+	return True
+
+class GObject(object):
+	"""
+	Signal handling base class
+	"""
+	
+	def __init__(self, *args, **kwargs):
+		self._handlers = {}
+		self._properties = {}
+	
+	def connect(self, signal, callback, *user_data):
+		self._handlers.setdefault(signal, []).append((callback, user_data))
+		return len(self._handlers[signal])
+	
+	def emit(self, signal, *args):
+		result = None
+		for callback, user_data in list(self._handlers.get(signal, [])):
+			result = callback(self, *(args + user_data))
+		return result
+	
+	def set_property(self, name, value):
+		self._properties[name] = value
+	
+	def get_property(self, name):
+		return self._properties.get(name)
\ No newline at end of file
@@ -0,0 +1,842 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Minimal stand-in for the gtk module, used to run the GUI code headless
+
+Only the parts of the API used by pyStoreMan are provided. Models behave like
+their GTK counterparts (persistent iters, signals, filtering, sorting); widgets
+accept and ignore everything that only affects rendering.
+"""
+
+import gobject
+
+STOCK_PREFERENCES = 'gtk-preferences'
+ICON_SIZE_MENU = 1
+POLICY_AUTOMATIC = 1
+POS_TOP = 2
+SORT_ASCENDING = 0
+SORT_DESCENDING = 1
+SELECTION_SINGLE = 1
+SELECTION_BROWSE = 2
+SELECTION_MULTIPLE = 3
+TREE_MODEL_ITERS_PERSIST = 1
+TREE_MODEL_LIST_ONLY = 2
+DIALOG_MODAL = 1
+DIALOG_DESTROY_WITH_PARENT = 2
+MESSAGE_ERROR = 3
+MESSAGE_QUESTION = 2
+MESSAGE_INFO = 0
+BUTTONS_OK = 1
+BUTTONS_NONE = 0
+RESPONSE_OK = -5
+RESPONSE_CANCEL = -6
+RESPONSE_NONE = -1
+STOCK_OK = 'gtk-ok'
+STOCK_CANCEL = 'gtk-cancel'
+STOCK_DELETE = 'gtk-delete'
+TARGET_SAME_WIDGET = 2
+TREE_VIEW_DROP_BEFORE = 0
+TREE_VIEW_DROP_AFTER = 1
+TREE_VIEW_DROP_INTO_OR_BEFORE = 2
+TREE_VIEW_DROP_INTO_OR_AFTER = 3
+
+class _Namespace(object):
+	def __init__(self, **attributes):
+		self.__dict__.update(attributes)
+
+gdk = _Namespace(BUTTON1_MASK = 256, ACTION_MOVE = 4)
+
+_main_level = [0]
+_quit_requested = [False]
+
+def main():
+	_main_level[0] += 1
+	_quit_requested[0] = False
+	try:
+		while not _quit_requested[0] and gobject.pending():
+			gobject.iteration(wait_timers = True)
+	finally:
+		_main_level[0] -= 1
+
+def main_quit():
+	_quit_requested[0] = True
+
+def main_level():
+	return _main_level[0]
+
+def events_pending():
+	return gobject.pending()
+
+def main_iteration(block = True):
+	return gobject.iteration(wait_timers = block)
+
+class TreeIter(object):
+	"""
+	An iter pointing at a row object; stays valid until the row is removed
+	"""
+	
+	__slots__ = ('row', 'model')
+	
+	def __init__(self, row, model):
+		self.row = row
+		self.model = model
+	
+	def __eq__(self, other):
+		return isinstance(other, TreeIter) and other.row is self.row
+	
+	def __ne__(self, other):
+		return not self.__eq__(other)
+	
+	def __hash__(self):
+		return id(self.row)
+
+class _Row(object):
+	__slots__ = ('values', 'parent', 'children', 'alive')
+	
+	def __init__(self, values, parent = None):
+		self.values = values
+		self.parent = parent
+		self.children = []
+		self.alive = True
+
+class TreeModelRow(object):
+	"""
+	The object returned by model[path] and model[iter]
+	"""
+	
+	def __init__(self, model, iter):
+		self.model = model
+		self.iter = iter
+	
+	def __getitem__(self, column):
+		if isinstance(column, slice):
+			return [self.model.get_value(self.iter, index) for index in range(self.model.get_n_columns())[column]]
+		return self.model.get_value(self.iter, column)
+	
+	def __setitem__(self, column, value):
+		self.model.set_value(self.iter, column, value)
+	
+	def __len__(self):
+		return self.model.get_n_columns()
+	
+	def __iter__(self):
+		return iter(self[:])
+	
+	@property
+	def path(self):
+		return self.model.get_path(self.iter)
+
+class TreeModel(gobject.GObject):
+	"""
+	Shared behaviour of the model classes
+	"""
+	
+	def _to_iter(self, key):
+		if isinstance(key, TreeIter):
+			return key
+		if isinstance(key, (int, long)):
+			key = (key, )
+		return self.get_iter(key)
+	
+	def __getitem__(self, key):
+		return TreeModelRow(self, self._to_iter(key))
+	
+	def __setitem__(self, key, values):
+		tree_iter = self._to_iter(key)
+		for column, value in enumerate(values):
+			self.set_value(tree_iter, column, value)
+	
+	def __iter__(self):
+		tree_iter = self.get_iter_first()
+		while tree_iter is not None:
+			yield TreeModelRow(self, tree_iter)
+			tree_iter = self.iter_next(tree_iter)
+	
+	def __len__(self):
+		return self.iter_n_children(None)
+	
+	def __contains__(self, key):
+		try:
+			return self._to_iter(key) is not None
+		except ValueError:
+			return False
+	
+	def get(self, tree_iter, *columns):
+		return tuple(self.get_value(tree_iter, column) for column in columns)
+	
+	def filter_new(self, root = None):
+		return TreeModelFilter(self)
+	
+	def foreach(self, func, *user_data):
+		for row in self:
+			if func(self, row.path, row.iter, *user_data):
+				break
+	
+	def row_changed(self, path, tree_iter):
+		self.emit('row-changed', path, tree_iter)
+	
+	def row_inserted(self, path, tree_iter):
+		self.emit('row-inserted', path, tree_iter)
+	
+	def row_deleted(self, path):
+		self.emit('row-deleted', path)
+	
+	def rows_reordered(self, path, iter, new_order):
+		self.emit('rows-reordered', path, iter, new_order)
+
+class _StoreModel(TreeModel):
+	"""
+	ListStore and TreeStore implementation on top of row objects
+	"""
+	
+	def __init__(self, *column_types):
+		gobject.GObject.__init__(self)
+		self._types = column_types
+		self._root = _Row(None)
+		self._sort_column_id = None
+		self._sort_order = SORT_ASCENDING
+		self._sort_funcs = {}
+		self._positions = {} # id(parent row) -> {id(row): position among its siblings}
+	
+	def _convert(self, column, value):
+		column_type = self._types[column]
+		if value is None:
+			return None
+		if column_type is str and isinstance(value, unicode):
+			return value.encode('utf-8')
+		if column_type in (int, long, float) and not isinstance(value, column_type):
+			return column_type(value)
+		return value
+	
+	def _make_row(self, values, parent):
+		if values is None:
+			values = [None] * len(self._types)
+		values = [self._convert(column, value) for column, value in enumerate(values)]
+		if len(values) != len(self._types):
+			raise ValueError("row has wrong number of columns")
+		return _Row(values, parent)
+	
+	def _parent_row(self, parent):
+		return self._root if parent is None else parent.row
+	
+	def get_n_columns(self):
+		return len(self._types)
+	
+	def get_column_type(self, column):
+		return self._types[column]
+	
+	def get_flags(self):
+		return TREE_MODEL_ITERS_PERSIST
+	
+	def get_iter(self, path):
+		if isinstance(path, (int, long)):
+			path = (path, )
+		if isinstance(path, basestring):
+			path = tuple(int(index) for index in path.split(':'))
+		row = self._root
+		try:
+			for index in path:
+				if index < 0:
+					raise IndexError
+				row = row.children[index]
+		except IndexError:
+			raise ValueError("invalid tree path")
+		return TreeIter(row, self)
+	
+	def get_iter_first(self):
+		if not self._root.children:
+			return None
+		return TreeIter(self._root.children[0], self)
+	
+	def get_path(self, tree_iter):
+		path = []
+		row = tree_iter.row
+		while row.parent is not None:
+			path.insert(0, self._position(row))
+			row = row.parent
+		return tuple(path)
+	
+	def _position(self, row):
+		# Position of a row among its siblings, cached until rows are inserted in the middle, removed or sorted
+		positions = self._positions.get(id(row.parent))
+		if positions is None:
+			positions = dict((id(child), index) for index, child in enumerate(row.parent.children))
+			self._positions[id(row.parent)] = positions
+		return positions[id(row)]
+	
+	def get_value(self, tree_iter, column):
+		return tree_iter.row.values[column]
+	
+	def set_value(self, tree_iter, column, value):
+		tree_iter.row.values[column] = self._convert(column, value)
+		self.emit('row-changed', self.get_path(tree_iter), tree_iter)
+	
+	def set(self, tree_iter, *args):
+		for index in range(0, len(args), 2):
+			tree_iter.row.values[args[index]] = self._convert(args[index], args[index + 1])
+		self.emit('row-changed', self.get_path(tree_iter), tree_iter)
+	
+	def iter_next(self, tree_iter):
+		siblings = tree_iter.row.parent.children
+		index = self._position(tree_iter.row) + 1
+		if index >= len(siblings):
+			return None
+		return TreeIter(siblings[index], self)
+	
+	def iter_children(self, parent):
+		row = self._parent_row(parent)
+		return TreeIter(row.children[0], self) if row.children else None
+	
+	def foreach(self, func, *user_data):
+		# Depth-first, like GTK
+		def _walk(parent):
+			tree_iter = self.iter_children(parent)
+			while tree_iter is not None:
+				if func(self, self.get_path(tree_iter), tree_iter, *user_data) or _walk(tree_iter):
+					return True
+				tree_iter = self.iter_next(tree_iter)
+			return False
+		
+		_walk(None)
+	
+	def iter_has_child(self, tree_iter):
+		return bool(tree_iter.row.children)
+	
+	def iter_n_children(self, tree_iter):
+		return len(self._parent_row(tree_iter).children)
+	
+	def iter_nth_child(self, parent, n):
+		children = self._parent_row(parent).children
+		return TreeIter(children[n], self) if 0 <= n < len(children) else None
+	
+	def iter_parent(self, tree_iter):
+		parent = tree_iter.row.parent
+		return None if parent is self._root else TreeIter(parent, self)
+	
+	def iter_is_valid(self, tree_iter):
+		return tree_iter.row.alive
+	
+	def _insert_row(self, parent, position, values):
+		parent_row = self._parent_row(parent)
+		row = self._make_row(values, parent_row)
+		if position is None or position < 0 or position > len(parent_row.children):
+			position = len(parent_row.children)
+		positions = self._positions.get(id(parent_row))
+		if positions is not None and position == len(parent_row.children):
+			positions[id(row)] = position
+		else:
+			self._positions.pop(id(parent_row), None)
+		parent_row.children.insert(position, row)
+		tree_iter = TreeIter(row, self)
+		self.emit('row-inserted', self.get_path(tree_iter), tree_iter)
+		return tree_iter
+	
+	def remove(self, tree_iter):
+		path = self.get_path(tree_iter)
+		row = tree_iter.row
+		
+		def _kill(row):
+			row.alive = False
+			for child in row.children:
+				_kill(child)
+		
+		_kill(row)
+		positions = self._positions.get(id(row.parent))
+		if positions is not None and path[-1] == len(row.parent.children) - 1:
+			del positions[id(row)]
+		else:
+			self._positions.pop(id(row.parent), None)
+		row.parent.children.pop(path[-1])
+		self.emit('row-deleted', path)
+		return False
+	
+	def __delitem__(self, key):
+		self.remove(self._to_iter(key))
+	
+	def clear(self):
+		while self._root.children:
+			self.remove(TreeIter(self._root.children[-1], self))
+	
+	def set_sort_column_id(self, column, order):
+		self._sort_column_id = column
+		self._sort_order = order
+		self._sort()
+	
+	def get_sort_column_id(self):
+		return (self._sort_column_id, self._sort_order)
+	
+	def set_sort_func(self, column, func, user_data = None):
+		self._sort_funcs[column] = (func, user_data)
+	
+	def set_default_sort_func(self, func, user_data = None):
+		self._sort_funcs[None] = (func, user_data)
+	
+	def _sort(self):
+		column = self._sort_column_id
+		if column is None:
+			return
+		if column in self._sort_funcs:
+			func, user_data = self._sort_funcs[column]
+			compare = lambda a, b: func(self, TreeIter(a, self), TreeIter(b, self), user_data)
+		else:
+			compare = lambda a, b: cmp(a.values[column], b.values[column])
+		
+		def _sort_children(row):
+			row.children.sort(cmp = compare, reverse = self._sort_order == SORT_DESCENDING)
+			for child in row.children:
+				_sort_children(child)
+		
+		self._positions.clear()
+		_sort_children(self._root)
+		self.emit('rows-reordered', (), None, None)
+
+class ListStore(_StoreModel):
+	def append(self, row = None):
+		return self._insert_row(None, None, row)
+	
+	def prepend(self, row = None):
+		return self._insert_row(None, 0, row)
+	
+	def insert(self, position, row = None):
+		return self._insert_row(None, position, row)
+
+class TreeStore(_StoreModel):
+	def append(self, parent, row = None):
+		return self._insert_row(parent, None, row)
+	
+	def prepend(self, parent, row = None):
+		return self._insert_row(parent, 0, row)
+	
+	def insert(self, parent, position, row = None):
+		return self._insert_row(parent, position, row)
+	
+	def is_ancestor(self, tree_iter, descendant):
+		row = descendant.row.parent
+		while row is not None:
+			if row is tree_iter.row:
+				return True
+			row = row.parent
+		return False
+	
+	def iter_depth(self, tree_iter):
+		return len(self.get_path(tree_iter)) - 1
+
+class TreeModelFilter(TreeModel):
+	"""
+	A filtered view of a flat child model
+	"""
+	
+	def __init__(self, child_model):
+		gobject.GObject.__init__(self)
+		self._child = child_model
+		self._visible_func = None
+		self._visible_data = None
+		self._visible = None
+		self._positions = None
+		self._handler_ids = [
+			child_model.connect('row-inserted', self._child_row_inserted),
+			child_model.connect('row-changed', self._child_row_changed),
+			child_model.connect('row-deleted', self._child_row_deleted),
+			child_model.connect('rows-reordered', self._child_rows_reordered),
+		]
+	
+	def __del__(self):
+		pass
+	
+	def get_model(self):
+		return self._child
+	
+	def set_visible_func(self, func, data = None):
+		self._visible_func = func
+		self._visible_data = data
+	
+	def _is_visible(self, child_iter):
+		if self._visible_func is None:
+			return True
+		return bool(self._visible_func(self._child, child_iter, self._visible_data))
+	
+	def _rows(self):
+		if self._visible is None:
+			self._visible = [row.iter.row for row in self._child if self._is_visible(row.iter)]
+			self._positions = None
+		return self._visible
+	
+	def _index(self):
+		# Visible row -> its position, so paths don't need a scan of the list every time
+		if self._positions is None:
+			self._positions = dict((id(visible), index) for index, visible in enumerate(self._rows()))
+		return self._positions
+	
+	def _position(self, row):
+		return self._index()[id(row)]
+	
+	def refilter(self):
+		self._visible = None
+		self._rows()
+	
+	# Like the real TreeModelFilter, only the changed row is checked again
+	
+	def _child_row_inserted(self, model, path, child_iter):
+		if self._visible is not None and self._is_visible(child_iter):
+			self._visible = None
+	
+	def _child_row_changed(self, model, path, child_iter):
+		if self._visible is not None and (id(child_iter.row) in self._index()) != self._is_visible(child_iter):
+			self._visible = None
+	
+	def _child_row_deleted(self, model, path):
+		if self._visible is not None:
+			self._visible = [row for row in self._visible if row.alive]
+			self._positions = None
+	
+	def _child_rows_reordered(self, *args):
+		self._visible = None
+	
+	def get_n_columns(self):
+		return self._child.get_n_columns()
+	
+	def get_iter(self, path):
+		if isinstance(path, (int, long)):
+			path = (path, )
+		try:
+			return TreeIter(self._rows()[path[0]], self)
+		except IndexError:
+			raise ValueError("invalid tree path")
+	
+	def get_iter_first(self):
+		rows = self._rows()
+		return TreeIter(rows[0], self) if rows else None
+	
+	def get_path(self, tree_iter):
+		return (self._position(tree_iter.row), )
+	
+	def iter_next(self, tree_iter):
+		rows = self._rows()
+		index = self._position(tree_iter.row) + 1
+		return TreeIter(rows[index], self) if index < len(rows) else None
+	
+	def iter_n_children(self, tree_iter):
+		return len(self._rows()) if tree_iter is None else 0
+	
+	def get_value(self, tree_iter, column):
+		return tree_iter.row.values[column]
+	
+	def set_value(self, tree_iter, column, value):
+		self._child.set_value(TreeIter(tree_iter.row, self._child), column, value)
+	
+	def convert_iter_to_child_iter(self, tree_iter):
+		return TreeIter(tree_iter.row, self._child)
+	
+	def convert_path_to_child_path(self, path):
+		return self._child.get_path(self.convert_iter_to_child_iter(self.get_iter(path)))
+
+class GenericTreeModel(TreeModel):
+	"""
+	Python implemented models, mapping the TreeModel API onto on_* methods
+	"""
+	
+	def __init__(self):
+		gobject.GObject.__init__(self)
+	
+	def _wrap(self, rowref):
+		return None if rowref is None else TreeIter(rowref, self)
+	
+	def get_user_data(self, tree_iter):
+		return tree_iter.row
+	
+	def create_tree_iter(self, rowref):
+		return self._wrap(rowref)
+	
+	def get_flags(self):
+		return self.on_get_flags()
+	
+	def get_n_columns(self):
+		return self.on_get_n_columns()
+	
+	def get_column_type(self, column):
+		return self.on_get_column_type(column)
+	
+	def get_iter(self, path):
+		if isinstance(path, (int, long)):
+			path = (path, )
+		rowref = self.on_get_iter(path)
+		if rowref is None:
+			raise ValueError("invalid tree path")
+		return self._wrap(rowref)
+	
+	def get_iter_first(self):
+		return self._wrap(self.on_get_iter((0, )))
+	
+	def get_path(self, tree_iter):
+		return self.on_get_path(tree_iter.row)
+	
+	def get_value(self, tree_iter, column):
+		return self.on_get_value(tree_iter.row, column)
+	
+	def set_value(self, tree_iter, column, value):
+		raise TypeError("GenericTreeModel rows are read-only")
+	
+	def iter_next(self, tree_iter):
+		return self._wrap(self.on_iter_next(tree_iter.row))
+	
+	def iter_n_children(self, tree_iter):
+		return self.on_iter_n_children(None if tree_iter is None else tree_iter.row)
+	
+	def iter_nth_child(self, parent, n):
+		return self._wrap(self.on_iter_nth_child(None if parent is None else parent.row, n))
+	
+	def invalidate_iters(self):
+		pass
+
+class TreeRowReference(object):
+	def __init__(self, model, path):
+		self._model = model
+		self._iter = model.get_iter(path)
+	
+	def valid(self):
+		return self._model.iter_is_valid(self._iter)
+	
+	def get_path(self):
+		return self._model.get_path(self._iter) if self.valid() else None
+	
+	def get_model(self):
+		return self._model
+
+class Widget(gobject.GObject):
+	"""
+	A widget that accepts and ignores everything that only affects rendering
+	"""
+	
+	def __init__(self, *args, **kwargs):
+		gobject.GObject.__init__(self)
+		self._children = []
+		self._label = kwargs.get('label', args[0] if args and isinstance(args[0], basestring) else None)
+		self._text = ""
+		self._sensitive = True
+		self._visible = False
+	
+	def __getattr__(self, name):
+		if name.startswith('__'):
+			raise AttributeError(name)
+		return lambda *args, **kwargs: None
+	
+	def add(self, child):
+		self._children.append(child)
+	
+	def pack_start(self, child, *args, **kwargs):
+		self._children.append(child)
+	
+	def pack_end(self, child, *args, **kwargs):
+		self._children.append(child)
+	
+	def set_label(self, label):
+		self._label = label
+	
+	def get_label(self):
+		return self._label
+	
+	def set_text(self, text):
+		self._text = text
+		self.emit('changed')
+	
+	def get_text(self):
+		return self._text
+	
+	def set_sensitive(self, sensitive):
+		self._sensitive = sensitive
+	
+	def get_sensitive(self):
+		return self._sensitive
+	
+	def show_all(self):
+		self._visible = True
+	
+	def show(self):
+		self._visible = True
+	
+	def hide(self):
+		self._visible = False
+	
+	def destroy(self):
+		self.emit('destroy')
+	
+	def render_icon(self, *args):
+		return None
+	
+	def clicked(self):
+		self.emit('clicked')
+
+class Window(Widget): pass
+class ScrolledWindow(Widget): pass
+class HBox(Widget): pass
+class VBox(Widget): pass
+class Frame(Widget): pass
+class Label(Widget): pass
+class Button(Widget): pass
+class Notebook(Widget): pass
+class Statusbar(Widget): pass
+
+class Entry(Widget):
+	pass
+
+class RadioButton(Widget):
+	def __init__(self, group = None, label = None):
+		Widget.__init__(self, label = label)
+		self._group = group._group if group is not None else []
+		self._group.append(self)
+		self._active = group is None
+	
+	def set_active(self, active):
+		if active:
+			for button in self._group:
+				button._active = False
+		self._active = active
+	
+	def get_active(self):
+		return self._active
+
+class ProgressBar(Widget):
+	def set_fraction(self, fraction):
+		self._fraction = fraction
+	
+	def get_fraction(self):
+		return getattr(self, '_fraction', 0.0)
+
+class SpinButton(Widget):
+	def __init__(self, adjustment = None, climb_rate = 0.0, digits = 0):
+		Widget.__init__(self)
+		self._value = adjustment.value if adjustment is not None else 0
+	
+	def get_value(self):
+		return self._value
+	
+	def get_value_as_int(self):
+		return int(self._value)
+	
+	def set_value(self, value):
+		self._value = value
+
+class Adjustment(object):
+	def __init__(self, value = 0, lower = 0, upper = 0, step_incr = 0, page_incr = 0, page_size = 0):
+		self.value = value
+
+class ComboBox(Widget):
+	def __init__(self, model = None):
+		Widget.__init__(self)
+		self._model = model
+		self._active = -1
+	
+	def set_model(self, model):
+		self._model = model
+	
+	def get_model(self):
+		return self._model
+	
+	def set_active(self, index):
+		self._active = index
+	
+	def get_active(self):
+		return self._active
+	
+	def get_active_iter(self):
+		if self._model is None or self._active < 0:
+			return None
+		return self._model.get_iter((self._active, ))
+
+class CellRenderer(Widget): pass
+class CellRendererText(CellRenderer): pass
+class CellRendererCombo(CellRendererText): pass
+
+class TreeViewColumn(Widget):
+	def __init__(self, title = None, *args, **kwargs):
+		Widget.__init__(self)
+		self._title = title
+		self._sort_column_id = -1
+		self._tree_view = None
+	
+	def set_sort_column_id(self, column):
+		self._sort_column_id = column
+	
+	def get_sort_column_id(self):
+		return self._sort_column_id
+	
+	def get_tree_view(self):
+		return self._tree_view
+
+class TreeSelection(gobject.GObject):
+	def __init__(self, tree_view):
+		gobject.GObject.__init__(self)
+		self._tree_view = tree_view
+		self._paths = []
+		self._mode = SELECTION_SINGLE
+	
+	def set_mode(self, mode):
+		self._mode = mode
+	
+	def get_mode(self):
+		return self._mode
+	
+	def get_tree_view(self):
+		return self._tree_view
+	
+	def select_path(self, path):
+		if isinstance(path, (int, long)):
+			path = (path, )
+		if self._mode != SELECTION_MULTIPLE:
+			self._paths = []
+		if path not in self._paths:
+			self._paths.append(path)
+		self.emit('changed')
+	
+	def unselect_all(self):
+		self._paths = []
+		self.emit('changed')
+	
+	def get_selected_rows(self):
+		return (self._tree_view.get_model(), list(self._paths))
+	
+	def get_selected(self):
+		model = self._tree_view.get_model()
+		return (model, model.get_iter(self._paths[0]) if self._paths else None)
+	
+	def count_selected_rows(self):
+		return len(self._paths)
+
+class TreeView(Widget):
+	def __init__(self, model = None):
+		Widget.__init__(self)
+		self._model = model
+		self._columns = []
+		self._selection = TreeSelection(self)
+	
+	def set_model(self, model = None):
+		self._model = model
+		self._selection._paths = []
+	
+	def get_model(self):
+		return self._model
+	
+	def get_selection(self):
+		return self._selection
+	
+	def append_column(self, column):
+		column._tree_view = self
+		self._columns.append(column)
+		return len(self._columns)
+	
+	def get_columns(self):
+		return list(self._columns)
+
+class Dialog(Widget):
+	def __init__(self, *args, **kwargs):
+		Widget.__init__(self, *args, **kwargs)
+		self.vbox = VBox()
+		self.response_value = RESPONSE_CANCEL
+	
+	def run(self):
+		return self.response_value
+
+class MessageDialog(Dialog):
+	pass
\ No newline at end of file